@@ -0,0 +1,112 @@
+"""
+Measures the cold start of each route: in a fresh interpreter per route, the
+time to import the Flask app and the time of the route's first request, and
+which of the heavy dependencies the route imported. Network access is
+blocked, so routes that call out fail fast; their timings cover the imports
+and client setup, not the integrations.
+
+    python benchmarks/cold_start.py [--max-import-ms 400]
+
+With --max-import-ms, exits non-zero if importing the app takes longer, or if
+it imports any of the heavy dependencies, so regressions get caught.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ["FuelSDK", "suds", "simple_salesforce", "boto3", "jwt"]
+
+ROUTES = [
+    ("GET", "/", None),
+    ("GET", "/lists", None),
+    ("POST", "/subscribe", {"email": "test@example.com", "list": "Radiolab"}),
+    (
+        "POST",
+        "/supporting-cast",
+        {"subscription": {"status": "active", "plan_id": 1, "member_id": 2}},
+    ),
+    (
+        "POST",
+        "/optinmonster",
+        {"lead": {"email": "test@example.com"}, "lead_options": {"list": "Radiolab"}},
+    ),
+]
+
+# Runs in the fresh interpreter
+MEASURE = """
+import json, socket, sys, time
+
+def no_network(*args, **kwargs):
+    raise OSError("network access is blocked by the benchmark")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+
+method, path, body, heavy = json.loads(sys.argv[1])
+
+started = time.perf_counter()
+from marketing_cloud_proxy import app
+imported = time.perf_counter()
+app_imports = [m for m in heavy if m in sys.modules]
+
+app.app.testing = False
+with app.app.test_client() as client:
+    response = client.open(
+        f"/{app.path_prefix}{path}", method=method, json=body
+    )
+finished = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "request_ms": (finished - imported) * 1000,
+    "status": response.status_code,
+    "app_imports": app_imports,
+    "route_imports": [m for m in heavy if m in sys.modules and m not in app_imports],
+}))
+"""
+
+
+def measure(method, path, body):
+    env = {
+        **os.environ,
+        "APP_NAME": os.environ.get("APP_NAME") or "marketing-cloud-proxy",
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION") or "us-east-1",
+        "SENTRY_DSN": "",
+        "OUTBOUND_MAX_RETRIES": "0",
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE, json.dumps([method, path, body, HEAVY_MODULES])],
+        capture_output=True,
+        check=True,
+        env=env,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-import-ms", type=float)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'route':<24}{'import ms':>10}{'request ms':>12}  imports")
+    for method, path, body in ROUTES:
+        result = measure(method, path, body)
+        print(
+            f"{method + ' ' + path:<24}{result['import_ms']:>10.0f}"
+            f"{result['request_ms']:>12.0f}  {', '.join(result['route_imports'])}"
+        )
+        if args.max_import_ms is not None and (
+            result["import_ms"] > args.max_import_ms or result["app_imports"]
+        ):
+            print(f"  app import regressed: {result}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
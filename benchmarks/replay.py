@@ -0,0 +1,209 @@
+"""
+Replays captured traffic (see marketing_cloud_proxy.capture) at its original
+rate, or scaled, against a deployment or against the app with the local
+stand-ins, and compares the replay's latencies with the captured ones.
+
+    python benchmarks/replay.py CAPTURE... [--speed 1] [--concurrency 64]
+        [--target https://host/marketing-cloud-proxy]
+        [--mode flask] [--latency salesforce=120] [--errors everest=0.02]
+
+Capture files are streamed, merged in timestamp order, so the rotated files
+of several processes can be replayed together (e.g. captures/traffic-*). Each
+request is sent when it was captured, relative to the first one: --speed 2
+replays a spike twice as fast, --speed 0 sends requests as fast as
+--concurrency allows. A request that can't be sent on time (every thread is
+busy) is sent late, and the worst lag is reported.
+
+With --target, requests are sent over HTTP to that deployment. Captured
+emails are pseudonyms at example.com, but signups to a real deployment still
+create Salesforce records, so point it at a sandbox. Without --target, they
+are sent to the app in this process with its services replaced by the
+stand-ins, as in run.py.
+"""
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import (  # noqa
+    add_stand_in_arguments,
+    bench_environment,
+    flask_caller,
+    lambda_caller,
+    mount_stand_ins,
+    percentile,
+    queue_directory,
+    stand_in_profiles,
+)
+from benchmarks.standins import StandIns  # noqa
+
+
+def read_capture(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def stream(paths):
+    """Every captured request in the files, oldest first"""
+    return heapq.merge(
+        *(read_capture(path) for path in paths), key=lambda request: request["ts"]
+    )
+
+
+def http_caller(target, concurrency):
+    session = requests.Session()
+    session.mount(
+        target, requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    )
+
+    def call(request):
+        response = session.request(
+            request["method"],
+            target.rstrip("/") + request["path"],
+            params=request.get("args"),
+            json=request.get("json"),
+            data=request.get("form"),
+            timeout=30,
+        )
+        return response.status_code
+
+    return call
+
+
+def replay(call, captured, speed, concurrency):
+    """Sends the captured requests on their original schedule, divided by
+    `speed`. Returns each request's path, status, latency, captured latency
+    and lag (ms), and the wall time."""
+    results = []
+    lock = threading.Lock()
+
+    def timed(request, due):
+        started = time.perf_counter()
+        try:
+            status = call(request)
+        except Exception as e:
+            print(f"{request['path']} raised {e!r}", file=sys.__stderr__)
+            status = None
+        result = (
+            request["path"],
+            status,
+            (time.perf_counter() - started) * 1000,
+            request.get("duration_ms"),
+            max(0, started - due) * 1000,
+        )
+        with lock:
+            results.append(result)
+
+    started = time.perf_counter()
+    first_ts = None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for request in captured:
+            if first_ts is None:
+                first_ts = request["ts"]
+            due = started
+            if speed:
+                due += (request["ts"] - first_ts) / speed
+                time.sleep(max(0, due - time.perf_counter()))
+            pool.submit(timed, request, due)
+    return results, time.perf_counter() - started
+
+
+def summarize(results, wall_time):
+    report = {}
+    for path in dict.fromkeys(path for path, *_ in results):
+        rows = [row for row in results if row[0] == path]
+        latencies = sorted(ms for _, _, ms, _, _ in rows)
+        captured = sorted(ms for _, _, _, ms, _ in rows if ms is not None)
+        statuses = {}
+        for _, status, _, _, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[path] = {
+            "requests": len(rows),
+            "statuses": statuses,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "captured_p50_ms": percentile(captured, 50),
+            "captured_p95_ms": percentile(captured, 95),
+        }
+    return {
+        "requests": len(results),
+        "wall_time_s": round(wall_time, 1),
+        "max_lag_ms": round(max((row[4] for row in results), default=0), 1),
+        "endpoints": report,
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['requests']} requests in {report['wall_time_s']}s, "
+        f"sent at most {report['max_lag_ms']}ms late"
+    )
+    print(
+        f"{'endpoint':<18}{'reqs':>6}{'p50':>8}{'p95':>8}{'p99':>8}"
+        f"{'was p50':>9}{'was p95':>9}  statuses"
+    )
+    for path, row in report["endpoints"].items():
+        statuses = " ".join(f"{k}:{v}" for k, v in sorted(row["statuses"].items()))
+        print(
+            f"{path:<18}{row['requests']:>6}{row['p50_ms']:>8}{row['p95_ms']:>8}"
+            f"{row['p99_ms']:>8}{str(row['captured_p50_ms']):>9}"
+            f"{str(row['captured_p95_ms']):>9}  {statuses}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="capture files (NDJSON)")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="multiple of the captured rate; 0 sends requests as fast as possible",
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument(
+        "--target", help="base URL of a deployment, including the app's prefix"
+    )
+    add_stand_in_arguments(parser)
+    parser.add_argument("--json", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    captured = stream(args.captures)
+    if args.target:
+        call = http_caller(args.target, args.concurrency)
+        results, wall_time = replay(call, captured, args.speed, args.concurrency)
+    else:
+        with contextlib.ExitStack() as stack:
+            directory = stack.enter_context(queue_directory())
+            os.environ.update(bench_environment(directory))
+            stand_ins = stack.enter_context(StandIns(stand_in_profiles(args)))
+            mount_stand_ins(stand_ins)
+            call = lambda_caller() if args.mode == "lambda" else flask_caller()
+            if not args.verbose:
+                # The app's own logging is left out of the report
+                stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+                stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+            results, wall_time = replay(call, captured, args.speed, args.concurrency)
+
+    report = summarize(results, wall_time)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Replays signup traffic against the app, with every service it calls replaced
+by a local stand-in (see standins.py), and reports throughput, latency
+percentiles and outbound calls per endpoint.
+
+    python benchmarks/run.py [--requests 500] [--concurrency 8] [--mode flask]
+        [--latency salesforce=120] [--errors everest=0.02] [--traffic FILE]
+
+--mode flask calls the Flask app through its test client; --mode lambda calls
+the Lambda `handler`, which goes through serverless_wsgi. Traffic is generated
+(a fixed mix of /subscribe, /lists, /optinmonster and /supporting-cast
+requests) unless --traffic gives a JSONL file of {"method", "path", "args",
+"json", "form"} requests, such as a traffic capture (see
+marketing_cloud_proxy.capture); --save-traffic writes the generated traffic to
+one. Endpoints are replayed one after another, so outbound calls are counted
+per endpoint. To replay a capture at its original rate, use replay.py.
+
+Marketing Cloud has no stand-in (FuelSDK needs its WSDL and SOAP API), so
+Supporting Cast webhooks are benchmarked in SUPPORTING_CAST_MODE=async, up to
+the queue.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standins import ServiceProfile, StandIns, SUBSCRIPTION_LISTS  # noqa
+
+PREFIX = "/marketing-cloud-proxy"
+INTEGRATIONS = ("everest", "mailchimp", "salesforce", "supporting_cast")
+
+# Default medians (ms), roughly what production sees
+DEFAULT_LATENCY_MS = {
+    "salesforce": 120,
+    "everest": 250,
+    "mailchimp": 150,
+    "supporting_cast": 100,
+}
+
+
+def queue_directory():
+    """A scratch directory for the app's queues, outside the temp directory
+    (where the app refuses to keep the queues it accepts requests onto)"""
+    return tempfile.TemporaryDirectory(
+        prefix=".queues-", dir=os.path.dirname(os.path.abspath(__file__))
+    )
+
+
+def bench_environment(directory):
+    """Settings that point the app at the stand-ins; set before it's imported"""
+    return {
+        "APP_NAME": PREFIX.strip("/"),
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "SF_USERNAME": "bench@example.com",
+        "SF_PASS": "bench",
+        "SF_SECURITY_TOKEN": "",
+        "SF_DOMAIN": "login",
+        "EVEREST_API_ENDPOINT": "https://everest.bench/api/2.0/validation/address",
+        "EVEREST_API_KEY": "bench",
+        "NYPR_API_ENDPOINT": "https://nypr.bench",
+        "SUPPORTING_CAST_MODE": "async",
+        "SUPPORTING_CAST_QUEUE_URL": f"sqlite:///{directory}/supporting-cast.db",
+        "SENTRY_DSN": "",
+        # Keeps the per-request metric log lines out of the report
+        "STAGE_METRICS_SAMPLE_RATE": "0",
+    }
+
+
+def generate_traffic(count, seed=0):
+    rng = random.Random(seed)
+    traffic = []
+    for i in range(count):
+        kind = rng.choices(
+            ["subscribe", "lists", "optinmonster", "supporting-cast"],
+            weights=[70, 10, 10, 10],
+        )[0]
+        email = f"bench-{seed}-{i}@example.com"
+        if rng.random() < 0.05:
+            email = f"bench-{seed}-{i}-invalid@example.com"
+        lists = rng.sample(SUBSCRIPTION_LISTS, rng.randint(1, 3))
+
+        if kind == "subscribe":
+            if rng.random() < 0.05:
+                # A Mailchimp list that hasn't been migrated is proxied
+                lists = ["abcdef0123"]
+            body = {"email": email, "list": "++".join(lists), "source": "benchmark"}
+            traffic.append({"method": "POST", "path": "/subscribe", "json": body})
+        elif kind == "lists":
+            traffic.append({"method": "GET", "path": "/lists"})
+        elif kind == "optinmonster":
+            body = {
+                "lead": {"email": email, "firstName": "Bench", "lastName": "Mark"},
+                "lead_options": {"list": "++".join(lists)},
+                "campaign": {"title": "Benchmark"},
+            }
+            traffic.append({"method": "POST", "path": "/optinmonster", "json": body})
+        else:
+            body = {
+                "subscription": {
+                    "status": "active",
+                    "member_id": rng.randint(1, 100000),
+                    "plan_id": rng.randint(1, 5),
+                }
+            }
+            traffic.append(
+                {"method": "POST", "path": "/supporting-cast", "json": body}
+            )
+    return traffic
+
+
+def flask_caller():
+    from marketing_cloud_proxy import app
+
+    def call(request):
+        response = app.app.test_client().open(
+            PREFIX + request["path"],
+            method=request["method"],
+            query_string=request.get("args"),
+            json=request.get("json"),
+            data=request.get("form"),
+        )
+        return response.status_code
+
+    return call
+
+
+def lambda_caller():
+    from marketing_cloud_proxy import handler
+
+    class Context:
+        aws_request_id = "benchmark"
+
+        @staticmethod
+        def get_remaining_time_in_millis():
+            return 30000
+
+    def call(request):
+        body, content_type = None, "application/json"
+        if request.get("json") is not None:
+            body = json.dumps(request["json"])
+        elif request.get("form"):
+            body = urlencode(request["form"])
+            content_type = "application/x-www-form-urlencoded"
+        response = handler(
+            {
+                "httpMethod": request["method"],
+                "path": PREFIX + request["path"],
+                "headers": {"Content-Type": content_type, "Host": "bench"},
+                "queryStringParameters": request.get("args") or None,
+                "body": body,
+                "isBase64Encoded": False,
+                "requestContext": {},
+            },
+            Context(),
+        )
+        return response["statusCode"]
+
+    return call
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))
+    return sorted_values[index]
+
+
+def replay(call, requests, concurrency, verbose=False):
+    """Sends the requests with `concurrency` threads. Returns each request's
+    (status, milliseconds) and the wall time."""
+
+    def timed(request):
+        started = time.perf_counter()
+        try:
+            status = call(request)
+        except Exception as e:
+            print(f"{request['path']} raised {e!r}", file=sys.__stderr__)
+            status = None
+        return status, (time.perf_counter() - started) * 1000
+
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            # The app's own logging is left out of the report
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, requests))
+        return results, time.perf_counter() - started
+
+
+def mount_stand_ins(stand_ins):
+    """Sends the app's outbound requests to the stand-ins, keeping each
+    session's retries and pool size"""
+    from marketing_cloud_proxy import outbound, settings
+
+    for integration in INTEGRATIONS:
+        session = outbound.session(integration)
+        session.mount(
+            "https://",
+            stand_ins.adapter(
+                max_retries=session.get_adapter("https://").max_retries,
+                pool_maxsize=settings.OUTBOUND_POOL_SIZE,
+            ),
+        )
+
+
+def run(traffic, mode, concurrency, stand_ins, verbose=False):
+    mount_stand_ins(stand_ins)
+    call = lambda_caller() if mode == "lambda" else flask_caller()
+    report = {}
+    for path in dict.fromkeys(request["path"] for request in traffic):
+        requests = [request for request in traffic if request["path"] == path]
+        stand_ins.reset_counts()
+        results, wall_time = replay(call, requests, concurrency, verbose)
+        calls, injected_errors = stand_ins.counts()
+
+        latencies = sorted(ms for _, ms in results)
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[path] = {
+            "requests": len(results),
+            "statuses": statuses,
+            "throughput": round(len(results) / wall_time, 1),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "outbound_calls": calls,
+            "injected_errors": injected_errors,
+        }
+    return report
+
+
+def print_report(report):
+    print(
+        f"{'endpoint':<18}{'reqs':>6}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+        "  statuses / outbound calls"
+    )
+    for path, row in report.items():
+        statuses = " ".join(f"{k}:{v}" for k, v in sorted(row["statuses"].items()))
+        calls = " ".join(f"{k}:{v}" for k, v in sorted(row["outbound_calls"].items()))
+        print(
+            f"{path:<18}{row['requests']:>6}{row['throughput']:>8}"
+            f"{row['p50_ms']:>8}{row['p95_ms']:>8}{row['p99_ms']:>8}"
+            f"  {statuses} / {calls or '-'}"
+        )
+
+
+def service_values(values, cast):
+    parsed = {}
+    for value in values:
+        service, _, number = value.partition("=")
+        if service not in INTEGRATIONS:
+            raise argparse.ArgumentTypeError(f"unknown service {service!r}")
+        parsed[service] = cast(number)
+    return parsed
+
+
+def add_stand_in_arguments(parser):
+    parser.add_argument(
+        "--mode",
+        choices=["flask", "lambda"],
+        default="flask",
+        help="call the Flask app directly, or through the Lambda handler",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="SERVICE=MS",
+        help="median latency of a service (salesforce, everest, mailchimp, "
+        "supporting_cast)",
+    )
+    parser.add_argument(
+        "--errors",
+        action="append",
+        default=[],
+        metavar="SERVICE=RATE",
+        help="fraction of a service's calls answered with a 503",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the app's logging"
+    )
+
+
+def stand_in_profiles(args):
+    latency = {**DEFAULT_LATENCY_MS, **service_values(args.latency, float)}
+    error_rates = service_values(args.errors, float)
+    return {
+        service: ServiceProfile(
+            latency.get(service, 0), error_rate=error_rates.get(service, 0)
+        )
+        for service in INTEGRATIONS
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    add_stand_in_arguments(parser)
+    parser.add_argument("--traffic", help="JSONL file of requests to replay")
+    parser.add_argument("--save-traffic", help="write the generated traffic here")
+    parser.add_argument("--json", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    if args.traffic:
+        with open(args.traffic) as f:
+            traffic = [json.loads(line) for line in f if line.strip()]
+    else:
+        traffic = generate_traffic(args.requests, args.seed)
+    if args.save_traffic:
+        with open(args.save_traffic, "w") as f:
+            f.writelines(json.dumps(request) + "\n" for request in traffic)
+
+    random.seed(args.seed)
+    with queue_directory() as directory:
+        os.environ.update(bench_environment(directory))
+        with StandIns(stand_in_profiles(args)) as stand_ins:
+            report = run(
+                traffic, args.mode, args.concurrency, stand_ins, args.verbose
+            )
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Local HTTP stand-ins for the services the proxy calls: Salesforce (SOAP login,
+REST queries, sObject creates and composite requests), Everest, the Mailchimp
+opt-in endpoint and the Supporting Cast API.
+
+Every service answers from one local server. Requests reach it through
+RewritingAdapter, which is mounted on the proxy's outbound sessions and sends
+https://<host>/<path> to http://127.0.0.1:<port>/<host>/<path>, so the app runs
+unchanged, with its real clients, pools and retries. Each service can be
+given a latency (a lognormal distribution around a median) and an error rate
+(answered with a 503).
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+SF_INSTANCE = "bench.my.salesforce.com"
+
+# The hosts each service is called on, as configured by the harness
+SERVICE_HOSTS = {
+    "login.salesforce.com": "salesforce",
+    SF_INSTANCE: "salesforce",
+    "everest.bench": "everest",
+    "nypr.bench": "mailchimp",
+    "api.supportingcast.fm": "supporting_cast",
+}
+
+SUBSCRIPTION_LISTS = [
+    "Gothamist",
+    "Radiolab",
+    "On The Media",
+    "WNYC Daily Newsletter",
+    "Politics Brief Newsletter",
+    "This Week On WNYC",
+]
+
+LOGIN_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><loginResponse><result>
+<serverUrl>https://{instance}/services/Soap/u/52.0/00D</serverUrl>
+<sessionId>bench-session</sessionId>
+</result></loginResponse></soapenv:Body></soapenv:Envelope>"""
+
+
+class ServiceProfile:
+    """The latency and error rate of one stand-in service"""
+
+    def __init__(self, latency_ms=0, sigma=0.5, error_rate=0):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def delay(self):
+        if self.latency_ms:
+            median = math.log(self.latency_ms)
+            time.sleep(random.lognormvariate(median, self.sigma) / 1000)
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+
+class StandIns:
+    """Runs the stand-in server on a free local port, counting the calls each
+    service receives"""
+
+    def __init__(self, profiles=None, existing_contact_rate=0.7):
+        self.profiles = {
+            service: ServiceProfile() for service in set(SERVICE_HOSTS.values())
+        }
+        self.profiles.update(profiles or {})
+        self.existing_contact_rate = existing_contact_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._ids = 0
+
+        class Handler(StandInHandler):
+            stand_ins = self
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def counts(self):
+        with self._lock:
+            return dict(self.calls), dict(self.errors)
+
+    def record(self, service, failed):
+        with self._lock:
+            self.calls[service] += 1
+            if failed:
+                self.errors[service] += 1
+
+    def new_id(self, prefix):
+        with self._lock:
+            self._ids += 1
+            return f"{prefix}{self._ids:012d}"
+
+    def adapter(self, **kwargs):
+        """An adapter to mount on a requests session, with HTTPAdapter's
+        keyword arguments"""
+        return RewritingAdapter(self.port, **kwargs)
+
+
+class RewritingAdapter(HTTPAdapter):
+    """Sends https://<host>/<path> requests to the stand-in server instead"""
+
+    def __init__(self, port, **kwargs):
+        self.port = port
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = urlunsplit(
+            (
+                "http",
+                f"127.0.0.1:{self.port}",
+                f"/{url.hostname}{url.path}",
+                url.query,
+                url.fragment,
+            )
+        )
+        return super().send(request, **kwargs)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stand_ins = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PATCH(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        _, host, path = self.path.split("/", 2)
+        path, _, query = ("/" + path).partition("?")
+        service = SERVICE_HOSTS.get(host)
+        if service is None:
+            return self._send(404, {"error": f"no stand-in for {host}"})
+
+        profile = self.stand_ins.profiles[service]
+        profile.delay()
+        failed = profile.fails()
+        self.stand_ins.record(service, failed)
+        if failed:
+            return self._send(503, {"error": "stand-in failure"})
+
+        respond = getattr(self, f"_{service}")
+        status, payload = respond(self.command, path, parse_qs(query), body)
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        if isinstance(payload, str):
+            content, content_type = payload.encode("utf-8"), "text/xml"
+        elif payload is None:
+            content, content_type = b"", "application/json"
+        else:
+            content = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _salesforce(self, method, path, query, body):
+        if "/services/Soap/u/" in path:
+            return 200, LOGIN_RESPONSE.format(instance=SF_INSTANCE)
+
+        if path.rstrip("/").endswith("/query"):
+            return 200, self._salesforce_query(query["q"][0])
+
+        if path.rstrip("/").endswith("/composite"):
+            return 200, {
+                "compositeResponse": [
+                    {
+                        "referenceId": subrequest["referenceId"],
+                        "httpHeaders": {},
+                        **self._salesforce_subrequest(subrequest),
+                    }
+                    for subrequest in json.loads(body)["compositeRequest"]
+                ]
+            }
+
+        if method == "POST" and "/sobjects/" in path:
+            contact_id = self.stand_ins.new_id("003")
+            return 201, {"id": contact_id, "success": True, "errors": []}
+
+        return 404, [{"errorCode": "NOT_FOUND", "message": path}]
+
+    def _salesforce_query(self, soql):
+        if "FROM cfg_Subscription__c" in soql:
+            records = [
+                {"Id": f"a0B{i:012d}", "Name": name}
+                for i, name in enumerate(SUBSCRIPTION_LISTS)
+            ]
+        elif "FROM Contact" in soql:
+            records = []
+            if random.random() < self.stand_ins.existing_contact_rate:
+                records = [{"Id": self.stand_ins.new_id("003")}]
+        else:
+            # An existing Subscription Member on about half of the lists
+            list_ids = soql.split(" IN (", 1)[1].split(")", 1)[0].split(",")
+            records = [
+                {
+                    "Id": self.stand_ins.new_id("a0C"),
+                    "cfg_Subscription__c": list_id.strip("'"),
+                }
+                for list_id in list_ids
+                if random.random() < 0.5
+            ]
+        return {"totalSize": len(records), "done": True, "records": records}
+
+    def _salesforce_subrequest(self, subrequest):
+        if subrequest["method"] == "POST":
+            record_id = self.stand_ins.new_id("a0C")
+            return {
+                "httpStatusCode": 201,
+                "body": {"id": record_id, "success": True, "errors": []},
+            }
+        if subrequest["method"] == "GET":
+            contact_id = self.stand_ins.new_id("003")
+            return {"httpStatusCode": 200, "body": {"Id": contact_id}}
+        return {"httpStatusCode": 204, "body": None}
+
+    def _everest(self, method, path, query, body):
+        if "invalid" in path:
+            return 200, {"results": {"status": "invalid", "name": "Mailbox Invalid"}}
+        return 200, {"results": {"status": "valid", "name": "Valid"}}
+
+    def _mailchimp(self, method, path, query, body):
+        return 200, {"status": "subscribed"}
+
+    def _supporting_cast(self, method, path, query, body):
+        if "/plans/" in path:
+            return 200, {"id": int(path.rsplit("/", 1)[-1]), "name": "Member"}
+        member_id = path.rsplit("=", 1)[-1]
+        return 200, {
+            "email": f"member-{member_id}@example.com",
+            "first_name": "Bench",
+            "last_name": "Member",
+        }
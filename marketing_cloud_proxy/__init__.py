@@ -1 +1,21 @@
-from marketing_cloud_proxy.wsgi_handler import handler
+import importlib
+
+# Lambda entry points, imported on first use so that each function's cold
+# start only pays for its own modules
+_handlers = {
+    "handler": ("marketing_cloud_proxy.wsgi_handler", "handler"),
+    "worker_handler": ("marketing_cloud_proxy.worker", "handler"),
+    "supporting_cast_worker_handler": (
+        "marketing_cloud_proxy.worker",
+        "supporting_cast_handler",
+    ),
+    "write_retry_handler": ("marketing_cloud_proxy.worker", "retry_handler"),
+    "prewarm_handler": ("marketing_cloud_proxy.prewarm", "handler"),
+}
+
+
+def __getattr__(name):
+    if name not in _handlers:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attr = _handlers[name]
+    return getattr(importlib.import_module(module), attr)
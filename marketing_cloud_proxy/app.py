@@ -1,70 +1,120 @@
 import os
-from flask import Flask, request, Response
+import time
+
+from flask import Flask, g, jsonify, request
 
-import sentry_sdk
 from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
 from sentry_sdk.integrations.flask import FlaskIntegration
 
 from marketing_cloud_proxy.client import (
+    BulkImportRequestHandler,
     EmailSignupRequestHandler,
     failure_response,
     ListRequestHandler,
     SupportingCastWebhookHandler,
-    OptinmonsterWebhookHandler
+    OptinmonsterWebhookHandler,
+    unavailable_response,
 )
 from marketing_cloud_proxy.mailchimp import MailchimpForwarder
 from marketing_cloud_proxy.errors import InvalidDataError
+from marketing_cloud_proxy import breakers, capture, metrics, sentry, settings
 
 
-sentry_sdk.init(
-    dsn=os.environ.get("SENTRY_DSN"),
-    integrations=[AwsLambdaIntegration(), FlaskIntegration()],
-    environment=os.environ.get("ENV"),
-    release=os.environ.get("SENTRY_RELEASE"),
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    # We recommend adjusting this value in production.
-    traces_sample_rate=1.0,
-)
+sentry.init(AwsLambdaIntegration(), FlaskIntegration())
 
 app = Flask(__name__)
 
 path_prefix = os.environ.get("APP_NAME")
 
 
+@app.before_request
+def start_stage_timings():
+    g.stage_timings = metrics.start_request()
+
+
+@app.teardown_request
+def log_stage_timings(exc):
+    if "stage_timings" in g:
+        metrics.finish_request(g.stage_timings, request.endpoint)
+
+
+@app.before_request
+def start_capture():
+    if request.endpoint in capture.CAPTURED_ENDPOINTS and capture.enabled():
+        g.capture_started = time.perf_counter()
+
+
+@app.after_request
+def capture_request(response):
+    if "capture_started" in g:
+        capture.record(
+            capture.envelope(
+                request.method,
+                request.path[len(f"/{path_prefix}") :],
+                request.args.to_dict(),
+                request.mimetype,
+                request.form.to_dict() or request.get_data(),
+                response.status_code,
+                (time.perf_counter() - g.capture_started) * 1000,
+            )
+        )
+    return response
+
+
+@app.errorhandler(breakers.CircuitOpenError)
+def dependency_unavailable(e):
+    return unavailable_response(e)
+
+
 @app.route(f"/{path_prefix}/", methods=["GET"])
 def healthcheck():
-    return Response(status=204)
+    return breakers.health()
 
 
 @app.route(f"/{path_prefix}/subscribe", methods=["POST"])
 def subscribe():
     try:
-        email_handler = EmailSignupRequestHandler(request)
+        with metrics.stage("parse"):
+            email_handler = EmailSignupRequestHandler(request)
     except InvalidDataError as e:
         return failure_response(e.message)
 
     if not email_handler.is_email_syntactically_valid():
         return failure_response("Email address is invalid")
 
-    mf_list = map(
-        lambda x: MailchimpForwarder(email_handler.email, x), email_handler.lists
-    )
-    for mf in mf_list:
-        if mf.is_mailchimp_address:
-            if mf.is_list_migrated:
-                email_handler.lists.append(mf.to_marketing_cloud_list())
-                email_handler.lists.remove(mf.email_list)
-            else:
-                return mf.proxy_to_mailchimp()
+    with metrics.stage("mailchimp"):
+        forwarders = [
+            MailchimpForwarder(email_handler.email, email_list)
+            for email_list in email_handler.lists
+        ]
+        for mf in forwarders:
+            if mf.is_mailchimp_address:
+                if mf.is_list_migrated:
+                    email_handler.lists.append(mf.to_marketing_cloud_list())
+                    email_handler.lists.remove(mf.email_list)
+                else:
+                    return mf.proxy_to_mailchimp()
 
-    return email_handler.subscribe()
+    if settings.SUBSCRIBE_MODE == "async":
+        return email_handler.queue()
+
+    return email_handler.subscribe_or_queue()
 
 
 @app.route(f"/{path_prefix}/lists")
 def lists():
     lqh = ListRequestHandler()
-    return lqh.lists_json()
+    lists_json = lqh.lists_json()
+    if isinstance(lists_json, tuple):
+        return lists_json
+
+    # Let the CDN cache the list catalog and revalidate it cheaply
+    response = jsonify(lists_json)
+    response.set_etag(lqh.etag)
+    response.last_modified = lqh.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = settings.LIST_CATALOG_TTL
+    return response.make_conditional(request)
 
 
 @app.route(f"/{path_prefix}/supporting-cast", methods=["POST"])
@@ -76,5 +126,21 @@ def supporting_cast():
 @app.route(f"/{path_prefix}/optinmonster", methods=["POST"])
 def optinmonster():
     handler = OptinmonsterWebhookHandler(request)
-    response = handler.subscribe()
+    response = handler.subscribe_or_queue()
     return response
+
+
+@app.route(f"/{path_prefix}/bulk-import", methods=["POST"])
+def bulk_import():
+    handler = BulkImportRequestHandler(request)
+    if not handler.is_authorized():
+        return {"status": "failure", "detail": "Not authorized"}, 401
+    return handler.start_import()
+
+
+@app.route(f"/{path_prefix}/bulk-import/<job_id>/<results_type>")
+def bulk_import_results(job_id, results_type):
+    handler = BulkImportRequestHandler(request)
+    if not handler.is_authorized():
+        return {"status": "failure", "detail": "Not authorized"}, 401
+    return handler.job_results(job_id, results_type)
@@ -0,0 +1,354 @@
+"""
+ASGI variant of the app, for running the container outside Lambda:
+
+    uvicorn marketing_cloud_proxy.asgi:app
+
+It serves the same /subscribe, /lists, /supporting-cast and /optinmonster
+routes as the Flask app, so one process can have many signups in flight.
+Everest, Mailchimp and Supporting Cast are called with async HTTP clients. The
+Salesforce and Marketing Cloud SDKs only have blocking clients, so the
+handlers that use them run on a thread pool of ASGI_SDK_THREADS threads.
+
+Requires the "asgi" extra (pip install -e ".[asgi]").
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import time
+from email.utils import formatdate
+from urllib.parse import urlsplit
+
+import anyio
+import httpx
+from sentry_sdk.integrations.starlette import StarletteIntegration
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from marketing_cloud_proxy import (
+    breakers,
+    metrics,
+    outbound,
+    sentry,
+    settings,
+    validity,
+)
+from marketing_cloud_proxy.client import (
+    EmailSignupRequestHandler,
+    failure_response,
+    ListRequestHandler,
+    OptinmonsterWebhookHandler,
+    SUPPORTING_CAST_API_TOKEN,
+    SUPPORTING_CAST_API_URL,
+    SupportingCastPlanCache,
+    SupportingCastWebhookHandler,
+    unavailable_response,
+)
+from marketing_cloud_proxy.errors import InvalidDataError
+from marketing_cloud_proxy.mailchimp import MailchimpForwarder
+
+sentry.init(StarletteIntegration())
+
+path_prefix = os.environ.get("APP_NAME")
+
+# Used instead of the network by every HTTP client when set (by tests)
+http_transport = None
+
+sdk_threads = anyio.CapacityLimiter(settings.ASGI_SDK_THREADS)
+
+
+class RequestData:
+    """The parts of a Flask request that the request handlers read"""
+
+    def __init__(self, form, data, args):
+        self.form = form
+        self.data = data
+        self.args = args
+
+    def get_json(self):
+        return json.loads(self.data)
+
+    @classmethod
+    async def from_request(cls, request):
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith(
+            ("application/x-www-form-urlencoded", "multipart/form-data")
+        ):
+            return cls(await request.form(), b"", request.query_params)
+        return cls({}, await request.body(), request.query_params)
+
+
+class AsyncValidityCheck:
+    """Waits on an Everest check started on the event loop, rather than
+    starting one on a thread"""
+
+    validity_check = None
+
+    def _start_validity_check(self):
+        return self.validity_check
+
+
+class AsyncEmailSignupRequestHandler(AsyncValidityCheck, EmailSignupRequestHandler):
+    pass
+
+
+class AsyncOptinmonsterWebhookHandler(
+    AsyncValidityCheck, OptinmonsterWebhookHandler
+):
+    pass
+
+
+def run_sdk(fn, *args):
+    """Runs a call that blocks on the Salesforce or Marketing Cloud SDKs"""
+    return anyio.to_thread.run_sync(fn, *args, limiter=sdk_threads)
+
+
+def to_response(response):
+    """Turns a handler's body, (body, status) or (body, status, headers)
+    response into a Response"""
+    if isinstance(response, tuple):
+        headers = response[2] if len(response) > 2 else None
+        return JSONResponse(response[0], status_code=response[1], headers=headers)
+    return JSONResponse(response)
+
+
+def http_client(integration):
+    return httpx.AsyncClient(
+        timeout=outbound.TIMEOUTS[integration],
+        limits=httpx.Limits(max_keepalive_connections=settings.OUTBOUND_POOL_SIZE),
+        transport=http_transport
+        or httpx.AsyncHTTPTransport(retries=settings.OUTBOUND_MAX_RETRIES),
+    )
+
+
+async def http_request(app, integration, method, url, **kwargs):
+    """Like an outbound session's request: timed, and guarded by the
+    integration's circuit breaker"""
+    breaker = breakers.breaker(integration)
+    breaker.acquire()
+    failed = True
+    started = time.perf_counter()
+    try:
+        response = await app.state.http[integration].request(method, url, **kwargs)
+        failed = breakers.is_failure_status(response.status_code)
+        return response
+    finally:
+        breaker.release(failed)
+        metrics.observe(
+            f"outbound.latency.{urlsplit(url).hostname}",
+            (time.perf_counter() - started) * 1000,
+        )
+
+
+async def check_email_validity(app, email):
+    """The async counterpart of validity.check_email_validity"""
+    verdict = await run_sdk(validity.verdict_cache.get, email)
+    if verdict:
+        return verdict
+
+    metrics.increment("everest.call")
+    try:
+        response = await http_request(
+            app,
+            "everest",
+            "GET",
+            f"{settings.EVEREST_API_ENDPOINT}/{email}",
+            # Like requests, leave the header out when there's no key
+            headers={"X-API-KEY": settings.EVEREST_API_KEY}
+            if settings.EVEREST_API_KEY
+            else {},
+        )
+    except (httpx.HTTPError, breakers.CircuitOpenError) as e:
+        metrics.increment("everest.error")
+        print(f"Error connecting to Everest API: {e}")
+        return None
+
+    verdict = validity.verdict_from_everest_response(response)
+    if verdict:
+        await run_sdk(validity.verdict_cache.set, email, verdict)
+    return verdict
+
+
+def start_validity_check(app, handler):
+    """Starts the Everest check for the handler's email on the event loop, as
+    a future that the handler can wait on from its thread"""
+    validity_check = concurrent.futures.Future()
+
+    def done(task):
+        if not task.cancelled() and task.exception():
+            validity_check.set_exception(task.exception())
+        else:
+            validity_check.set_result(
+                (not task.cancelled() and task.result()) or (None, None)
+            )
+        app.state.tasks.discard(task)
+
+    task = asyncio.ensure_future(check_email_validity(app, handler.email))
+    task.add_done_callback(done)
+    # Keeps a reference to the task until it is done
+    app.state.tasks.add(task)
+    handler.validity_check = validity_check
+
+
+async def healthcheck(request):
+    return JSONResponse(breakers.health())
+
+
+async def dependency_unavailable(request, exc):
+    return to_response(unavailable_response(exc))
+
+
+async def subscribe(request):
+    try:
+        with metrics.stage("parse"):
+            email_handler = AsyncEmailSignupRequestHandler(
+                await RequestData.from_request(request)
+            )
+    except InvalidDataError as e:
+        return to_response(failure_response(e.message))
+
+    if not email_handler.is_email_syntactically_valid():
+        return to_response(failure_response("Email address is invalid"))
+
+    for email_list in list(email_handler.lists):
+        mf = MailchimpForwarder(email_handler.email, email_list)
+        if mf.is_mailchimp_address:
+            if mf.is_list_migrated:
+                email_handler.lists.append(mf.to_marketing_cloud_list())
+                email_handler.lists.remove(mf.email_list)
+            else:
+                res = await http_request(
+                    request.app,
+                    "mailchimp",
+                    "POST",
+                    settings.MAILCHIMP_PROXY_ENDPOINT,
+                    json=mf.proxy_payload(),
+                )
+                return to_response(
+                    mf.proxied_response(res.is_success, res.content, res.status_code)
+                )
+
+    if settings.SUBSCRIBE_MODE == "async":
+        return to_response(await run_sdk(email_handler.queue))
+
+    start_validity_check(request.app, email_handler)
+    return to_response(await run_sdk(email_handler.subscribe_or_queue))
+
+
+async def lists(request):
+    lqh = ListRequestHandler()
+    lists_json = await run_sdk(lqh.lists_json)
+    if isinstance(lists_json, tuple):
+        return to_response(lists_json)
+
+    # Let the CDN cache the list catalog and revalidate it cheaply
+    headers = {
+        "ETag": f'"{lqh.etag}"',
+        "Last-Modified": formatdate(lqh.last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={settings.LIST_CATALOG_TTL}",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [etag.strip() for etag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(lists_json, headers=headers)
+
+
+async def supporting_cast(request):
+    body = await request.body()
+    if not body:
+        return to_response(failure_response("No webhook info was provided"))
+
+    event_info_dict = json.loads(body)
+    member_id = event_info_dict["subscription"]["member_id"]
+    plan_id = event_info_dict["subscription"]["plan_id"]
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {SUPPORTING_CAST_API_TOKEN}",
+    }
+    get = functools.partial(
+        http_request, request.app, "supporting_cast", "GET", headers=headers
+    )
+    member_request = get(f"{SUPPORTING_CAST_API_URL}/memberships/id={member_id}")
+    plan_info_dict = SupportingCastPlanCache.cached(plan_id)
+    if plan_info_dict is None:
+        member, plan = await asyncio.gather(
+            member_request, get(f"{SUPPORTING_CAST_API_URL}/plans/{plan_id}")
+        )
+        plan_info_dict = plan.json()
+        SupportingCastPlanCache.set(plan_id, plan_info_dict)
+    else:
+        member = await member_request
+
+    handler = SupportingCastWebhookHandler.from_webhook_info(
+        SupportingCastWebhookHandler.webhook_info_from(
+            event_info_dict, member.json(), plan_info_dict
+        )
+    )
+    return to_response(await run_sdk(handler.save))
+
+
+async def optinmonster(request):
+    try:
+        handler = AsyncOptinmonsterWebhookHandler(
+            await RequestData.from_request(request)
+        )
+    except InvalidDataError as e:
+        return to_response(failure_response(e.message))
+
+    # OptInMonster's test webhook has no lists and is answered straight away
+    if hasattr(handler, "lists"):
+        start_validity_check(request.app, handler)
+    return to_response(await run_sdk(handler.subscribe_or_queue))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.tasks = set()
+    app.state.http = {
+        integration: http_client(integration)
+        for integration in ("everest", "mailchimp", "supporting_cast")
+    }
+    try:
+        yield
+    finally:
+        for client in app.state.http.values():
+            await client.aclose()
+
+
+class StageTimingMiddleware:
+    """Logs the stage timings of each request, like the Flask app's
+    teardown_request hook; see metrics.finish_request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = metrics.start_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router adds the matched route's endpoint to the scope
+            endpoint = scope.get("endpoint")
+            metrics.finish_request(token, endpoint and endpoint.__name__)
+
+
+app = Starlette(
+    routes=[
+        Route(f"/{path_prefix}/", healthcheck, methods=["GET"]),
+        Route(f"/{path_prefix}/subscribe", subscribe, methods=["POST"]),
+        Route(f"/{path_prefix}/lists", lists, methods=["GET"]),
+        Route(f"/{path_prefix}/supporting-cast", supporting_cast, methods=["POST"]),
+        Route(f"/{path_prefix}/optinmonster", optinmonster, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+    middleware=[Middleware(StageTimingMiddleware)],
+    exception_handlers={breakers.CircuitOpenError: dependency_unavailable},
+)
@@ -0,0 +1,190 @@
+"""
+Circuit breakers for the services the proxy depends on, so that a degraded
+dependency makes requests fail (or fall back) straight away instead of each
+one waiting on it in full.
+
+Each dependency has one breaker per container, kept for as long as the
+container is warm. It opens after BREAKER_FAILURE_THRESHOLD consecutive failed
+calls (errors, timeouts, and 5xx or 429 responses), and calls are then
+rejected with CircuitOpenError until BREAKER_RESET_TIMEOUT seconds have
+passed. One trial call is then let through: the breaker closes if it succeeds
+and opens again if it fails. With BREAKER_MAX_IN_FLIGHT set, calls beyond
+that many at once to a dependency are rejected as well.
+
+Calls through outbound sessions are guarded by their integration's breaker,
+and Marketing Cloud SOAP calls with `guard`. Every breaker's state is shown by
+the healthcheck, and each time one opens or closes it is logged as the
+BreakerOpen metric (1 or 0) for its dependency.
+"""
+import contextlib
+import threading
+import time
+
+import requests
+
+from marketing_cloud_proxy import metrics, settings
+
+DEPENDENCIES = (
+    "salesforce",
+    "marketing_cloud",
+    "everest",
+    "mailchimp",
+    "supporting_cast",
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a dependency whose breaker is open. A
+    requests ConnectionError, so it is handled like the dependency being
+    unreachable."""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"{dependency} is unavailable")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def is_failure_status(status_code):
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, reset_timeout, max_in_flight=0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.in_flight = 0
+        self._trial_in_flight = False
+
+    def is_open(self):
+        """Whether calls are being rejected without a trial call being due"""
+        with self._lock:
+            return self.state == OPEN and not self._reset_timeout_passed()
+
+    def check(self):
+        """Raises CircuitOpenError if the breaker is open, without taking the
+        trial call when one is due"""
+        with self._lock:
+            if self.state == OPEN and not self._reset_timeout_passed():
+                self._reject()
+
+    def acquire(self):
+        """Takes a slot for a call, or raises CircuitOpenError. Every acquire
+        must be followed by a release."""
+        with self._lock:
+            if self.state == OPEN and self._reset_timeout_passed():
+                self.state = HALF_OPEN
+            if self.state == OPEN:
+                self._reject()
+            # Only one trial call at a time
+            if self.state == HALF_OPEN and self._trial_in_flight:
+                self._reject()
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                metrics.increment(f"breaker.{self.name}.shed")
+                self._reject()
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = True
+            self.in_flight += 1
+
+    def release(self, failed):
+        with self._lock:
+            self.in_flight -= 1
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+            if not failed:
+                self.failures = 0
+                if self.state == HALF_OPEN:
+                    self._transition(CLOSED)
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.time()
+                self._transition(OPEN)
+
+    @contextlib.contextmanager
+    def guard(self):
+        """Runs the block as one call to the dependency; any exception it
+        raises counts as a failure"""
+        self.acquire()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.release(failed)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "state": self.state,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+            }
+            if self.state == OPEN:
+                snapshot["retry_after"] = self._retry_after()
+            return snapshot
+
+    def _reset_timeout_passed(self):
+        return time.time() - self.opened_at >= self.reset_timeout
+
+    def _retry_after(self):
+        if self.state != OPEN:
+            return 0
+        return max(0, round(self.opened_at + self.reset_timeout - time.time(), 1))
+
+    def _reject(self):
+        metrics.increment(f"breaker.{self.name}.rejected")
+        raise CircuitOpenError(self.name, self._retry_after())
+
+    def _transition(self, state):
+        self.state = state
+        metrics.increment(f"breaker.{self.name}.{state}")
+        print(f"Circuit breaker for {self.name} is {state.replace('_', ' ')}")
+        metrics.log_metrics(
+            {"Dependency": self.name}, {"BreakerOpen": int(state == OPEN)}, "Count"
+        )
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+def breaker(dependency):
+    """Returns the container-wide breaker for a dependency, e.g. "salesforce"
+    or "marketing_cloud"; see DEPENDENCIES"""
+    with _lock:
+        if dependency not in _breakers:
+            _breakers[dependency] = CircuitBreaker(
+                dependency,
+                settings.BREAKER_FAILURE_THRESHOLD,
+                settings.BREAKER_RESET_TIMEOUT,
+                settings.BREAKER_MAX_IN_FLIGHT,
+            )
+        return _breakers[dependency]
+
+
+def health():
+    """The healthcheck's body: every dependency's breaker, and "degraded" if
+    any of them isn't closed"""
+    states = {
+        dependency: breaker(dependency).snapshot() for dependency in DEPENDENCIES
+    }
+    degraded = any(state["state"] != CLOSED for state in states.values())
+    return {"status": "degraded" if degraded else "ok", "breakers": states}
+
+
+def reset():
+    with _lock:
+        _breakers.clear()
@@ -0,0 +1,345 @@
+"""
+Bulk subscription imports through the Salesforce Bulk API 2.0.
+
+Rows of email + list (+ source) are read from a CSV or NDJSON stream one at a
+time, validated and de-duplicated into a SQLite file on disk, so memory use
+doesn't depend on the size of the import.
+
+Rows are matched to existing records the way /subscribe matches a signup:
+Contacts on Email (the most recently modified one), and Subscription Members
+on their Contact and list (the most recent one). Existing records are looked
+up QUERY_CHUNK_SIZE at a time. Contacts that don't exist yet are inserted
+first, and the new Ids are read back from the jobs' results. Members are then
+created, or reactivated, with one Bulk API 2.0 ingest job per staged CSV part
+file.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pytz
+
+from marketing_cloud_proxy import settings
+from marketing_cloud_proxy.catalog import subscription_lists
+from marketing_cloud_proxy.mailchimp import mailchimp_id_to_marketingcloud_list
+from marketing_cloud_proxy.queries import CONTACTS_BY_EMAILS, MEMBERS_BY_CONTACTS
+from marketing_cloud_proxy.validity import normalize_email
+
+# Bulk API 2.0 accepts at most 150MB of (base64 encoded) data per job
+MAX_PART_SIZE = 100 * 1024 * 1024
+
+# How many rejected rows are echoed back in the import summary
+MAX_REJECTED_SAMPLES = 100
+
+# How many emails, or Contact Ids, each lookup of existing records is for;
+# this keeps the SOQL well under Salesforce's URL length limit
+QUERY_CHUNK_SIZE = 200
+
+RESULTS_TYPES = ("successfulResults", "failedResults", "unprocessedrecords")
+
+MEMBER_FIELDS = ["cfg_Active__c", "nypr_Subscription_Source__c", "cfg_Opt_In_Date__c"]
+
+
+def read_rows(stream, content_type):
+    """Yields one dict per row of a binary CSV or NDJSON stream"""
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if content_type in ("application/x-ndjson", "application/jsonl"):
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(text)
+
+
+class StagedPart:
+    """A CSV part file being written for one Bulk API job"""
+
+    def __init__(self, directory, name, header):
+        self.path = os.path.join(directory, name)
+        self.rows = 0
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file, lineterminator="\n")
+        self._writer.writerow(header)
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self.rows += 1
+
+    @property
+    def size(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class BulkImport:
+    def __init__(self, client, default_source=""):
+        self.client = client
+        self.default_source = default_source
+        self.summary = {
+            "rows": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "rejected_rows": [],
+            "existing_contacts": 0,
+            "existing_members": 0,
+            "contacts_not_created": 0,
+            "jobs": {"Contact": [], "cfg_Subscription_Member__c": []},
+        }
+        self._directory = tempfile.TemporaryDirectory()
+        self._parts = {}
+        self._db = sqlite3.connect(os.path.join(self._directory.name, "import.db"))
+        self._db.executescript(
+            """
+            CREATE TABLE members (
+                email TEXT, list_id TEXT, source TEXT, member_id TEXT,
+                PRIMARY KEY (email, list_id)
+            );
+            CREATE TABLE contacts (email TEXT PRIMARY KEY, contact_id TEXT);
+            """
+        )
+
+    def run(self, stream, content_type, contact_wait=None):
+        """Stages the rows in `stream`, matches them to existing records and
+        starts the ingest jobs. Member jobs are only started once the Contact
+        jobs have finished, waiting at most `contact_wait` seconds (forever if
+        None)."""
+        try:
+            self.stage(read_rows(stream, content_type))
+            self.match_contacts()
+            self.match_members()
+
+            self.stage_new_contacts()
+            self.summary["jobs"]["Contact"] = [
+                self.start_job("Contact", "insert", part)
+                for part in self._parts.pop("Contact", [])
+            ]
+            for job_id in self.summary["jobs"]["Contact"]:
+                self.wait_for_job(job_id, contact_wait)
+                self.read_new_contacts(job_id)
+
+            self.stage_members()
+            self.summary["jobs"]["cfg_Subscription_Member__c"] = [
+                self.start_job("cfg_Subscription_Member__c", operation, part)
+                for operation in ("insert", "update")
+                for part in self._parts.pop(operation, [])
+            ]
+            return self.summary
+        finally:
+            self._db.close()
+            self._directory.cleanup()
+
+    def stage(self, rows):
+        list_ids = subscription_lists.snapshot(lambda: self.client).ids
+
+        for row in rows:
+            self.summary["rows"] += 1
+            email = normalize_email(row.get("email") or "")
+            list_name = (row.get("list") or "").strip()
+            list_name = mailchimp_id_to_marketingcloud_list.get(list_name, list_name)
+
+            if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+                self._reject(row, "Email address is invalid")
+                continue
+            list_id = list_ids.get(list_name.casefold())
+            if not list_id:
+                self._reject(row, "List does not exist")
+                continue
+
+            with self._db:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO members (email, list_id, source) "
+                    "VALUES (?, ?, ?)",
+                    (email, list_id, row.get("source") or self.default_source),
+                )
+                if cursor.rowcount == 0:
+                    self.summary["duplicates"] += 1
+                    continue
+                self._db.execute(
+                    "INSERT OR IGNORE INTO contacts (email) VALUES (?)", (email,)
+                )
+
+    def match_contacts(self):
+        """Finds the existing Contact for each email"""
+        for emails in self._chunks("SELECT email FROM contacts"):
+            # Oldest first, so the most recently modified Contact wins
+            records = CONTACTS_BY_EMAILS.all(self.client, emails=emails)
+            with self._db:
+                self._db.executemany(
+                    "UPDATE contacts SET contact_id = ? WHERE email = ?",
+                    [
+                        (record["Id"], normalize_email(record["Email"]))
+                        for record in records
+                    ],
+                )
+        [(existing,)] = self._db.execute(
+            "SELECT COUNT(*) FROM contacts WHERE contact_id IS NOT NULL"
+        )
+        self.summary["existing_contacts"] = existing
+
+    def match_members(self):
+        """Finds the existing Subscription Member for each of the existing
+        Contacts' rows"""
+        chunks = self._chunks(
+            "SELECT DISTINCT contact_id FROM contacts WHERE contact_id IS NOT NULL"
+        )
+        for contact_ids in chunks:
+            # Oldest first, so the most recent member wins
+            records = MEMBERS_BY_CONTACTS.all(self.client, contact_ids=contact_ids)
+            with self._db:
+                self._db.executemany(
+                    """UPDATE members SET member_id = ? WHERE list_id = ? AND
+                    email IN (SELECT email FROM contacts WHERE contact_id = ?)""",
+                    [
+                        (record["Id"], record["cfg_Subscription__c"], record["cfg_Contact__c"])
+                        for record in records
+                    ],
+                )
+        [(existing,)] = self._db.execute(
+            "SELECT COUNT(*) FROM members WHERE member_id IS NOT NULL"
+        )
+        self.summary["existing_members"] = existing
+
+    def stage_new_contacts(self):
+        for (email,) in self._db.execute(
+            "SELECT email FROM contacts WHERE contact_id IS NULL"
+        ):
+            self._part("Contact", ["Email", "LastName"]).write([email, "NoLastName"])
+        self._close_parts("Contact")
+
+    def read_new_contacts(self, job_id):
+        """Records the Ids of the Contacts a finished insert job created"""
+        rows = read_job_results(self.client, job_id, "successfulResults")
+        with self._db:
+            self._db.executemany(
+                "UPDATE contacts SET contact_id = ? WHERE email = ?",
+                ((row["sf__Id"], row["Email"]) for row in rows),
+            )
+
+    def stage_members(self):
+        """Stages a create for each new member and a reactivation for each
+        existing one. Rows whose Contact couldn't be created are left out."""
+        opt_in_date = datetime.now(pytz.timezone("UTC")).strftime("%Y-%m-%d")
+        rows = self._db.execute(
+            """SELECT members.list_id, members.source, members.member_id,
+            contacts.contact_id FROM members JOIN contacts USING (email)"""
+        )
+        for list_id, source, member_id, contact_id in rows:
+            fields = ["true", source, opt_in_date]
+            if member_id:
+                self._part("update", ["Id", *MEMBER_FIELDS]).write(
+                    [member_id, *fields]
+                )
+            elif contact_id:
+                self._part(
+                    "insert",
+                    ["cfg_Subscription__c", "cfg_Contact__c", *MEMBER_FIELDS],
+                ).write([list_id, contact_id, *fields])
+            else:
+                self.summary["contacts_not_created"] += 1
+        self._close_parts("insert", "update")
+
+    def _chunks(self, query):
+        """Yields the single-column results of the query in lists of
+        QUERY_CHUNK_SIZE values"""
+        cursor = self._db.execute(query)
+        while True:
+            chunk = [value for (value,) in cursor.fetchmany(QUERY_CHUNK_SIZE)]
+            if not chunk:
+                return
+            yield chunk
+
+    def _reject(self, row, reason):
+        self.summary["rejected"] += 1
+        if len(self.summary["rejected_rows"]) < MAX_REJECTED_SAMPLES:
+            self.summary["rejected_rows"].append({**row, "error": reason})
+
+    def _part(self, kind, header):
+        parts = self._parts.setdefault(kind, [])
+        if not parts or parts[-1].size > MAX_PART_SIZE:
+            if parts:
+                parts[-1].close()
+            parts.append(
+                StagedPart(self._directory.name, f"{kind}-{len(parts)}.csv", header)
+            )
+        return parts[-1]
+
+    def _close_parts(self, *kinds):
+        for kind in kinds:
+            for part in self._parts.get(kind, []):
+                part.close()
+
+    def start_job(self, sobject, operation, part):
+        job = {
+            "object": sobject,
+            "operation": operation,
+            "contentType": "CSV",
+            "lineEnding": "LF",
+        }
+        job_id = self.client.restful("jobs/ingest", method="POST", json=job)["id"]
+
+        with open(part.path, "rb") as data:
+            response = self.client.session.put(
+                f"{self.client.base_url}jobs/ingest/{job_id}/batches",
+                data=data,
+                headers={**self.client.headers, "Content-Type": "text/csv"},
+            )
+        response.raise_for_status()
+
+        self.client.restful(
+            f"jobs/ingest/{job_id}", method="PATCH", json={"state": "UploadComplete"}
+        )
+        return job_id
+
+    def wait_for_job(self, job_id, timeout=None):
+        started = time.time()
+        while True:
+            job = self.client.restful(f"jobs/ingest/{job_id}")
+            if job["state"] in ("JobComplete", "Failed", "Aborted"):
+                return job
+            if timeout is not None and time.time() - started > timeout:
+                raise TimeoutError(f"Bulk job {job_id} is still {job['state']}")
+            time.sleep(settings.BULK_IMPORT_POLL_INTERVAL)
+
+
+def _job_results_response(client, job_id, results_type):
+    response = client.session.get(
+        f"{client.base_url}jobs/ingest/{job_id}/{results_type}",
+        headers={**client.headers, "Accept": "text/csv"},
+        stream=True,
+    )
+    response.raise_for_status()
+    return response
+
+
+def stream_job_results(client, job_id, results_type):
+    """Yields the per-row results CSV of an ingest job in chunks"""
+    response = _job_results_response(client, job_id, results_type)
+    yield from response.iter_content(chunk_size=64 * 1024)
+
+
+def read_job_results(client, job_id, results_type):
+    """Yields the per-row results of an ingest job as dicts"""
+    response = _job_results_response(client, job_id, results_type)
+    yield from csv.DictReader(codecs.iterdecode(response.iter_lines(), "utf-8"))
+
+
+if __name__ == "__main__":
+    # Imports a local CSV or NDJSON file without the API Gateway time limit:
+    #   python -m marketing_cloud_proxy.bulk subscribers.csv [source]
+    from marketing_cloud_proxy.client import salesforce_client
+
+    path = sys.argv[1]
+    content_type = "application/x-ndjson" if path.endswith("json") else "text/csv"
+    with open(path, "rb") as stream:
+        summary = BulkImport(salesforce_client(), *sys.argv[2:3]).run(stream, content_type)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,137 @@
+"""
+Captures the requests the app serves as sanitized NDJSON envelopes, so real
+signup traffic can be replayed with benchmarks/replay.py.
+
+Capture is off unless TRAFFIC_CAPTURE_DIR is set. Each process then appends
+one envelope per request (for TRAFFIC_CAPTURE_SAMPLE_RATE of requests) to
+traffic-<pid>.ndjson in that directory, rotated after TRAFFIC_CAPTURE_MAX_BYTES
+with TRAFFIC_CAPTURE_BACKUPS old files kept:
+
+    {"ts": 1700000000.123, "method": "POST", "path": "/subscribe",
+     "args": {}, "content_type": "application/json",
+     "json": {"email": "capture-4f1c...@example.com", "list": "Radiolab"},
+     "status": 200, "duration_ms": 412.7}
+
+Request bodies keep their shape but not their personal data: emails are
+replaced with a pseudonym (the same email always gets the same one, so
+repeat signups still repeat), other strings are redacted unless their field
+is one of KEPT_FIELDS, and numbers are kept as they are.
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import random
+import secrets
+import threading
+import time
+
+from marketing_cloud_proxy import settings
+
+# The endpoints whose requests are captured; bulk imports are left out
+CAPTURED_ENDPOINTS = {"subscribe", "lists", "supporting_cast", "optinmonster"}
+
+# Fields whose strings (list names, signup sources, plan statuses, ...) are not
+# personal and are captured as they are
+KEPT_FIELDS = {"list", "lists", "source", "status", "title", "type"}
+
+REDACTED = "redacted"
+
+# Without a configured salt, pseudonyms only match within a process
+_salt = settings.TRAFFIC_CAPTURE_SALT or secrets.token_hex(16)
+
+_lock = threading.Lock()
+_logger = None
+
+
+def enabled():
+    """Whether the request being handled should be captured"""
+    return bool(settings.TRAFFIC_CAPTURE_DIR) and (
+        random.random() < settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+    )
+
+
+def pseudonymize_email(email):
+    digest = hashlib.sha256((_salt + email.strip().lower()).encode("utf-8"))
+    return f"capture-{digest.hexdigest()[:16]}@example.com"
+
+
+def sanitize(value, field=None):
+    """Returns `value` with its personal data pseudonymized or redacted"""
+    if isinstance(value, dict):
+        return {key: sanitize(item, key) for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item, field) for item in value]
+    if not isinstance(value, str):
+        return value
+    if "@" in value:
+        return pseudonymize_email(value)
+    if field in KEPT_FIELDS:
+        return value
+    return REDACTED
+
+
+def envelope(method, path, args, content_type, body, status, duration_ms):
+    """An envelope for one request. `body` is the request's bytes, or a dict
+    of its form fields."""
+    captured = {
+        "ts": round(time.time(), 3),
+        "method": method,
+        "path": path,
+        "args": sanitize(args),
+        "content_type": content_type,
+    }
+    if isinstance(body, dict):
+        if body:
+            captured["form"] = sanitize(body)
+    elif body:
+        try:
+            captured["json"] = sanitize(json.loads(body))
+        except ValueError:
+            # Only the size of a body that isn't JSON is kept
+            captured["body_bytes"] = len(body)
+    captured["status"] = status
+    captured["duration_ms"] = round(duration_ms, 1)
+    return captured
+
+
+def _capture_logger():
+    global _logger
+    with _lock:
+        if _logger is None:
+            os.makedirs(settings.TRAFFIC_CAPTURE_DIR, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(
+                    settings.TRAFFIC_CAPTURE_DIR, f"traffic-{os.getpid()}.ndjson"
+                ),
+                maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+                backupCount=settings.TRAFFIC_CAPTURE_BACKUPS,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("marketing_cloud_proxy.capture")
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _logger = logger
+        return _logger
+
+
+def record(captured):
+    """Appends an envelope to this process's capture file"""
+    try:
+        _capture_logger().info(json.dumps(captured, separators=(",", ":")))
+    except OSError as e:
+        # Capturing must never fail the request it captures
+        print(f"Could not capture request: {e}")
+
+
+def reset():
+    """Closes the capture file, so the next envelope opens it again"""
+    global _logger
+    with _lock:
+        if _logger is not None:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+                handler.close()
+        _logger = None
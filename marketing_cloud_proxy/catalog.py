@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from marketing_cloud_proxy import metrics, settings
+from marketing_cloud_proxy.queries import SUBSCRIPTION_LISTS
+
+# `lists` maps each list's name to its Id as Salesforce has it, for /lists;
+# `ids` maps casefolded names to Ids, since Salesforce matches names
+# case-insensitively
+CatalogSnapshot = namedtuple(
+    "CatalogSnapshot", ["lists", "ids", "etag", "changed_at"]
+)
+
+
+class SubscriptionListCatalog:
+    """In-memory Name -> Id index of the cfg_Subscription__c records, shared by
+    the /lists endpoint and list resolution during signups.
+
+    The catalog is served as-is for `ttl` seconds after it is loaded. For a
+    further `stale_ttl` seconds the stale copy is still served while a
+    background thread reloads it, so only a cold or long-idle container ever
+    waits on the Salesforce query."""
+
+    def __init__(self, ttl, stale_ttl):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._snapshot = None
+        self._loaded_at = 0
+
+    def snapshot(self, client_factory):
+        """Returns the current CatalogSnapshot. `client_factory` is called to
+        get a Salesforce client only if the catalog has to be (re)loaded."""
+        age = time.time() - self._loaded_at
+
+        if self._snapshot and age < self.ttl:
+            metrics.increment("list_catalog.hit")
+            return self._snapshot
+
+        if self._snapshot and age < self.ttl + self.stale_ttl:
+            metrics.increment("list_catalog.stale")
+            self._refresh_in_background(client_factory)
+            return self._snapshot
+
+        metrics.increment("list_catalog.miss")
+        return self.load(client_factory())
+
+    def resolve(self, names, client_factory):
+        """Maps each list name, in any case, to its Salesforce Id. Returns the
+        mapping and the names that are not in the catalog."""
+        ids = self.snapshot(client_factory).ids
+        resolved = {
+            name: ids[name.casefold()] for name in names if name.casefold() in ids
+        }
+        unknown = [name for name in names if name.casefold() not in ids]
+        return resolved, unknown
+
+    def load(self, client):
+        lists = {}
+        ids = {}
+        for record in SUBSCRIPTION_LISTS.all(client):
+            lists.setdefault(record["Name"], record["Id"])
+            ids.setdefault(record["Name"].casefold(), record["Id"])
+
+        etag = hashlib.md5("\n".join(lists).encode("utf-8")).hexdigest()
+
+        with self._lock:
+            if self._snapshot and self._snapshot.etag == etag:
+                # Keep Last-Modified stable when nothing has changed
+                self._snapshot = self._snapshot._replace(lists=lists, ids=ids)
+            else:
+                self._snapshot = CatalogSnapshot(lists, ids, etag, time.time())
+            self._loaded_at = time.time()
+            return self._snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            self._loaded_at = 0
+
+    def _refresh_in_background(self, client_factory):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.load(client_factory())
+            except Exception as e:
+                # The stale copy keeps being served; the next request retries
+                print(f"Error refreshing subscription list catalog: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+subscription_lists = SubscriptionListCatalog(
+    settings.LIST_CATALOG_TTL, settings.LIST_CATALOG_STALE_TTL
+)
@@ -1,31 +1,64 @@
+import concurrent.futures
+import hmac
 import json
+import math
 import os
 import re
+import threading
 import time
 from datetime import datetime
 
-import boto3
-import FuelSDK
-import jwt
 import pytz
 import requests
-from simple_salesforce import (
-    format_soql,
-    Salesforce,
-    SalesforceAuthenticationFailed,
-    SalesforceLogin,
-)
+from flask import Response, stream_with_context
 from werkzeug.exceptions import BadRequestKeyError
 
-from marketing_cloud_proxy import settings
+from marketing_cloud_proxy import (
+    breakers,
+    idempotency,
+    metrics,
+    outbound,
+    queries,
+    retries,
+    settings,
+    validity,
+    wsdl,
+)
+from marketing_cloud_proxy.bulk import BulkImport, RESULTS_TYPES, stream_job_results
+from marketing_cloud_proxy.catalog import subscription_lists
+from marketing_cloud_proxy.contacts import find_or_create_contact
+from marketing_cloud_proxy.data_extensions import write_rows
 from marketing_cloud_proxy.errors import InvalidDataError, NoDataProvidedError
+from marketing_cloud_proxy.lazy import LazyModule
+from marketing_cloud_proxy.queues import signup_queue, supporting_cast_queue
+from marketing_cloud_proxy.subscriptions import subscribe_contact_to_lists
+from marketing_cloud_proxy.tokens import MarketingCloudTokenStore
+
+# Imported on first use; see marketing_cloud_proxy.lazy
+FuelSDK = LazyModule("FuelSDK")
+jwt = LazyModule("jwt")
+simple_salesforce = LazyModule("simple_salesforce")
+suds_transport = LazyModule("suds.transport")
 
 REFRESH_TOKEN_TABLE = (
     os.environ.get("REFRESH_TOKEN_TABLE") or "MarketingCloudAuthTokenStore"
 )
 MC_SUPPORTING_CAST_DATA_EXTENSION = os.environ.get("MC_SUPPORTING_CAST_DATA_EXTENSION")
 SUPPORTING_CAST_API_TOKEN = os.environ.get("SUPPORTING_CAST_API_TOKEN")
-boto_client = boto3.client("dynamodb", region_name=settings.AWS_DEFAULT_REGION)
+SUPPORTING_CAST_API_URL = "https://api.supportingcast.fm/v1"
+token_store = MarketingCloudTokenStore(REFRESH_TOKEN_TABLE)
+
+# A token closer than this many seconds to expiring isn't handed out while
+# another container holds the refresh lease; it's waited on instead
+TOKEN_MIN_REMAINING = 60
+
+# Lives for the whole container so warm invocations don't start new threads
+everest_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="everest"
+)
+supporting_cast_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="supporting-cast"
+)
 
 config = {
     "accountId": settings.MC_ACCOUNT_ID,
@@ -37,7 +70,7 @@ config = {
     "defaultwsdl": settings.MC_DEFAULT_WSDL,
     "soapendpoint": settings.MC_SOAP_ENDPOINT,
     "useOAuth2Authentication": settings.USE_OAUTH2,
-    "wsdl_file_local_loc": settings.MC_WSDL_FILE_LOCAL_LOCATION,
+    "wsdl_file_local_loc": wsdl.local_location(),
 }
 
 
@@ -48,84 +81,269 @@ def failure_response(message):
     }, 400
 
 
-class MarketingCloudAuthClient:
-    @staticmethod
-    def retrieve_token_data_from_dynamo():
-        token_item = boto_client.get_item(
-            TableName=REFRESH_TOKEN_TABLE,
-            Key={"KeyName": {"S": "MarketingCloudAuthToken"}},
-        )
-        token_expiration_item = boto_client.get_item(
-            TableName=REFRESH_TOKEN_TABLE,
-            Key={"KeyName": {"S": "MarketingCloudAuthTokenExpiration"}},
-        )
+def temporary_failure_response(message):
+    """The response to a request that failed for a reason that may pass, such
+    as Salesforce login failing, so it can be retried"""
+    return {
+        "status": "failure",
+        "detail": message,
+    }, 503
 
-        try:
-            token = token_item["Item"]["KeyValue"]["S"]
-        except KeyError:
-            return {}
 
-        token_expiration = float(token_expiration_item["Item"]["KeyValue"]["N"])
+def unavailable_response(error):
+    """The response to a request that needs a dependency whose circuit
+    breaker is open (a breakers.CircuitOpenError)"""
+    return (
+        {
+            "status": "failure",
+            "detail": f"{error.dependency} is unavailable; try again later",
+        },
+        503,
+        {"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
 
-        return {
-            "oauthToken": token,
-            "internalOauthToken": token,
-            "expiresIn": token_expiration,
-        }
+
+class MarketingCloudAuthClient:
+    _lock = threading.Lock()
+    _fuel_client = None
+    _fuel_client_expiration = 0
+
+    @staticmethod
+    def retrieve_token_data_from_dynamo():
+        return token_store.get()
 
     @classmethod
-    def is_token_expired(cls, token_data):
+    def is_token_expired(cls, token_data, margin=None):
         """Checks the expiration time for the current token and, if it is set to
-        expire in less than 5 minutes, considers it 'expired' and returns
-        True"""
+        expire in less than `margin` seconds (MC_TOKEN_REFRESH_MARGIN by
+        default), considers it 'expired' and returns True"""
+        if margin is None:
+            margin = settings.MC_TOKEN_REFRESH_MARGIN
+
         if not token_data:
             return True
 
-        if (token_data["expiresIn"] - time.time()) < 300:
+        if (token_data["expiresIn"] - time.time()) < margin:
             return True
 
     @classmethod
     def instantiate_client(cls):
-        token_data = cls.retrieve_token_data_from_dynamo()
-
-        if cls.is_token_expired(token_data):
-            fuel_client = FuelSDK.ET_Client(False, False, config)
-            boto_client.put_item(
-                TableName=REFRESH_TOKEN_TABLE,
-                Item={
-                    "KeyName": {"S": "MarketingCloudAuthToken"},
-                    "KeyValue": {"S": fuel_client.authToken},
-                },
-            )
-            boto_client.put_item(
-                TableName=REFRESH_TOKEN_TABLE,
-                Item={
-                    "KeyName": {"S": "MarketingCloudAuthTokenExpiration"},
-                    "KeyValue": {"N": str(fuel_client.authTokenExpiration)},
-                },
-            )
+        """Returns a FuelSDK client with a valid token. The client is kept for
+        as long as the container is warm and its token is valid, so DynamoDB
+        (the token store shared by all containers) is only read when the
+        token is close to expiring."""
+        with cls._lock:
+            if cls._fuel_client and not cls.is_token_expired(
+                {"expiresIn": cls._fuel_client_expiration}
+            ):
+                metrics.increment("mc_client.hit")
+                return cls._fuel_client
+
+            metrics.increment("mc_client.miss")
+            token_data = cls.retrieve_token_data_from_dynamo()
+            fuel_client, token_data = cls._refresh_token(token_data)
+            if fuel_client:
+                expiration = fuel_client.authTokenExpiration
+            elif cls._fuel_client:
+                # Another container refreshed the token; swap it into the
+                # existing client rather than parsing the WSDL again
+                fuel_client = cls._fuel_client
+                cls._set_client_token(fuel_client, token_data)
+                expiration = token_data["expiresIn"]
+            else:
+                fuel_client = cls._client_from_token(token_data)
+                expiration = token_data["expiresIn"]
+
+            cls._fuel_client = fuel_client
+            cls._fuel_client_expiration = float(expiration)
             return fuel_client
 
+    @classmethod
+    def prewarm(cls):
+        """Refreshes the shared token ahead of the request path, once it
+        expires within MC_TOKEN_PREWARM_MARGIN seconds. Returns whether this
+        call refreshed it."""
+        with cls._lock:
+            fuel_client, _ = cls._refresh_token(
+                cls.retrieve_token_data_from_dynamo(),
+                settings.MC_TOKEN_PREWARM_MARGIN,
+            )
+            if fuel_client:
+                cls._fuel_client = fuel_client
+                cls._fuel_client_expiration = float(fuel_client.authTokenExpiration)
+            return fuel_client is not None
+
+    @classmethod
+    def _refresh_token(cls, token_data, margin=None):
+        """Refreshes the shared token if it expires within `margin` seconds.
+        Only the container holding the refresh lease asks Marketing Cloud for
+        a new token, once it has re-read the token and found it still
+        expiring; the others keep using the current one while it is still
+        valid, or wait for the new one.
+
+        Returns (fuel_client, None) if this container refreshed the token, or
+        (None, token_data) with the token to use otherwise."""
+        lease_deadline = time.time() + settings.MC_TOKEN_LEASE_TTL
+        while cls.is_token_expired(token_data, margin):
+            lease = token_store.acquire_lease(settings.MC_TOKEN_LEASE_TTL)
+            if lease:
+                try:
+                    # Another container may have refreshed the token, and
+                    # released the lease, since token_data was read
+                    token_data = cls.retrieve_token_data_from_dynamo()
+                    if not cls.is_token_expired(token_data, margin):
+                        metrics.increment("mc_token.refreshed_elsewhere")
+                        break
+                    return cls._new_client(token_data), None
+                finally:
+                    token_store.release_lease(lease)
+
+            if not cls.is_token_expired(token_data, TOKEN_MIN_REMAINING):
+                metrics.increment("mc_token.lease_held")
+                break
+            if time.time() > lease_deadline:
+                return cls._new_client(token_data), None
+
+            # The token has run out and another container is refreshing it
+            time.sleep(0.2)
+            token_data = cls.retrieve_token_data_from_dynamo()
+        return None, token_data
+
+    @staticmethod
+    def _new_client(token_data):
+        metrics.increment("mc_token.refresh")
+        wsdl.install_snapshot()
+        fuel_client = FuelSDK.ET_Client(False, False, config)
+        # If another container refreshed the token at the same time, its
+        # token is kept in DynamoDB; both tokens are valid
+        token_store.put(
+            {
+                "oauthToken": fuel_client.authToken,
+                "expiresIn": fuel_client.authTokenExpiration,
+                "soapEndpoint": fuel_client.soap_endpoint,
+                "baseApiUrl": fuel_client.base_api_url,
+            },
+            token_data.get("version", 0),
+        )
+        return fuel_client
+
+    @staticmethod
+    def _client_from_token(token_data):
         jwt_token = jwt.encode(
-            {"request": {"user": {**token_data}}},
+            {
+                "request": {
+                    "user": {
+                        "oauthToken": token_data["oauthToken"],
+                        "internalOauthToken": token_data["internalOauthToken"],
+                        "expiresIn": token_data["expiresIn"],
+                    }
+                }
+            },
             "none",
         )
+        # The stored instance URLs save FuelSDK looking up the SOAP endpoint
+        # over HTTP
+        instance_urls = {
+            "soapendpoint": token_data.get("soapEndpoint"),
+            "baseapiurl": token_data.get("baseApiUrl"),
+        }
+        wsdl.install_snapshot()
+        return FuelSDK.ET_Client(
+            False,
+            False,
+            {
+                "jwt": jwt_token,
+                **config,
+                **{key: url for key, url in instance_urls.items() if url},
+            },
+        )
+
+    @staticmethod
+    def _set_client_token(fuel_client, token_data):
+        """Points an existing FuelSDK client, and the SOAP client it has already
+        built from the WSDL, at a new OAuth2 token"""
+        from suds.sax.element import Element
 
-        return FuelSDK.ET_Client(False, False, {"jwt": jwt_token, **config})
+        fuel_client.authToken = token_data["oauthToken"]
+        fuel_client.internalAuthToken = token_data["internalOauthToken"]
+        fuel_client.authTokenExpiration = token_data["expiresIn"]
 
+        element_oauth = Element("fueloauth", ns=("etns", "http://exacttarget.com"))
+        element_oauth.setText(fuel_client.authToken)
+        fuel_client.soap_client.set_options(soapheaders=(element_oauth))
 
-class SFClient(Salesforce):
-    def __init__(self):
-        """
-        Authenticates with SF and initializes a Salesforce object
-        """
-        session_id, instance = SalesforceLogin(
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._fuel_client = None
+            cls._fuel_client_expiration = 0
+
+
+class SalesforceSessionCache:
+    """Holds the Salesforce session id and instance for as long as the
+    container stays warm, so that each request doesn't pay for a SOAP login.
+    The session is refreshed proactively once it is within
+    SF_SESSION_REFRESH_MARGIN seconds of SF_SESSION_TTL."""
+
+    _lock = threading.Lock()
+    session_id = None
+    instance = None
+    expires_at = 0
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if (
+                cls.session_id
+                and cls.expires_at - time.time() > settings.SF_SESSION_REFRESH_MARGIN
+            ):
+                metrics.increment("sf_session.hit")
+                return cls.session_id, cls.instance
+
+            metrics.increment("sf_session.miss")
+            return cls._login()
+
+    @classmethod
+    def refresh(cls, stale_session_id):
+        """Replaces a session that Salesforce rejected. If another caller has
+        already replaced it, the newer session is returned without logging in
+        again."""
+        with cls._lock:
+            if cls.session_id and cls.session_id != stale_session_id:
+                return cls.session_id, cls.instance
+
+            metrics.increment("sf_session.refresh")
+            return cls._login()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.session_id = None
+            cls.instance = None
+            cls.expires_at = 0
+
+    @classmethod
+    def _login(cls):
+        session_id, instance = simple_salesforce.SalesforceLogin(
             username=settings.SF_USERNAME,
             password=settings.SF_PASS,
             security_token=settings.SF_SECURITY_TOKEN,
             domain=settings.SF_DOMAIN,
+            session=outbound.session("salesforce"),
         )
-        super().__init__(instance=instance, session_id=session_id)
+        cls.session_id = session_id
+        cls.instance = instance
+        cls.expires_at = time.time() + settings.SF_SESSION_TTL
+        return session_id, instance
+
+
+def salesforce_client():
+    """Creates a marketing_cloud_proxy.salesforce.SalesforceClient, which is
+    only imported (along with simple_salesforce) when the first client is
+    created"""
+    from marketing_cloud_proxy.salesforce import SalesforceClient
+
+    return SalesforceClient()
 
 
 class EmailSignupRequestHandler:
@@ -166,87 +384,198 @@ class EmailSignupRequestHandler:
         except (BadRequestKeyError, KeyError):
             raise InvalidDataError("Requires both an email and a list")
 
+    def to_payload(self):
+        """Returns the signup as a dict that can be queued and turned back into
+        a handler with `from_payload`"""
+        return {
+            "email": self.email,
+            "lists": self.lists,
+            "source": self.source,
+            "first_name": getattr(self, "first_name", None),
+            "last_name": getattr(self, "last_name", None),
+        }
+
+    @classmethod
+    def from_payload(cls, payload):
+        handler = cls.__new__(cls)
+        handler.email = payload["email"]
+        handler.lists = payload["lists"]
+        handler.source = payload.get("source", "")
+        handler.first_name = payload.get("first_name")
+        handler.last_name = payload.get("last_name")
+        return handler
+
     def is_email_syntactically_valid(self):
         return bool(re.match(r"[^@]+@[^@]+\.[^@]+", self.email))
 
-    def check_email_validity(self):
+    def _fetch_email_validity(self):
+        """Returns the (status, name) verdict for the email, e.g.
+        ("valid", "Valid") or ("invalid", "Domain Invalid"), or (None, None) if
+        there is no verdict"""
+        return validity.check_email_validity(self.email) or (None, None)
+
+    def _start_validity_check(self):
+        """Starts the Everest check, returning a future for its verdict"""
+        return everest_executor.submit(self._fetch_email_validity)
+
+    def _await_email_validity(self, validity_check, deadline):
         try:
-            headers = {}
-            headers["X-API-KEY"] = os.environ.get("EVEREST_API_KEY")
-            response = requests.get(
-                f"https://api.everest.validity.com/api/2.0/validation/address/{self.email}",
-                headers=headers,
+            self.validity_status, self.validity_name = validity_check.result(
+                timeout=max(0, deadline - time.time())
+            )
+        except concurrent.futures.TimeoutError:
+            metrics.increment("everest.timeout")
+            print(
+                f"Everest API did not respond within {settings.EVEREST_TIMEOUT}s"
             )
+            self.validity_status, self.validity_name = None, None
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to Everest API: {e}")
+    def _new_contact_fields(self):
+        """The fields a Contact created for the signup is given"""
+        contact_dict = {}
 
+        # LastName is required for Contact creation
+        if getattr(self, "last_name", None):
+            contact_dict["LastName"] = self.last_name
         else:
-            try:
-                validity_response = response.json()
-                self.validity_status = validity_response["results"][
-                    "status"
-                ]  # valid/invalid
-                self.validity_name = validity_response["results"][
-                    "name"
-                ]  # e.g. Valid, Domain Invalid, etc.
-            except KeyError:
-                print("Error parsing Everest API response")
-
+            contact_dict["LastName"] = "NoLastName"
+
+        if getattr(self, "first_name", None):
+            contact_dict["FirstName"] = self.first_name
+        if getattr(self, "email", None):
+            contact_dict["Email"] = self.email
+
+        if getattr(self, "validity_status", None) and getattr(
+            self, "validity_name", None
+        ):
+            validity_value = (
+                f"{self.validity_status.title()}: {self.validity_name.title()}"
+            )
+            print(validity_value)
+            contact_dict["cfg_Email_Verification_Score__c"] = validity_value
+        return contact_dict
 
     def subscribe(self):
         """
         Checks that the email list from the request exists and subscribes the
         email from the request to the list, creating a new Salesforce "Contact"
         if one doesn't exist and creating/updating the "Subscription Member".
-        """
-        self.check_email_validity()
 
-        # Check if email is invalid based on validity status or name
-        if "invalid" in self.validity_status.lower() or "invalid" in self.validity_name.lower():     # This message is a faux subscription response; the email is quietly
-            # not forwarded to Salesforce
-            return {"status": "subscribed", "detail": "Subscription quietly updated"}
+        Concurrent duplicates of the signup share one run, and repeats within
+        IDEMPOTENCY_WINDOW get the first run's response, so a double-clicked
+        form can't create two Contacts.
+        """
+        return idempotency.single_flight(
+            idempotency.signup_key(self.email, self.lists, self.source),
+            self._subscribe,
+        )
 
+    def subscribe_or_queue(self):
+        """Subscribes the signup, unless Salesforce's circuit breaker is open:
+        it is then queued for the signup worker (with BREAKER_FALLBACK=queue)
+        or breakers.CircuitOpenError is raised. The worker calls subscribe, so
+        its signups stay on the queue instead."""
         try:
-            client = SFClient()
-        except SalesforceAuthenticationFailed as e:
-            return failure_response(e.__str__())
-
-        contacts = client.query_all(
-            format_soql(
-                """SELECT Id, LastModifiedDate from Contact WHERE Email = '{}'
-            ORDER BY LastModifiedDate, Id ASC""".format(
-                    self.email
-                )
+            return self.subscribe()
+        except breakers.CircuitOpenError as e:
+            if e.dependency != "salesforce" or settings.BREAKER_FALLBACK != "queue":
+                raise
+            metrics.increment("breaker.salesforce.queued")
+            return self.queue()
+
+    def queue(self):
+        """Queues the signup for the signup worker, unless one of its lists
+        doesn't exist: like a signup that is subscribed straight away, it is
+        then rejected. The lists can't be checked while the catalog can't be
+        loaded, and the signup is queued regardless."""
+        try:
+            with metrics.stage("list_resolve"):
+                _, unknown_lists = subscription_lists.resolve(self.lists, salesforce_client)
+        except (
+            requests.exceptions.RequestException,
+            simple_salesforce.SalesforceError,
+        ) as e:
+            print(f"Lists of queued signup could not be checked: {e}")
+            unknown_lists = []
+        if unknown_lists:
+            return failure_response(
+                "User could not be subscribed; list does not exist"
             )
-        )
+
+        with metrics.stage("queue_send"):
+            signup_queue().send(self.to_payload())
+        return {
+            "status": "accepted",
+            "detail": "Subscription request accepted",
+        }, 202
+
+    def _subscribe(self):
+        """
+        The Everest validity check runs alongside the Salesforce login and
+        Contact lookup, and is only waited on (for at most EVEREST_TIMEOUT
+        seconds in total) before anything is written.
+        """
+        # Fails fast, before Everest is called, while Salesforce is down
+        breakers.breaker("salesforce").check()
+
+        deadline = time.time() + settings.EVEREST_TIMEOUT
+        validity_check = self._start_validity_check()
 
         try:
-            # get the most recent Contact for this email, if one exists
-            contact_id = contacts["records"][-1]["Id"]
-        except IndexError:
-            contact_dict = {}
-
-            # LastName is required for Contact creation
-            if getattr(self, "last_name", None):
-                contact_dict["LastName"] = self.last_name
-            else:
-                contact_dict["LastName"] = "NoLastName"
+            with metrics.stage("sf_login"):
+                client = salesforce_client()
+        except simple_salesforce.SalesforceAuthenticationFailed as e:
+            return temporary_failure_response(e.__str__())
+
+        with metrics.stage("list_resolve"):
+            list_ids, unknown_lists = subscription_lists.resolve(
+                self.lists, lambda: client
+            )
+        if unknown_lists:
+            return failure_response(
+                "User could not be subscribed; list does not exist"
+            )
 
-            if getattr(self, "first_name", None):
-                contact_dict["FirstName"] = self.first_name
-            if getattr(self, "email", None):
-                contact_dict["Email"] = format_soql(self.email)
+        # Looked up while Everest is checking the email, unless the Contact
+        # will be found or created with one composite request afterwards
+        contact = None
+        if settings.SF_CONTACT_RESOLUTION != "external_id":
+            with metrics.stage("contact_lookup"):
+                contact = queries.CONTACT_BY_EMAIL.first(client, email=self.email)
+
+        # Only the time spent waiting on Everest after the lookups
+        with metrics.stage("everest"):
+            self._await_email_validity(validity_check, deadline)
+
+        if self.validity_status is None:
+            if settings.EVEREST_FAILURE_POLICY == "closed":
+                return temporary_failure_response(
+                    "Email address could not be verified"
+                )
+        # Check if email is invalid based on validity status or name
+        elif (
+            "invalid" in self.validity_status.lower()
+            or "invalid" in self.validity_name.lower()
+        ):
+            # This message is a faux subscription response; the email is quietly
+            # not forwarded to Salesforce
+            return {"status": "subscribed", "detail": "Subscription quietly updated"}
 
-            if getattr(self, "validity_status", None) and getattr(
-                self, "validity_name", None
-            ):
-                validity_value = (
-                    f"{self.validity_status.title()}: {self.validity_name.title()}"
+        if settings.SF_CONTACT_RESOLUTION == "external_id":
+            with metrics.stage("contact_resolve"):
+                contact_id, error = find_or_create_contact(
+                    client, self.email, self._new_contact_fields()
+                )
+            if error:
+                print(f"Contact could not be found or created: {error}")
+                return failure_response(
+                    "User could not be subscribed; error adding Contact"
                 )
-                print(validity_value)
-                contact_dict["cfg_Email_Verification_Score__c"] = validity_value
-            contact = client.Contact.create(contact_dict)
+        elif contact:
+            contact_id = contact["Id"]
+        else:
+            with metrics.stage("contact_create"):
+                contact = client.Contact.create(self._new_contact_fields())
             if contact["errors"]:
                 return failure_response(
                     "User could not be subscribed; error adding Contact"
@@ -254,74 +583,119 @@ class EmailSignupRequestHandler:
 
             contact_id = contact.get("id")
 
-        subscription = {}
-        for email_list in self.lists:
-            subscription = self._subscribe_to_each(client, email_list, contact_id)
-            if "status" not in subscription or subscription.get("status") == "failure":
-                break
-
-        return subscription
-
-    def _subscribe_to_each(self, client, email_list, contact_id):
-        canonical_email_list = client.query(
-            format_soql(
-                "SELECT Id FROM cfg_Subscription__c WHERE Name = {}",
-                "{}".format(email_list),
-            )
+        # A list named twice in the request is only written once
+        unique_list_ids = list(
+            dict.fromkeys(list_ids[email_list] for email_list in self.lists)
         )
-
-        try:
-            list_id = canonical_email_list["records"][0]["Id"]
-        except IndexError:
-            return failure_response("User could not be subscribed; list does not exist")
-
-        subscription_members = client.query_all(
-            format_soql(
-                """SELECT Id, LastModifiedDate FROM cfg_Subscription_Member__c
-               WHERE cfg_Subscription__c = '{}' AND cfg_Contact__c = '{}'
-               ORDER BY LastModifiedDate, Id ASC""".format(
-                    list_id, contact_id
+        with metrics.stage("members"):
+            try:
+                results = subscribe_contact_to_lists(
+                    client, contact_id, unique_list_ids, self.source
                 )
-            )
-        )
-
-        try:
-            # get the most recent Subscription Member, if one exists
-            sub_member_id = subscription_members["records"][-1]["Id"]
-        except IndexError:
-            new_sub = client.cfg_Subscription_Member__c.create(
+            except (
+                requests.exceptions.RequestException,
+                simple_salesforce.SalesforceError,
+            ) as e:
+                if not retries.enabled() or not retries.is_transient(e):
+                    raise
+                results = {list_id: ("failed", e) for list_id in unique_list_ids}
+
+        # Only the lists whose members couldn't be written, for a reason that
+        # may pass, are retried
+        retried = {}
+        if retries.enabled():
+            retried = {
+                list_id: error
+                for list_id, (_, error) in results.items()
+                if error and retries.is_transient(error)
+            }
+        if retried:
+            retries.schedule(
+                retries.SUBSCRIPTION_MEMBERS,
                 {
-                    "cfg_Subscription__c": list_id,
-                    "cfg_Contact__c": contact_id,
-                    "cfg_Active__c": True,
-                    "nypr_Subscription_Source__c": self.source,
-                    "cfg_Opt_In_Date__c": datetime.now(pytz.timezone("UTC")).strftime(
-                        "%Y-%m-%d"
-                    ),
-                }
+                    "contact_id": contact_id,
+                    "list_ids": list(retried),
+                    "source": self.source,
+                },
+                list(retried.values()),
             )
-            if new_sub["errors"]:
-                failure_response(
+
+        subscription = {}
+        for list_id, (action, error) in results.items():
+            if list_id in retried:
+                continue
+            if error and action == "created":
+                return failure_response(
                     "User could not be subscribed; error adding subscription member"
                 )
+            if error:
+                return failure_response("Error updating subscription")
 
-            return {"status": "subscribed", "detail": "Email successfully added"}
+            if action == "created":
+                subscription = {
+                    "status": "subscribed",
+                    "detail": "Email successfully added",
+                }
+            else:
+                subscription = {
+                    "status": "subscribed",
+                    "detail": "Subscription successfully updated",
+                }
+
+        if retried:
+            return {
+                "status": "accepted",
+                "detail": "Subscription will be retried",
+            }, 202
+        return subscription
 
-        update_sub_status = client.cfg_Subscription_Member__c.update(
-            "Id/{}".format(sub_member_id),
-            {
-                "nypr_Subscription_Source__c": self.source,
-                "cfg_Active__c": True,
-                "cfg_Opt_In_Date__c": datetime.now(pytz.timezone("UTC")).strftime(
-                    "%Y-%m-%d"
-                ),
-            },
-        )
 
-        if update_sub_status != 200:
-            failure_response("Error updating subscription")
+def create_supporting_cast_row_stub(auth_client):
+    de_row = FuelSDK.ET_DataExtension_Row()
+    de_row.CustomerKey = os.environ.get("MC_SUPPORTING_CAST_DATA_EXTENSION")
+    de_row.auth_stub = auth_client
+    return de_row
 
-        return {"status": "subscribed", "detail": "Subscription successfully updated"}
+
+class SupportingCastPlanCache:
+    """Supporting Cast plans, which almost never change, kept by plan id for
+    SUPPORTING_CAST_PLAN_TTL seconds"""
+
+    _lock = threading.Lock()
+    _plans = {}
+
+    @classmethod
+    def get(cls, plan_id, fetch):
+        plan_info = cls.cached(plan_id)
+        if plan_info is None:
+            plan_info = fetch(plan_id)
+            cls.set(plan_id, plan_info)
+        return plan_info
+
+    @classmethod
+    def cached(cls, plan_id):
+        """Returns the cached plan, or None if it isn't cached"""
+        with cls._lock:
+            cached = cls._plans.get(plan_id)
+        if cached and cached[1] > time.time():
+            metrics.increment("sc_plan.hit")
+            return cached[0]
+        metrics.increment("sc_plan.miss")
+
+    @classmethod
+    def set(cls, plan_id, plan_info):
+        # Error responses aren't cached
+        if "name" in plan_info:
+            with cls._lock:
+                cls._plans[plan_id] = (
+                    plan_info,
+                    time.time() + settings.SUPPORTING_CAST_PLAN_TTL,
+                )
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._plans.clear()
 
 
 class SupportingCastWebhookHandler:
@@ -330,12 +704,48 @@ class SupportingCastWebhookHandler:
     MarketingCloud data extension."""
 
     def __init__(self, request):
-        self.auth_client = MarketingCloudAuthClient.instantiate_client()
-        self.de_row = self._create_data_extension_row_stub()
         self.webhook_info = self._extract_info_from_webhook_event(request)
+        self.save()
+
+    @classmethod
+    def from_webhook_info(cls, webhook_info):
+        handler = cls.__new__(cls)
+        handler.webhook_info = webhook_info
+        return handler
+
+    def save(self):
         self.response = None
 
-        self.subscribe()
+        # In async mode the row is queued for the Supporting Cast worker to
+        # write in a batch with others, as it is while Marketing Cloud's
+        # breaker is open if BREAKER_FALLBACK is "queue"
+        marketing_cloud = breakers.breaker("marketing_cloud")
+        if settings.SUPPORTING_CAST_MODE == "async" or (
+            settings.BREAKER_FALLBACK == "queue" and marketing_cloud.is_open()
+        ):
+            with metrics.stage("queue_send"):
+                supporting_cast_queue().send(self.to_row())
+            self.response = {"status": "accepted", "detail": "Webhook accepted"}, 202
+            return self.response
+
+        # A row that couldn't be sent (a timeout, a dropped connection, or
+        # Marketing Cloud's breaker being open) is retried like one that
+        # Marketing Cloud didn't save. The breaker has counted the failure
+        # by the time it is caught here.
+        try:
+            with marketing_cloud.guard():
+                with metrics.stage("mc_client"):
+                    self.auth_client = MarketingCloudAuthClient.instantiate_client()
+                    self.de_row = create_supporting_cast_row_stub(self.auth_client)
+                return self.subscribe()
+        except (
+            requests.exceptions.RequestException,
+            OSError,
+            suds_transport.TransportError,
+        ) as e:
+            if not retries.enabled():
+                raise
+            return self._retry_later(self.to_row(), e)
 
     def _extract_info_from_webhook_event(self, request):
         if not request.data:
@@ -344,9 +754,21 @@ class SupportingCastWebhookHandler:
         event_info_dict = request.get_json()
         member_id = event_info_dict["subscription"]["member_id"]
         plan_id = event_info_dict["subscription"]["plan_id"]
-        member_info_dict = self._get_member_info_from_id(member_id)
-        plan_info_dict = self._get_plan_info_from_id(plan_id)
 
+        # The member and (usually cached) plan are looked up concurrently
+        with metrics.stage("sc_lookup"):
+            member_future = supporting_cast_executor.submit(
+                self._get_member_info_from_id, member_id
+            )
+            plan_info_dict = SupportingCastPlanCache.get(
+                plan_id, self._get_plan_info_from_id
+            )
+            member_info_dict = member_future.result()
+
+        return self.webhook_info_from(event_info_dict, member_info_dict, plan_info_dict)
+
+    @staticmethod
+    def webhook_info_from(event_info_dict, member_info_dict, plan_info_dict):
         return {
             "email_address": member_info_dict["email"],
             "first_name": member_info_dict["first_name"],
@@ -355,20 +777,14 @@ class SupportingCastWebhookHandler:
             "plan_status": event_info_dict["subscription"]["status"],
         }
 
-    def _create_data_extension_row_stub(self):
-        de_row = FuelSDK.ET_DataExtension_Row()
-        de_row.CustomerKey = os.environ.get("MC_SUPPORTING_CAST_DATA_EXTENSION")
-        de_row.auth_stub = self.auth_client
-        return de_row
-
     def _get_member_info_from_id(self, id):
         """Hits SC API to get member info"""
         headers = {
             "accept": "application/json",
             "Authorization": f"Bearer {SUPPORTING_CAST_API_TOKEN}",
         }
-        response = requests.get(
-            f"https://api.supportingcast.fm/v1/memberships/id={id}", headers=headers
+        response = outbound.session("supporting_cast").get(
+            f"{SUPPORTING_CAST_API_URL}/memberships/id={id}", headers=headers
         )
         return response.json()
 
@@ -378,47 +794,43 @@ class SupportingCastWebhookHandler:
             "accept": "application/json",
             "Authorization": f"Bearer {SUPPORTING_CAST_API_TOKEN}",
         }
-        response = requests.get(
-            f"https://api.supportingcast.fm/v1/plans/{id}", headers=headers
+        response = outbound.session("supporting_cast").get(
+            f"{SUPPORTING_CAST_API_URL}/plans/{id}", headers=headers
         )
         return response.json()
 
-    def subscribe(self):
-        email_address = self.webhook_info["email_address"]
-        first_name = self.webhook_info["first_name"]
-        last_name = self.webhook_info["last_name"]
-        plan = self.webhook_info["plan"]
-        plan_status = self.webhook_info["plan_status"]
-        creation_date = datetime.now(pytz.timezone("America/New_York")).strftime(
-            "%-m/%-d/%Y %H:%M:%S %p"
-        )
-        updated_date = datetime.now(pytz.timezone("America/New_York")).strftime(
+    def to_row(self):
+        """The data extension row for the webhook. creation_date is only
+        written when the row is inserted."""
+        now = datetime.now(pytz.timezone("America/New_York")).strftime(
             "%-m/%-d/%Y %H:%M:%S %p"
         )
-
-        # First, attempt to add email to overall Master Preferences data
-        # extension
-        self.de_row.props = {
-            "email_address": email_address,
-            "creation_date": creation_date,
-        }
-        self.de_row.post()
-
-        # Then, flip the list columns to indicate they have signed up
-        self.de_row.props = {
-            "email_address": email_address,
-            "first_name": first_name,
-            "last_name": last_name,
-            "plan": plan,
-            "plan_status": plan_status,
-            "updated_date": updated_date,
+        return {
+            "email_address": self.webhook_info["email_address"],
+            "first_name": self.webhook_info["first_name"],
+            "last_name": self.webhook_info["last_name"],
+            "plan": self.webhook_info["plan"],
+            "plan_status": self.webhook_info["plan_status"],
+            "updated_date": now,
+            "creation_date": now,
         }
-        patch_response = self.de_row.patch()
 
-        self.response = {"status": "success"}
+    def subscribe(self):
+        row = self.to_row()
+        with metrics.stage("de_write"):
+            [error] = write_rows(self.de_row, [row])
+        if error and retries.enabled():
+            return self._retry_later(row, error)
+        elif error:
+            self.response = failure_response(error)
+        else:
+            self.response = {"status": "success"}
+        return self.response
 
-        if patch_response.results[0].StatusCode == "Error":
-            return {"status": "failure"}, 400
+    def _retry_later(self, row, error):
+        retries.schedule(retries.DE_ROWS, {"rows": [row]}, error)
+        self.response = {"status": "accepted", "detail": "Webhook will be retried"}, 202
+        return self.response
 
 
 class OptinmonsterWebhookHandler(EmailSignupRequestHandler):
@@ -507,12 +919,71 @@ class OptinmonsterWebhookHandler(EmailSignupRequestHandler):
 
 
 class ListRequestHandler:
+    def __init__(self):
+        self.etag = None
+        self.last_modified = None
+
     def lists_json(self):
         try:
-            client = SFClient()
-        except SalesforceAuthenticationFailed as e:
+            catalog = subscription_lists.snapshot(salesforce_client)
+        except simple_salesforce.SalesforceAuthenticationFailed as e:
             return failure_response(e.__str__())
 
-        list_records = client.query_all("SELECT Name FROM cfg_Subscription__c")
-        lists = [x["Name"] for x in list_records["records"]]
-        return {"lists": lists}
+        self.etag = catalog.etag
+        self.last_modified = catalog.changed_at
+        return {"lists": list(catalog.lists)}
+
+
+class BulkImportRequestHandler:
+    """Handles bulk subscription imports, see `marketing_cloud_proxy.bulk`.
+    Requests must carry `Authorization: Bearer <BULK_IMPORT_TOKEN>`."""
+
+    def __init__(self, request):
+        self.request = request
+
+    def is_authorized(self):
+        if not settings.BULK_IMPORT_TOKEN:
+            return False
+        return hmac.compare_digest(
+            self.request.headers.get("Authorization", ""),
+            f"Bearer {settings.BULK_IMPORT_TOKEN}",
+        )
+
+    def start_import(self):
+        try:
+            client = salesforce_client()
+        except simple_salesforce.SalesforceAuthenticationFailed as e:
+            return failure_response(e.__str__())
+
+        bulk_import = BulkImport(client, self.request.args.get("source", ""))
+        try:
+            summary = bulk_import.run(
+                self.request.stream,
+                self.request.mimetype,
+                contact_wait=settings.BULK_IMPORT_CONTACT_WAIT,
+            )
+        except TimeoutError as e:
+            # Salesforce is still running the Contact jobs, whose results can
+            # be polled with job_results
+            return {
+                "status": "failure",
+                "detail": f"{e}; Subscription Members were not imported",
+                **bulk_import.summary,
+            }, 504
+
+        return {"status": "accepted", **summary}, 202
+
+    def job_results(self, job_id, results_type):
+        """Streams the per-row results CSV of one of the import's jobs"""
+        if results_type not in RESULTS_TYPES:
+            return failure_response(f"Results type must be one of {RESULTS_TYPES}")
+
+        try:
+            client = salesforce_client()
+        except simple_salesforce.SalesforceAuthenticationFailed as e:
+            return failure_response(e.__str__())
+
+        return Response(
+            stream_with_context(stream_job_results(client, job_id, results_type)),
+            mimetype="text/csv",
+        )
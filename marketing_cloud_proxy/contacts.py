@@ -0,0 +1,51 @@
+from urllib.parse import quote
+
+from marketing_cloud_proxy import metrics, settings
+from marketing_cloud_proxy.validity import normalize_email
+
+
+def find_or_create_contact(client, email, fields):
+    """Finds the Contact whose SF_CONTACT_EXTERNAL_ID_FIELD is the normalized
+    email, or creates it with `fields`, in one composite request: a create,
+    which fails with DUPLICATE_VALUE if the Contact already exists, and a
+    read of the Contact by its external ID. Unlike an upsert, an existing
+    Contact's fields are left as they are.
+
+    Returns (contact Id, None), or (None, error) if there's neither."""
+    normalized_email = normalize_email(email)
+    sobject_url = f"/services/data/v{client.sf_version}/sobjects/Contact"
+    response = client.restful(
+        "composite",
+        method="POST",
+        json={
+            "allOrNone": False,
+            "compositeRequest": [
+                {
+                    "method": "POST",
+                    "url": sobject_url,
+                    "referenceId": "new_contact",
+                    "body": {
+                        **fields,
+                        settings.SF_CONTACT_EXTERNAL_ID_FIELD: normalized_email,
+                    },
+                },
+                {
+                    "method": "GET",
+                    "url": (
+                        f"{sobject_url}/{settings.SF_CONTACT_EXTERNAL_ID_FIELD}/"
+                        f"{quote(normalized_email, safe='')}?fields=Id"
+                    ),
+                    "referenceId": "contact",
+                },
+            ],
+        },
+    )
+    created, existing = response["compositeResponse"]
+
+    if created["httpStatusCode"] < 300:
+        metrics.increment("sf_contact.created")
+        return created["body"]["id"], None
+    if existing["httpStatusCode"] < 300:
+        metrics.increment("sf_contact.existing")
+        return existing["body"]["Id"], None
+    return None, created["body"]
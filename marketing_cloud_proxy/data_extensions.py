@@ -0,0 +1,56 @@
+import time
+
+from marketing_cloud_proxy import metrics
+
+
+def _failed(response, count):
+    """Indexes of the rows a SOAP Create/Update didn't save. The results are
+    in the order of the rows sent; rows without a result weren't saved."""
+    results = list(response.results or [])
+    return [
+        i for i in range(count) if i >= len(results) or results[i].StatusCode == "Error"
+    ]
+
+
+def write_rows(de_row, rows):
+    """Saves rows to a data extension with one SOAP Update for all of them,
+    then one Create for the rows that didn't exist yet. Each row's
+    "creation_date" is only sent with the Create, so it is only ever set when
+    the row is inserted.
+
+    Returns an error message per row, or None for the rows that were saved."""
+    errors = [None] * len(rows)
+    de_row.props = [
+        {key: value for key, value in row.items() if key != "creation_date"}
+        for row in rows
+    ]
+    missing = _failed(de_row.patch(), len(rows))
+    if not missing:
+        return errors
+
+    metrics.increment("de_row.insert", len(missing))
+    de_row.props = [rows[i] for i in missing]
+    for i in _failed(de_row.post(), len(missing)):
+        errors[missing[i]] = "Data extension row could not be saved"
+        metrics.increment("de_row.error")
+    return errors
+
+
+def collect_batch(queue, batch_size, window):
+    """Receives up to `batch_size` messages from the queue, waiting at most
+    `window` seconds after the first one for more to arrive. Returns an empty
+    list if the queue is empty."""
+    batch = []
+    deadline = None
+    while len(batch) < batch_size:
+        messages = queue.receive(min(10, batch_size - len(batch)))
+        if messages:
+            batch.extend(messages)
+            deadline = deadline or time.time() + window
+        elif deadline is None:
+            break
+        if time.time() >= deadline:
+            break
+        if not messages:
+            time.sleep(0.1)
+    return batch
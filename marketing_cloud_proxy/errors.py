@@ -10,3 +10,11 @@ class NoDataProvidedError(Error):
 
 class InvalidDataError(Error):
     pass
+
+
+class TemporaryFailureError(Error):
+    pass
+
+
+class ConfigurationError(Error):
+    pass
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+from marketing_cloud_proxy import metrics, settings
+from marketing_cloud_proxy.lazy import LazyModule
+from marketing_cloud_proxy.validity import normalize_email
+
+boto3 = LazyModule("boto3")
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+def signup_key(email, lists, source):
+    """Identifies a signup by its normalized email, lists (in any order) and
+    source"""
+    signup = json.dumps([normalize_email(email), sorted(lists), source or ""])
+    return hashlib.sha256(signup.encode("utf-8")).hexdigest()
+
+
+class DynamoIdempotencyStore:
+    """Signup locks and results shared by every container, in a DynamoDB table
+    with an "IdempotencyKey" hash key and an "ExpiresAt" TTL attribute"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self._dynamo = boto3.client("dynamodb", region_name=settings.AWS_DEFAULT_REGION)
+
+    def acquire(self, key, ttl):
+        """Takes the lock for `key` unless someone else holds an unexpired lock
+        or result for it. Returns whether the lock was taken."""
+        now = time.time()
+        try:
+            self._dynamo.put_item(
+                TableName=self.table_name,
+                Item={
+                    "IdempotencyKey": {"S": key},
+                    "State": {"S": IN_PROGRESS},
+                    "ExpiresAt": {"N": str(now + ttl)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(IdempotencyKey) OR ExpiresAt < :now"
+                ),
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except self._dynamo.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def get(self, key):
+        """Returns the unexpired (state, result) for `key`, or None"""
+        item = self._dynamo.get_item(
+            TableName=self.table_name,
+            Key={"IdempotencyKey": {"S": key}},
+            ConsistentRead=True,
+        ).get("Item")
+        if not item or float(item["ExpiresAt"]["N"]) < time.time():
+            return None
+
+        result = item.get("Result")
+        return item["State"]["S"], result and json.loads(result["S"])
+
+    def complete(self, key, result, ttl):
+        self._dynamo.put_item(
+            TableName=self.table_name,
+            Item={
+                "IdempotencyKey": {"S": key},
+                "State": {"S": DONE},
+                "Result": {"S": json.dumps(result)},
+                "ExpiresAt": {"N": str(time.time() + ttl)},
+            },
+        )
+
+    def release(self, key):
+        self._dynamo.delete_item(
+            TableName=self.table_name, Key={"IdempotencyKey": {"S": key}}
+        )
+
+
+class LocalIdempotencyStore:
+    """In-process stand-in for DynamoIdempotencyStore, used when
+    IDEMPOTENCY_TABLE isn't set. Only de-duplicates within one container."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def acquire(self, key, ttl):
+        with self._lock:
+            if self.get(key):
+                return False
+            self._items[key] = (IN_PROGRESS, None, time.time() + ttl)
+            return True
+
+    def get(self, key):
+        item = self._items.get(key)
+        if not item or item[2] < time.time():
+            return None
+        return item[0], item[1]
+
+    def complete(self, key, result, ttl):
+        with self._lock:
+            self._items[key] = (DONE, result, time.time() + ttl)
+
+    def release(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+local_store = LocalIdempotencyStore()
+_dynamo_stores = {}
+
+
+def get_store():
+    if not settings.IDEMPOTENCY_TABLE:
+        return local_store
+    if settings.IDEMPOTENCY_TABLE not in _dynamo_stores:
+        _dynamo_stores[settings.IDEMPOTENCY_TABLE] = DynamoIdempotencyStore(
+            settings.IDEMPOTENCY_TABLE
+        )
+    return _dynamo_stores[settings.IDEMPOTENCY_TABLE]
+
+
+def _to_record(response):
+    if isinstance(response, tuple):
+        return {"body": response[0], "status": response[1]}
+    return {"body": response, "status": 200}
+
+
+def _from_record(record):
+    if record["status"] == 200:
+        return record["body"]
+    return record["body"], record["status"]
+
+
+# Futures for the signups this container is currently running, so that
+# concurrent duplicates within the container wait on the same call
+_in_flight_lock = threading.Lock()
+_in_flight = {}
+
+
+def single_flight(key, fn):
+    """Runs `fn` once for concurrent calls with the same key and returns its
+    response to all of them. Successful responses are replayed for repeat
+    calls for IDEMPOTENCY_WINDOW seconds; failures are not, so they can be
+    retried."""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+
+    if not leader:
+        metrics.increment("idempotency.shared")
+        return future.result()
+
+    try:
+        response = _run_once(get_store(), key, fn)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(response)
+        return response
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def _run_once(store, key, fn):
+    deadline = time.time() + settings.IDEMPOTENCY_LOCK_TTL
+    while True:
+        existing = store.get(key)
+        if existing and existing[0] == DONE:
+            metrics.increment("idempotency.replayed")
+            return _from_record(existing[1])
+
+        if not existing and store.acquire(key, settings.IDEMPOTENCY_LOCK_TTL):
+            break
+
+        # Another container is running this signup; wait for its result
+        if time.time() > deadline:
+            metrics.increment("idempotency.conflict")
+            return {
+                "status": "failure",
+                "detail": "This subscription is already being processed",
+            }, 409
+        time.sleep(0.1)
+
+    try:
+        response = fn()
+    except Exception:
+        store.release(key)
+        raise
+
+    record = _to_record(response)
+    if record["status"] < 300:
+        store.complete(key, record, settings.IDEMPOTENCY_WINDOW)
+    else:
+        store.release(key)
+    return response
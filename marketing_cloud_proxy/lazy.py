@@ -0,0 +1,16 @@
+import importlib
+
+
+class LazyModule:
+    """Stands in for a module that is only imported when one of its attributes
+    is first used, so that cold starts only pay for the heavy dependencies
+    (FuelSDK, simple_salesforce, boto3, ...) of the routes that are called"""
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self.__name!r}>"
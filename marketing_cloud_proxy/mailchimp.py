@@ -1,8 +1,7 @@
 import json
 import re
 
-import requests
-
+from marketing_cloud_proxy import metrics, outbound
 from marketing_cloud_proxy.settings import MAILCHIMP_PROXY_ENDPOINT
 
 mailchimp_id_to_marketingcloud_list = {
@@ -49,19 +48,26 @@ class MailchimpForwarder:
         return mailchimp_id_to_marketingcloud_list.get(self.email_list)
 
     def proxy_to_mailchimp(self):
-        res = requests.post(
-            MAILCHIMP_PROXY_ENDPOINT,
-            json={"list": self.email_list, "email": self.email_address},
-        )
-        if res.ok:
+        with metrics.stage("mailchimp_proxy"):
+            res = outbound.session("mailchimp").post(
+                MAILCHIMP_PROXY_ENDPOINT, json=self.proxy_payload()
+            )
+        return self.proxied_response(res.ok, res.content, res.status_code)
+
+    def proxy_payload(self):
+        return {"list": self.email_list, "email": self.email_address}
+
+    @staticmethod
+    def proxied_response(ok, content, status_code):
+        if ok:
             return {
-                **json.loads(res.content),
+                **json.loads(content),
                 "additional_detail": "proxied",
                 "detail": "Email successfully added"}
         return {
-            **json.loads(res.content),
+            **json.loads(content),
             "additional_detail": "proxied",
-        }, res.status_code
+        }, status_code
 
     def to_marketing_cloud_list(self):
         return mailchimp_id_to_marketingcloud_list[self.email_list]
@@ -0,0 +1,221 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from marketing_cloud_proxy import settings
+from marketing_cloud_proxy.lazy import LazyModule
+
+sentry_sdk = LazyModule("sentry_sdk")
+
+# Process-level counters and histograms. In Lambda these live for as long as
+# the container stays warm, so they describe the behavior of a single
+# container rather than the whole fleet.
+_lock = threading.Lock()
+_counters = Counter()
+_histograms = {}
+
+# The counter values as of the last EMF line they were logged in, and the
+# histograms' observations since then (other than stage timings, which are
+# logged with their request)
+_logged_counters = Counter()
+_unlogged_observations = {}
+
+# EMF takes at most 100 values per metric in a line; observations beyond that
+# are left out of the next line, but still counted in the histogram
+MAX_LOGGED_OBSERVATIONS = 100
+
+# Upper bounds (in milliseconds) of the latency histogram buckets; anything
+# slower lands in a final overflow bucket
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# The stage timings of the request being handled, see request_stages
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value_ms):
+    with _lock:
+        histogram = _histograms.setdefault(
+            name,
+            {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum": 0},
+        )
+        histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        histogram["count"] += 1
+        histogram["sum"] += value_ms
+        if not name.startswith("stage."):
+            unlogged = _unlogged_observations.setdefault(name, [])
+            if len(unlogged) < MAX_LOGGED_OBSERVATIONS:
+                unlogged.append(round(value_ms, 3))
+
+
+def counters():
+    """Returns a snapshot of every counter recorded in this process"""
+    with _lock:
+        return dict(_counters)
+
+
+def histograms():
+    """Returns a snapshot of every histogram recorded in this process"""
+    with _lock:
+        return {
+            name: {**histogram, "buckets": list(histogram["buckets"])}
+            for name, histogram in _histograms.items()
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _logged_counters.clear()
+        _unlogged_observations.clear()
+
+
+def _unlogged_metric_sets():
+    """The metric sets for log_metric_sets with how much each counter has
+    grown since it was last logged, and the histograms' observations since
+    then (e.g. outbound.latency.<host>), marking them as logged"""
+    with _lock:
+        deltas = {
+            name: value - _logged_counters[name]
+            for name, value in _counters.items()
+            if value != _logged_counters[name]
+        }
+        _logged_counters.update(deltas)
+        observations = dict(_unlogged_observations)
+        _unlogged_observations.clear()
+
+    metric_sets = []
+    if deltas:
+        metric_sets.append(({}, deltas, "Count"))
+    if observations:
+        metric_sets.append(({}, observations, "Milliseconds"))
+    return metric_sets
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a stage of handling a request (e.g. "sf_login"). The time is
+    observed as the `stage.<name>` histogram, added to the request's stage
+    log line (see request_stages) and, when Sentry is set up, traced as a
+    span of the request's transaction."""
+    span = (
+        sentry_sdk.start_span(op="stage", description=name)
+        if settings.SENTRY_DSN
+        else contextlib.nullcontext()
+    )
+    started = time.perf_counter()
+    try:
+        with span:
+            yield
+    finally:
+        value_ms = (time.perf_counter() - started) * 1000
+        observe(f"stage.{name}", value_ms)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0) + value_ms
+
+
+def start_request():
+    """Starts collecting the stage timings of a request. Returns a token for
+    finish_request."""
+    return _request_stages.set({}), time.perf_counter()
+
+
+def finish_request(token, operation, **properties):
+    """Prints the timings of the request's stages, and its total time, as one
+    CloudWatch Embedded Metric Format log line, which CloudWatch turns into
+    metrics (with p50/p95/p99 statistics) per operation and stage. Only
+    STAGE_METRICS_SAMPLE_RATE of requests are logged.
+
+    The line also carries how much each counter (cache hits and misses,
+    Everest calls, outbound retries, ...) has grown since the last logged
+    line, as Count metrics, and the latencies observed since then (outbound
+    calls per host, SOQL queries) as lists of values, all without dimensions
+    so that CloudWatch aggregates them across containers."""
+    context_token, started = token
+    stages = _request_stages.get()
+    _request_stages.reset(context_token)
+    if not stages or random.random() >= settings.STAGE_METRICS_SAMPLE_RATE:
+        return
+
+    values = {f"{name}_ms": round(ms, 3) for name, ms in stages.items()}
+    values["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    log_metric_sets(
+        [({"Operation": operation}, values, "Milliseconds")]
+        + _unlogged_metric_sets(),
+        **properties,
+    )
+
+
+def flush(**properties):
+    """Logs the counters' growth and the latencies observed since the last
+    logged line, for entry points that don't handle requests (the Supporting
+    Cast and write retry workers, the pre-warm)"""
+    metric_sets = _unlogged_metric_sets()
+    if metric_sets:
+        log_metric_sets(metric_sets, **properties)
+
+
+@contextlib.contextmanager
+def flushing(**properties):
+    """Flushes the counters and latencies once the block has run"""
+    try:
+        yield
+    finally:
+        flush(**properties)
+
+
+def log_metrics(dimensions, values, unit, **properties):
+    """Prints the values as one CloudWatch Embedded Metric Format log line, as
+    metrics in STAGE_METRICS_NAMESPACE with the given dimensions"""
+    log_metric_sets([(dimensions, values, unit)], **properties)
+
+
+def log_metric_sets(metric_sets, **properties):
+    """Prints one CloudWatch Embedded Metric Format log line for several
+    (dimensions, values, unit) sets of metrics"""
+    line = {}
+    directives = []
+    for dimensions, values, unit in metric_sets:
+        directives.append(
+            {
+                "Namespace": settings.STAGE_METRICS_NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name in values],
+            }
+        )
+        line.update(dimensions)
+        line.update(values)
+    print(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": directives,
+                },
+                **line,
+                **properties,
+            }
+        )
+    )
+
+
+@contextlib.contextmanager
+def request_stages(operation, **properties):
+    """Collects the stages timed within the block as one request, see
+    finish_request"""
+    token = start_request()
+    try:
+        yield
+    finally:
+        finish_request(token, operation, **properties)
@@ -0,0 +1,100 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from marketing_cloud_proxy import breakers, metrics, settings
+
+# Seconds to wait on each integration's connect and read
+TIMEOUTS = {
+    "everest": settings.EVEREST_TIMEOUT,
+    "mailchimp": settings.MAILCHIMP_TIMEOUT,
+    "salesforce": settings.SALESFORCE_TIMEOUT,
+    "supporting_cast": settings.SUPPORTING_CAST_TIMEOUT,
+}
+
+
+class JitteredRetry(Retry):
+    """Exponential backoff with full jitter, so that containers retrying the
+    same failing host don't do it in lockstep"""
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ):
+        # Raises once the retries are used up, so only retries are counted
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if _pool:
+            metrics.increment(f"outbound.retry.{_pool.host}")
+        return retry
+
+
+class OutboundSession(requests.Session):
+    """A requests session for one integration. Connections are pooled per host
+    and kept alive for as long as the container is warm, every request gets
+    the integration's timeout unless one is given, each request's latency is
+    recorded in the outbound.latency.<host> histogram and each retry in the
+    outbound.retry.<host> counter. Requests are
+    guarded by the integration's circuit breaker (see breakers), and raise
+    breakers.CircuitOpenError while it is open."""
+
+    def __init__(self, integration):
+        super().__init__()
+        self.integration = integration
+
+        retry = JitteredRetry(
+            total=settings.OUTBOUND_MAX_RETRIES,
+            backoff_factor=0.1,
+            status_forcelist=(429, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=settings.OUTBOUND_POOL_SIZE,
+            max_retries=retry,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", TIMEOUTS.get(self.integration))
+
+        breaker = breakers.breaker(self.integration)
+        breaker.acquire()
+        failed = True
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = breakers.is_failure_status(response.status_code)
+            return response
+        finally:
+            breaker.release(failed)
+            metrics.observe(
+                f"outbound.latency.{urlsplit(url).hostname}",
+                (time.perf_counter() - started) * 1000,
+            )
+
+
+_lock = threading.Lock()
+_sessions = {}
+
+
+def session(integration):
+    """Returns the container-wide session for an integration, e.g. "everest",
+    "mailchimp", "salesforce" or "supporting_cast"."""
+    with _lock:
+        if integration not in _sessions:
+            _sessions[integration] = OutboundSession(integration)
+        return _sessions[integration]
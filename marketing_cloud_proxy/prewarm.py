@@ -0,0 +1,25 @@
+import requests
+
+from marketing_cloud_proxy import metrics, wsdl
+from marketing_cloud_proxy.client import MarketingCloudAuthClient
+
+
+def handler(event, context):
+    """Scheduled entry point (e.g. an EventBridge rule every 5 minutes) that
+    refreshes the shared Marketing Cloud token before it gets close enough to
+    expiring for the request path to refresh it. Also reports whether the
+    vendored WSDL snapshot still matches the live WSDL."""
+    with metrics.flushing(Operation="prewarm"):
+        refreshed = MarketingCloudAuthClient.prewarm()
+        print(f"Marketing Cloud token {'refreshed' if refreshed else 'still valid'}")
+
+        wsdl_current = None
+        if wsdl.read_metadata():
+            try:
+                wsdl_current = wsdl.check_snapshot()
+            except requests.RequestException as e:
+                print(f"Error checking the Marketing Cloud WSDL: {e}")
+            if wsdl_current is False:
+                metrics.increment("mc_wsdl.stale")
+                print("The vendored Marketing Cloud WSDL snapshot is stale")
+    return {"refreshed": refreshed, "wsdl_current": wsdl_current}
@@ -0,0 +1,95 @@
+"""
+The SOQL queries the proxy runs, as named, parameterized queries.
+
+Each query's template is parsed once, when this module is imported; running
+it only quotes the parameter values (with simple_salesforce's SOQL quoting,
+so emails with quotes or braces are safe) and joins them with the literal
+parts. Every run is timed as the `soql.<name>` metric.
+"""
+import string
+import time
+
+from marketing_cloud_proxy import metrics
+from marketing_cloud_proxy.lazy import LazyModule
+
+simple_salesforce = LazyModule("simple_salesforce")
+
+
+class PreparedQuery:
+    """A SOQL template with {name} placeholders for its parameters"""
+
+    def __init__(self, name, soql):
+        self.name = name
+        self.soql = " ".join(soql.split())
+        self._parts = [
+            (literal, field)
+            for literal, field, _, _ in string.Formatter().parse(self.soql)
+        ]
+        self.params = {field for _, field in self._parts if field}
+
+    def render(self, **params):
+        if set(params) != self.params:
+            raise TypeError(
+                f"{self.name} takes {sorted(self.params)}, not {sorted(params)}"
+            )
+        quote = simple_salesforce.format.quote_soql_value
+        return "".join(
+            literal + (quote(params[field]) if field else "")
+            for literal, field in self._parts
+        )
+
+    def all(self, client, **params):
+        """Returns every matching record"""
+        return self._run(client.query_all, params)["records"]
+
+    def first(self, client, **params):
+        """Returns the first matching record, or None. The query is expected to
+        have its own ORDER BY and LIMIT 1."""
+        records = self._run(client.query, params)["records"]
+        return records[0] if records else None
+
+    def _run(self, query, params):
+        soql = self.render(**params)
+        started = time.perf_counter()
+        try:
+            return query(soql)
+        finally:
+            metrics.observe(
+                f"soql.{self.name}", (time.perf_counter() - started) * 1000
+            )
+
+
+# The most recently modified Contact with the email
+CONTACT_BY_EMAIL = PreparedQuery(
+    "contact_by_email",
+    """SELECT Id FROM Contact WHERE Email = {email}
+    ORDER BY LastModifiedDate DESC, Id DESC LIMIT 1""",
+)
+
+# Every subscription list, for the list catalog
+SUBSCRIPTION_LISTS = PreparedQuery(
+    "subscription_lists", "SELECT Id, Name FROM cfg_Subscription__c"
+)
+
+# A Contact's Subscription Members on any of the lists, oldest first
+MEMBERS_BY_CONTACT_AND_LISTS = PreparedQuery(
+    "members_by_contact_and_lists",
+    """SELECT Id, cfg_Subscription__c FROM cfg_Subscription_Member__c
+    WHERE cfg_Contact__c = {contact_id} AND cfg_Subscription__c IN {list_ids}
+    ORDER BY LastModifiedDate, Id ASC""",
+)
+
+# The Contacts with any of the emails, oldest first (for bulk imports)
+CONTACTS_BY_EMAILS = PreparedQuery(
+    "contacts_by_emails",
+    """SELECT Id, Email FROM Contact WHERE Email IN {emails}
+    ORDER BY LastModifiedDate, Id ASC""",
+)
+
+# Any of the Contacts' Subscription Members, oldest first (for bulk imports)
+MEMBERS_BY_CONTACTS = PreparedQuery(
+    "members_by_contacts",
+    """SELECT Id, cfg_Contact__c, cfg_Subscription__c
+    FROM cfg_Subscription_Member__c WHERE cfg_Contact__c IN {contact_ids}
+    ORDER BY LastModifiedDate, Id ASC""",
+)
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from marketing_cloud_proxy import settings
+from marketing_cloud_proxy.lazy import LazyModule
+
+boto3 = LazyModule("boto3")
+
+
+class SQSQueue:
+    """Durable queue backed by SQS"""
+
+    def __init__(self, url):
+        self.url = url
+        self._sqs = boto3.client("sqs", region_name=settings.AWS_DEFAULT_REGION)
+
+    def send(self, payload, delay=0):
+        """Sends a message, which is only received after `delay` seconds (at
+        most 15 minutes)"""
+        self._sqs.send_message(
+            QueueUrl=self.url,
+            MessageBody=json.dumps(payload),
+            DelaySeconds=min(int(delay), 900),
+        )
+
+    def receive(self, max_messages=10):
+        """Returns up to `max_messages` (receipt, payload) pairs. Messages that
+        aren't deleted become visible again after the queue's visibility
+        timeout."""
+        response = self._sqs.receive_message(
+            QueueUrl=self.url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=0,
+        )
+        return [
+            (message["ReceiptHandle"], json.loads(message["Body"]))
+            for message in response.get("Messages", [])
+        ]
+
+    def delete(self, receipts):
+        for i in range(0, len(receipts), 10):
+            self._sqs.delete_message_batch(
+                QueueUrl=self.url,
+                Entries=[
+                    {"Id": str(n), "ReceiptHandle": receipt}
+                    for n, receipt in enumerate(receipts[i : i + 10])
+                ],
+            )
+
+
+class SQLiteQueue:
+    """Local stand-in for SQS, for development and tests. Messages live in a
+    SQLite file and follow the same receive/delete/visibility semantics."""
+
+    def __init__(self, path, visibility_timeout=30):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        with self._transaction() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    body TEXT NOT NULL,
+                    visible_at REAL NOT NULL
+                )"""
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            db = sqlite3.connect(self.path, timeout=10)
+            try:
+                with db:
+                    yield db
+            finally:
+                db.close()
+
+    def send(self, payload, delay=0):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO messages (body, visible_at) VALUES (?, ?)",
+                (json.dumps(payload), time.time() + delay),
+            )
+
+    def receive(self, max_messages=10):
+        now = time.time()
+        with self._transaction() as db:
+            rows = db.execute(
+                """SELECT id, body FROM messages WHERE visible_at <= ?
+                ORDER BY id LIMIT ?""",
+                (now, max_messages),
+            ).fetchall()
+            db.executemany(
+                "UPDATE messages SET visible_at = ? WHERE id = ?",
+                [(now + self.visibility_timeout, row[0]) for row in rows],
+            )
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def delete(self, receipts):
+        with self._transaction() as db:
+            db.executemany(
+                "DELETE FROM messages WHERE id = ?", [(r,) for r in receipts]
+            )
+
+
+def get_queue(url):
+    """Returns the queue for an SQS queue URL or a sqlite:///path URL"""
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///"):])
+    return SQSQueue(url)
+
+
+_queues = {}
+
+
+def _cached_queue(url):
+    if url not in _queues:
+        _queues[url] = get_queue(url)
+    return _queues[url]
+
+
+def signup_queue():
+    return _cached_queue(settings.SIGNUP_QUEUE_URL)
+
+
+def supporting_cast_queue():
+    return _cached_queue(settings.SUPPORTING_CAST_QUEUE_URL)
+
+
+def write_retry_queue():
+    return _cached_queue(settings.WRITE_RETRY_QUEUE_URL)
+
+
+def dead_letter_queue():
+    return _cached_queue(settings.WRITE_RETRY_DEAD_LETTER_URL)
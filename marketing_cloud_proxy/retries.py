@@ -0,0 +1,108 @@
+"""
+Failed Salesforce and Marketing Cloud writes, kept on a durable queue to be
+retried by the write retry worker (worker.retry_handler).
+
+Only the step that failed is retried: a signup whose Subscription Member
+creates or updates failed is retried for just those lists of its Contact (see
+subscribe_contact_to_lists), and a Supporting Cast webhook whose data
+extension row wasn't saved is retried for just that row. Retries are
+scheduled with exponential backoff, and a write that has failed
+WRITE_RETRY_MAX_ATTEMPTS times is moved to the dead-letter queue instead.
+
+Retries are off unless WRITE_RETRY_QUEUE_URL is set; failed writes are then
+reported to the caller as they happen.
+"""
+import random
+import time
+
+import requests
+
+from marketing_cloud_proxy import breakers, metrics, settings
+from marketing_cloud_proxy.queues import dead_letter_queue, write_retry_queue
+
+SUBSCRIPTION_MEMBERS = "subscription_members"
+DE_ROWS = "de_rows"
+
+# The dependency each kind of write goes to
+DEPENDENCIES = {SUBSCRIPTION_MEMBERS: "salesforce", DE_ROWS: "marketing_cloud"}
+
+# Salesforce error codes of writes that failed on contention with other
+# writes to the same rows
+CONTENTION_ERROR_CODES = {"UNABLE_TO_LOCK_ROW"}
+
+
+def enabled():
+    return bool(settings.WRITE_RETRY_QUEUE_URL)
+
+
+def is_transient(error):
+    """Whether a failed Salesforce write may succeed if it is retried: it
+    failed in transport (including an open circuit breaker), with a 5xx or
+    429 response, or on row lock contention. Other errors (validation rules,
+    invalid fields, deleted records) fail the same way every time."""
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+    status = getattr(error, "status", None)
+    if status is not None and breakers.is_failure_status(status):
+        return True
+    content = getattr(error, "content", None)
+    if not isinstance(content, list):
+        return False
+    return any(
+        isinstance(item, dict) and item.get("errorCode") in CONTENTION_ERROR_CODES
+        for item in content
+    )
+
+
+def backoff(attempt):
+    """Seconds to wait before the attempt'th retry: WRITE_RETRY_BASE_DELAY
+    doubled for each earlier attempt, up to WRITE_RETRY_MAX_DELAY, and
+    jittered so that writes failing together aren't retried together"""
+    delay = min(
+        settings.WRITE_RETRY_MAX_DELAY,
+        settings.WRITE_RETRY_BASE_DELAY * 2 ** (attempt - 1),
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def schedule(kind, payload, error, attempt=1):
+    """Persists a failed write to be retried, or dead-letters it once it has
+    been retried WRITE_RETRY_MAX_ATTEMPTS times. `attempt` is the number of
+    the retry being scheduled."""
+    message = {
+        "kind": kind,
+        "attempt": attempt,
+        "error": str(error)[:1000],
+        "failed_at": int(time.time()),
+        **payload,
+    }
+    if attempt > settings.WRITE_RETRY_MAX_ATTEMPTS:
+        print(f"Dead-lettering {kind} write after {attempt - 1} retries: {error}")
+        dead_letter_queue().send(message)
+        metrics.increment(f"write_retry.{kind}.dead_lettered")
+        return
+
+    write_retry_queue().send(message, delay=backoff(attempt))
+    metrics.increment(f"write_retry.{kind}.scheduled")
+
+
+def payload(message):
+    """The write a retry message is for, without its retry bookkeeping"""
+    return {
+        key: value
+        for key, value in message.items()
+        if key not in ("kind", "attempt", "error", "failed_at")
+    }
+
+
+def reschedule(message, payload, error):
+    """Schedules the next retry of a message whose retry failed, with the
+    part of its payload that is still to be written"""
+    schedule(message["kind"], payload, error, message["attempt"] + 1)
+
+
+def postpone(message):
+    """Puts a retry back on the queue without using up an attempt, while the
+    circuit breaker of the dependency it writes to is open"""
+    write_retry_queue().send(message, delay=backoff(message["attempt"]))
+    metrics.increment(f"write_retry.{message['kind']}.postponed")
@@ -0,0 +1,28 @@
+from simple_salesforce import Salesforce
+
+from marketing_cloud_proxy import outbound
+from marketing_cloud_proxy.client import SalesforceSessionCache
+
+
+class SalesforceClient(Salesforce):
+    def __init__(self):
+        """
+        Initializes a Salesforce object from the cached session, authenticating
+        with SF only if there is no usable session in this container
+        """
+        session_id, instance = SalesforceSessionCache.get()
+        super().__init__(
+            instance=instance,
+            session_id=session_id,
+            session=outbound.session("salesforce"),
+        )
+
+        # simple_salesforce calls this to re-authenticate when a request fails
+        # with INVALID_SESSION_ID, then retries the request
+        self._salesforce_login_partial = self._relogin
+
+    def _relogin(self):
+        # Only re-login once per client; a second INVALID_SESSION_ID is raised
+        # to the caller instead of looping on logins
+        self._salesforce_login_partial = None
+        return SalesforceSessionCache.refresh(self.session_id)
@@ -0,0 +1,26 @@
+import os
+
+from marketing_cloud_proxy import settings
+from marketing_cloud_proxy.lazy import LazyModule
+
+sentry_sdk = LazyModule("sentry_sdk")
+
+
+def init(*integrations):
+    """Sets Sentry up for an entry point (the Flask or the ASGI app) with its
+    framework's integrations.
+
+    Sentry reads every installed package's metadata when it is initialized,
+    so it is only initialized when there is somewhere to send events."""
+    if not settings.SENTRY_DSN:
+        return
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        integrations=list(integrations),
+        # The integrations Sentry would otherwise enable for every installed
+        # library (boto3, httpx, ...) import them all on cold start
+        auto_enabling_integrations=False,
+        environment=os.environ.get("ENV"),
+        release=os.environ.get("SENTRY_RELEASE"),
+        traces_sample_rate=settings.SENTRY_TRACES_SAMPLE_RATE,
+    )
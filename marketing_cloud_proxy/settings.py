@@ -1,4 +1,7 @@
 import os
+import tempfile
+
+from marketing_cloud_proxy.errors import ConfigurationError
 
 # Endpoint for domain for NYPR's main API, e.g. api.wnyc.org
 MAILCHIMP_PROXY_ENDPOINT = (
@@ -21,3 +24,191 @@ SF_USERNAME = os.environ.get("SF_USERNAME")
 SF_PASS = os.environ.get("SF_PASS")
 SF_SECURITY_TOKEN = os.environ.get("SF_SECURITY_TOKEN")
 SF_DOMAIN = os.environ.get("SF_DOMAIN")
+
+# Salesforce sessions are cached per container; SF_SESSION_TTL should match
+# the org's session timeout setting (Setup > Session Settings).
+SF_SESSION_TTL = int(os.environ.get("SF_SESSION_TTL") or 7200)
+SF_SESSION_REFRESH_MARGIN = int(os.environ.get("SF_SESSION_REFRESH_MARGIN") or 300)
+
+# Seconds the subscription list catalog is served without reloading, and how
+# much longer a stale copy is served while it reloads in the background
+LIST_CATALOG_TTL = int(os.environ.get("LIST_CATALOG_TTL") or 300)
+LIST_CATALOG_STALE_TTL = int(os.environ.get("LIST_CATALOG_STALE_TTL") or 3600)
+
+# Total seconds a signup will wait on Everest, and whether an email Everest
+# could not verify in time is subscribed anyway ("open") or rejected ("closed")
+EVEREST_TIMEOUT = float(os.environ.get("EVEREST_TIMEOUT") or 2)
+EVEREST_FAILURE_POLICY = (os.environ.get("EVEREST_FAILURE_POLICY") or "open").lower()
+
+EVEREST_API_KEY = os.environ.get("EVEREST_API_KEY")
+EVEREST_API_ENDPOINT = (
+    os.environ.get("EVEREST_API_ENDPOINT")
+    or "https://api.everest.validity.com/api/2.0/validation/address"
+)
+
+# Everest verdicts are cached per container and, if VALIDITY_CACHE_TABLE is
+# set, in DynamoDB. Invalid verdicts expire sooner than valid ones.
+VALIDITY_CACHE_SIZE = int(os.environ.get("VALIDITY_CACHE_SIZE") or 10000)
+VALIDITY_CACHE_VALID_TTL = int(os.environ.get("VALIDITY_CACHE_VALID_TTL") or 2592000)
+VALIDITY_CACHE_INVALID_TTL = int(os.environ.get("VALIDITY_CACHE_INVALID_TTL") or 86400)
+VALIDITY_CACHE_TABLE = os.environ.get("VALIDITY_CACHE_TABLE")
+
+# Seconds each outbound integration may take to connect and to respond, plus
+# retry and connection pool limits shared by all of them
+MAILCHIMP_TIMEOUT = float(os.environ.get("MAILCHIMP_TIMEOUT") or 5)
+SALESFORCE_TIMEOUT = float(os.environ.get("SALESFORCE_TIMEOUT") or 10)
+SUPPORTING_CAST_TIMEOUT = float(os.environ.get("SUPPORTING_CAST_TIMEOUT") or 5)
+OUTBOUND_MAX_RETRIES = int(os.environ.get("OUTBOUND_MAX_RETRIES") or 2)
+OUTBOUND_POOL_SIZE = int(os.environ.get("OUTBOUND_POOL_SIZE") or 10)
+
+# "async" accepts /subscribe requests onto SIGNUP_QUEUE_URL (an SQS queue URL,
+# or sqlite:///path for a local stand-in) for the signup worker to process. It
+# has no default; async mode refuses to start without it (see check_queues).
+SUBSCRIBE_MODE = (os.environ.get("SUBSCRIBE_MODE") or "sync").lower()
+SIGNUP_QUEUE_URL = os.environ.get("SIGNUP_QUEUE_URL")
+SIGNUP_WORKER_BATCH_SIZE = int(os.environ.get("SIGNUP_WORKER_BATCH_SIZE") or 10)
+
+# External ID field (the lower-cased email) used to match signups' Contacts
+# with SF_CONTACT_RESOLUTION=external_id
+SF_CONTACT_EXTERNAL_ID_FIELD = (
+    os.environ.get("SF_CONTACT_EXTERNAL_ID_FIELD") or "nypr_Normalized_Email__c"
+)
+
+# How signups find or create their Contact: "query" looks the email up while
+# Everest checks it and creates the Contact if there isn't one; "external_id"
+# does both in one composite request on SF_CONTACT_EXTERNAL_ID_FIELD, which
+# must then be populated (and unique) on every Contact
+SF_CONTACT_RESOLUTION = (
+    os.environ.get("SF_CONTACT_RESOLUTION") or "query"
+).lower()
+
+# /bulk-import is disabled unless a bearer token is configured
+BULK_IMPORT_TOKEN = os.environ.get("BULK_IMPORT_TOKEN")
+BULK_IMPORT_CONTACT_WAIT = float(os.environ.get("BULK_IMPORT_CONTACT_WAIT") or 20)
+BULK_IMPORT_POLL_INTERVAL = float(os.environ.get("BULK_IMPORT_POLL_INTERVAL") or 2)
+
+# Duplicate signups (same email, lists and source) share one Salesforce write.
+# Set IDEMPOTENCY_TABLE to de-duplicate across containers; otherwise only
+# signups within a container are.
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE")
+IDEMPOTENCY_WINDOW = int(os.environ.get("IDEMPOTENCY_WINDOW") or 300)
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get("IDEMPOTENCY_LOCK_TTL") or 30)
+
+# The shared Marketing Cloud token is refreshed once it expires within
+# MC_TOKEN_REFRESH_MARGIN seconds, by whichever container takes the refresh
+# lease (held for at most MC_TOKEN_LEASE_TTL seconds). The scheduled pre-warm
+# refreshes it once it expires within MC_TOKEN_PREWARM_MARGIN seconds, which
+# should be longer than the schedule interval plus MC_TOKEN_REFRESH_MARGIN.
+MC_TOKEN_REFRESH_MARGIN = int(os.environ.get("MC_TOKEN_REFRESH_MARGIN") or 300)
+MC_TOKEN_LEASE_TTL = int(os.environ.get("MC_TOKEN_LEASE_TTL") or 30)
+MC_TOKEN_PREWARM_MARGIN = int(os.environ.get("MC_TOKEN_PREWARM_MARGIN") or 900)
+
+# How long Supporting Cast plans are cached by the webhook handler, in seconds
+SUPPORTING_CAST_PLAN_TTL = int(os.environ.get("SUPPORTING_CAST_PLAN_TTL") or 3600)
+
+# "async" queues Supporting Cast webhook rows onto SUPPORTING_CAST_QUEUE_URL
+# for the Supporting Cast worker, which writes them to the data extension in
+# batches of up to DE_BATCH_SIZE rows, collected for at most DE_BATCH_WINDOW
+# seconds. The queue has no default; async mode refuses to start without it
+# (see check_queues).
+SUPPORTING_CAST_MODE = (os.environ.get("SUPPORTING_CAST_MODE") or "sync").lower()
+SUPPORTING_CAST_QUEUE_URL = os.environ.get("SUPPORTING_CAST_QUEUE_URL")
+DE_BATCH_SIZE = int(os.environ.get("DE_BATCH_SIZE") or 50)
+DE_BATCH_WINDOW = float(os.environ.get("DE_BATCH_WINDOW") or 5)
+
+# Threads the ASGI app (marketing_cloud_proxy.asgi) runs blocking Salesforce
+# and Marketing Cloud SDK calls on
+ASGI_SDK_THREADS = int(os.environ.get("ASGI_SDK_THREADS") or 64)
+
+# Sentry is only set up when SENTRY_DSN is set. Fraction of requests traced
+# for Sentry performance monitoring.
+SENTRY_DSN = os.environ.get("SENTRY_DSN")
+SENTRY_TRACES_SAMPLE_RATE = float(
+    os.environ.get("SENTRY_TRACES_SAMPLE_RATE") or 0.1
+)
+
+# Fraction of requests whose per-stage timings are logged as CloudWatch
+# Embedded Metric Format lines, and the CloudWatch namespace they go to
+STAGE_METRICS_SAMPLE_RATE = float(os.environ.get("STAGE_METRICS_SAMPLE_RATE") or 1)
+STAGE_METRICS_NAMESPACE = (
+    os.environ.get("STAGE_METRICS_NAMESPACE") or "MarketingCloudProxy"
+)
+
+# Requests are captured as sanitized NDJSON envelopes in TRAFFIC_CAPTURE_DIR
+# when it is set (see marketing_cloud_proxy.capture), for
+# TRAFFIC_CAPTURE_SAMPLE_RATE of requests. Emails are pseudonymized with
+# TRAFFIC_CAPTURE_SALT, so set it to keep pseudonyms stable across processes.
+TRAFFIC_CAPTURE_DIR = os.environ.get("TRAFFIC_CAPTURE_DIR")
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(
+    os.environ.get("TRAFFIC_CAPTURE_SAMPLE_RATE") or 1
+)
+TRAFFIC_CAPTURE_SALT = os.environ.get("TRAFFIC_CAPTURE_SALT")
+TRAFFIC_CAPTURE_MAX_BYTES = int(
+    os.environ.get("TRAFFIC_CAPTURE_MAX_BYTES") or 10 * 1024 * 1024
+)
+TRAFFIC_CAPTURE_BACKUPS = int(os.environ.get("TRAFFIC_CAPTURE_BACKUPS") or 5)
+
+# Each dependency's circuit breaker opens after BREAKER_FAILURE_THRESHOLD
+# consecutive failed calls and rejects calls for BREAKER_RESET_TIMEOUT seconds
+# before letting a trial call through; BREAKER_MAX_IN_FLIGHT (0 for no limit)
+# caps the calls to a dependency at once per container. While Salesforce's or
+# Marketing Cloud's breaker is open, signups and Supporting Cast rows are
+# refused with a 503 ("fail") or queued for the workers ("queue"), which needs
+# SIGNUP_QUEUE_URL and SUPPORTING_CAST_QUEUE_URL set to durable queues (see
+# check_queues).
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD") or 5)
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT") or 30)
+BREAKER_MAX_IN_FLIGHT = int(os.environ.get("BREAKER_MAX_IN_FLIGHT") or 0)
+BREAKER_FALLBACK = (os.environ.get("BREAKER_FALLBACK") or "fail").lower()
+
+# Failed Subscription Member and data extension row writes are retried from
+# WRITE_RETRY_QUEUE_URL (an SQS queue URL, or sqlite:///path) when it is set,
+# WRITE_RETRY_BASE_DELAY seconds after failing and twice as long after each
+# further failure (up to WRITE_RETRY_MAX_DELAY, which SQS caps at 900). Writes
+# that fail WRITE_RETRY_MAX_ATTEMPTS retries go to WRITE_RETRY_DEAD_LETTER_URL,
+# which must then be set too (see check_queues).
+WRITE_RETRY_QUEUE_URL = os.environ.get("WRITE_RETRY_QUEUE_URL")
+WRITE_RETRY_DEAD_LETTER_URL = os.environ.get("WRITE_RETRY_DEAD_LETTER_URL")
+WRITE_RETRY_MAX_ATTEMPTS = int(os.environ.get("WRITE_RETRY_MAX_ATTEMPTS") or 8)
+WRITE_RETRY_BASE_DELAY = float(os.environ.get("WRITE_RETRY_BASE_DELAY") or 30)
+WRITE_RETRY_MAX_DELAY = float(os.environ.get("WRITE_RETRY_MAX_DELAY") or 900)
+
+
+def is_temporary_queue(url):
+    """Whether the queue URL is a SQLite file in the temp directory, which is
+    lost with the Lambda container"""
+    if not url.startswith("sqlite:///"):
+        return False
+    path = os.path.abspath(url[len("sqlite:///"):])
+    return path.startswith(os.path.join(tempfile.gettempdir(), ""))
+
+
+def check_queues():
+    """Refuses to start with queue settings that would lose accepted work:
+    the queues that requests are accepted onto must be set, and not be
+    temporary"""
+    needed = {}
+    if BREAKER_FALLBACK == "queue":
+        needed["SIGNUP_QUEUE_URL"] = "BREAKER_FALLBACK=queue"
+        needed["SUPPORTING_CAST_QUEUE_URL"] = "BREAKER_FALLBACK=queue"
+    if SUBSCRIBE_MODE == "async":
+        needed["SIGNUP_QUEUE_URL"] = "SUBSCRIBE_MODE=async"
+    if SUPPORTING_CAST_MODE == "async":
+        needed["SUPPORTING_CAST_QUEUE_URL"] = "SUPPORTING_CAST_MODE=async"
+
+    for name, reason in needed.items():
+        url = globals()[name]
+        if not url:
+            raise ConfigurationError(f"{reason} needs {name} to be set")
+        if is_temporary_queue(url):
+            raise ConfigurationError(
+                f"{reason} needs {name} to be a durable queue, not {url}"
+            )
+
+    if WRITE_RETRY_QUEUE_URL and not WRITE_RETRY_DEAD_LETTER_URL:
+        raise ConfigurationError(
+            "WRITE_RETRY_QUEUE_URL needs WRITE_RETRY_DEAD_LETTER_URL to be set"
+        )
+
+
+check_queues()
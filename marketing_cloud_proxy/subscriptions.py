@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytz
+
+from marketing_cloud_proxy.queries import MEMBERS_BY_CONTACT_AND_LISTS
+
+# Salesforce accepts at most 25 subrequests in one composite request
+COMPOSITE_BATCH_SIZE = 25
+
+
+class SubrequestError(Exception):
+    """A failed subrequest of a composite request, with its status and error
+    list like simple_salesforce.SalesforceError"""
+
+    def __init__(self, status, content):
+        super().__init__(content)
+        self.status = status
+        self.content = content
+
+
+def latest_subscription_members(client, contact_id, list_ids):
+    """Returns the most recent cfg_Subscription_Member__c Id for the contact on
+    each of the given lists, keyed by list Id, using a single query"""
+    members = MEMBERS_BY_CONTACT_AND_LISTS.all(
+        client, contact_id=contact_id, list_ids=list(list_ids)
+    )
+
+    # Records are ordered oldest first, so later ones win
+    return {record["cfg_Subscription__c"]: record["Id"] for record in members}
+
+
+def subscribe_contact_to_lists(client, contact_id, list_ids, source):
+    """Creates or reactivates the contact's Subscription Member on every list.
+
+    Existing members are found with one query and all of the creates and
+    updates are sent as one composite request (per 25 lists), so the number of
+    round-trips doesn't grow with the number of lists.
+
+    Returns a dict of list Id -> ("created" | "updated", SubrequestError or
+    None)."""
+    existing_members = latest_subscription_members(client, contact_id, list_ids)
+    opt_in_date = datetime.now(pytz.timezone("UTC")).strftime("%Y-%m-%d")
+    sobject_url = (
+        f"/services/data/v{client.sf_version}/sobjects/cfg_Subscription_Member__c"
+    )
+
+    subrequests = []
+    for list_id in list_ids:
+        body = {
+            "cfg_Active__c": True,
+            "nypr_Subscription_Source__c": source,
+            "cfg_Opt_In_Date__c": opt_in_date,
+        }
+        if list_id in existing_members:
+            subrequests.append(
+                {
+                    "method": "PATCH",
+                    "url": f"{sobject_url}/{existing_members[list_id]}",
+                    "referenceId": f"member_{list_id}",
+                    "body": body,
+                }
+            )
+        else:
+            subrequests.append(
+                {
+                    "method": "POST",
+                    "url": sobject_url,
+                    "referenceId": f"member_{list_id}",
+                    "body": {
+                        "cfg_Subscription__c": list_id,
+                        "cfg_Contact__c": contact_id,
+                        **body,
+                    },
+                }
+            )
+
+    results = {}
+    for i in range(0, len(subrequests), COMPOSITE_BATCH_SIZE):
+        batch = subrequests[i : i + COMPOSITE_BATCH_SIZE]
+        response = client.restful(
+            "composite",
+            method="POST",
+            json={"allOrNone": False, "compositeRequest": batch},
+        )
+        for subrequest, subresponse in zip(batch, response["compositeResponse"]):
+            list_id = subrequest["referenceId"][len("member_"):]
+            action = "created" if subrequest["method"] == "POST" else "updated"
+            error = None
+            if subresponse["httpStatusCode"] >= 300:
+                error = SubrequestError(
+                    subresponse["httpStatusCode"], subresponse["body"]
+                )
+            results[list_id] = (action, error)
+
+    return results
@@ -0,0 +1,144 @@
+import time
+import uuid
+
+from marketing_cloud_proxy import metrics, settings
+from marketing_cloud_proxy.lazy import LazyModule
+
+boto3 = LazyModule("boto3")
+
+TOKEN_KEY = "MarketingCloudAuth"
+LEASE_KEY = "MarketingCloudAuthRefreshLease"
+
+# The layout used before the token, its expiration and instance URLs were
+# kept in a single item. Still read (and migrated) if TOKEN_KEY doesn't exist.
+LEGACY_TOKEN_KEY = "MarketingCloudAuthToken"
+LEGACY_EXPIRATION_KEY = "MarketingCloudAuthTokenExpiration"
+
+
+class MarketingCloudTokenStore:
+    """The Marketing Cloud token shared by every container, as one versioned
+    item in a DynamoDB table with a "KeyName" hash key. The item is read with
+    a single strongly consistent get_item and replaced with a conditional
+    put_item, so a token is never paired with another token's expiration."""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self._client = None
+
+    @property
+    def _dynamo(self):
+        # Created on first use, rather than when the module is imported
+        if self._client is None:
+            self._client = boto3.client(
+                "dynamodb", region_name=settings.AWS_DEFAULT_REGION
+            )
+        return self._client
+
+    def get(self):
+        """Returns the stored token data (empty if there's no token yet)"""
+        item = self._dynamo.get_item(
+            TableName=self.table_name,
+            Key={"KeyName": {"S": TOKEN_KEY}},
+            ConsistentRead=True,
+        ).get("Item")
+        if item:
+            return {
+                "oauthToken": item["Token"]["S"],
+                "internalOauthToken": item["Token"]["S"],
+                "expiresIn": float(item["ExpiresAt"]["N"]),
+                "soapEndpoint": item.get("SoapEndpoint", {}).get("S"),
+                "baseApiUrl": item.get("BaseApiUrl", {}).get("S"),
+                "version": int(item["Version"]["N"]),
+            }
+        return self._migrate_legacy_token()
+
+    def put(self, token_data, version):
+        """Replaces the stored token, unless another container has replaced it
+        since `version` was read. Returns whether the token was written."""
+        item = {
+            "KeyName": {"S": TOKEN_KEY},
+            "Token": {"S": token_data["oauthToken"]},
+            "ExpiresAt": {"N": str(token_data["expiresIn"])},
+            "Version": {"N": str(version + 1)},
+        }
+        if token_data.get("soapEndpoint"):
+            item["SoapEndpoint"] = {"S": token_data["soapEndpoint"]}
+        if token_data.get("baseApiUrl"):
+            item["BaseApiUrl"] = {"S": token_data["baseApiUrl"]}
+
+        try:
+            self._dynamo.put_item(
+                TableName=self.table_name,
+                Item=item,
+                ConditionExpression=(
+                    "attribute_not_exists(KeyName) OR Version = :version"
+                ),
+                ExpressionAttributeValues={":version": {"N": str(version)}},
+            )
+        except self._dynamo.exceptions.ConditionalCheckFailedException:
+            metrics.increment("mc_token.write_conflict")
+            return False
+        return True
+
+    def acquire_lease(self, ttl):
+        """Takes the refresh lease for `ttl` seconds unless another container
+        holds an unexpired lease. Returns the lease's owner id if it was taken,
+        for release_lease, or None."""
+        now = time.time()
+        owner = str(uuid.uuid4())
+        try:
+            self._dynamo.put_item(
+                TableName=self.table_name,
+                Item={
+                    "KeyName": {"S": LEASE_KEY},
+                    "Owner": {"S": owner},
+                    "ExpiresAt": {"N": str(now + ttl)},
+                },
+                ConditionExpression="attribute_not_exists(KeyName) OR ExpiresAt < :now",
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except self._dynamo.exceptions.ConditionalCheckFailedException:
+            return None
+        return owner
+
+    def release_lease(self, owner):
+        """Releases the lease, unless it expired and was taken by someone else"""
+        try:
+            self._dynamo.delete_item(
+                TableName=self.table_name,
+                Key={"KeyName": {"S": LEASE_KEY}},
+                ConditionExpression="#owner = :owner",
+                ExpressionAttributeNames={"#owner": "Owner"},
+                ExpressionAttributeValues={":owner": {"S": owner}},
+            )
+        except self._dynamo.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def _migrate_legacy_token(self):
+        items = self._dynamo.batch_get_item(
+            RequestItems={
+                self.table_name: {
+                    "Keys": [
+                        {"KeyName": {"S": LEGACY_TOKEN_KEY}},
+                        {"KeyName": {"S": LEGACY_EXPIRATION_KEY}},
+                    ],
+                    "ConsistentRead": True,
+                }
+            }
+        )["Responses"].get(self.table_name, [])
+        values = {item["KeyName"]["S"]: item["KeyValue"] for item in items}
+        if LEGACY_TOKEN_KEY not in values or LEGACY_EXPIRATION_KEY not in values:
+            return {}
+
+        token_data = {
+            "oauthToken": values[LEGACY_TOKEN_KEY]["S"],
+            "internalOauthToken": values[LEGACY_TOKEN_KEY]["S"],
+            "expiresIn": float(values[LEGACY_EXPIRATION_KEY]["N"]),
+            "version": 0,
+        }
+        if self.put(token_data, 0):
+            metrics.increment("mc_token.migrated")
+            token_data["version"] = 1
+            return token_data
+        # Another container migrated (or refreshed) the token first
+        return self.get()
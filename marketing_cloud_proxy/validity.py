@@ -0,0 +1,176 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from marketing_cloud_proxy import metrics, outbound, settings
+from marketing_cloud_proxy.lazy import LazyModule
+
+boto3 = LazyModule("boto3")
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class EmailVerdictCache:
+    """Caches Everest (status, name) verdicts keyed on the normalized email.
+
+    Verdicts are kept in an in-process LRU and, if VALIDITY_CACHE_TABLE is set,
+    in a DynamoDB table shared by every container. Valid and invalid verdicts
+    expire separately so that a bad address that gets fixed is re-checked
+    sooner than a good one. Failed checks are never cached."""
+
+    def __init__(self, max_size, valid_ttl, invalid_ttl, table_name=None):
+        self.max_size = max_size
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.table_name = table_name
+        self._lock = threading.Lock()
+        self._verdicts = OrderedDict()
+        self._dynamo = None
+
+    def get(self, email):
+        key = normalize_email(email)
+        with self._lock:
+            cached = self._verdicts.get(key)
+            if cached and cached[1] > time.time():
+                self._verdicts.move_to_end(key)
+                metrics.increment("validity_cache.hit.memory")
+                return cached[0]
+
+        verdict, expires_at = self._get_from_dynamo(key)
+        if verdict:
+            metrics.increment("validity_cache.hit.dynamodb")
+            self._remember(key, verdict, expires_at)
+            return verdict
+
+        metrics.increment("validity_cache.miss")
+        return None
+
+    def set(self, email, verdict):
+        key = normalize_email(email)
+        status, name = verdict
+        ttl = self.valid_ttl
+        if "invalid" in status.lower() or "invalid" in name.lower():
+            ttl = self.invalid_ttl
+        expires_at = time.time() + ttl
+
+        self._remember(key, verdict, expires_at)
+        self._put_to_dynamo(key, verdict, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._verdicts.clear()
+
+    def _remember(self, key, verdict, expires_at):
+        with self._lock:
+            self._verdicts[key] = (verdict, expires_at)
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.max_size:
+                self._verdicts.popitem(last=False)
+
+    def _dynamo_key(self, key):
+        # Addresses are only stored hashed outside of the process
+        return {"EmailHash": {"S": hashlib.sha256(key.encode("utf-8")).hexdigest()}}
+
+    def _dynamo_client(self):
+        if self._dynamo is None:
+            self._dynamo = boto3.client(
+                "dynamodb", region_name=settings.AWS_DEFAULT_REGION
+            )
+        return self._dynamo
+
+    def _get_from_dynamo(self, key):
+        if not self.table_name:
+            return None, None
+
+        try:
+            item = (
+                self._dynamo_client()
+                .get_item(TableName=self.table_name, Key=self._dynamo_key(key))
+                .get("Item")
+            )
+        except Exception as e:
+            print(f"Error reading email verdict cache: {e}")
+            return None, None
+
+        # DynamoDB's TTL deletion can lag, so expiry is checked here as well
+        if not item or float(item["ExpiresAt"]["N"]) <= time.time():
+            return None, None
+
+        verdict = (item["Status"]["S"], item["Name"]["S"])
+        return verdict, float(item["ExpiresAt"]["N"])
+
+    def _put_to_dynamo(self, key, verdict, expires_at):
+        if not self.table_name:
+            return
+
+        try:
+            self._dynamo_client().put_item(
+                TableName=self.table_name,
+                Item={
+                    **self._dynamo_key(key),
+                    "Status": {"S": verdict[0]},
+                    "Name": {"S": verdict[1]},
+                    "ExpiresAt": {"N": str(int(expires_at))},
+                },
+            )
+        except Exception as e:
+            print(f"Error writing email verdict cache: {e}")
+
+
+verdict_cache = EmailVerdictCache(
+    settings.VALIDITY_CACHE_SIZE,
+    settings.VALIDITY_CACHE_VALID_TTL,
+    settings.VALIDITY_CACHE_INVALID_TTL,
+    settings.VALIDITY_CACHE_TABLE,
+)
+
+
+def fetch_everest_verdict(email):
+    """Returns the Everest (status, name) verdict for the email, e.g.
+    ("valid", "Valid") or ("invalid", "Domain Invalid"), or None if Everest
+    could not give one"""
+    metrics.increment("everest.call")
+    try:
+        response = outbound.session("everest").get(
+            f"{settings.EVEREST_API_ENDPOINT}/{email}",
+            headers={"X-API-KEY": settings.EVEREST_API_KEY},
+        )
+
+    except requests.exceptions.RequestException as e:
+        metrics.increment("everest.error")
+        print(f"Error connecting to Everest API: {e}")
+
+    else:
+        return verdict_from_everest_response(response)
+
+
+def verdict_from_everest_response(response):
+    """Returns the (status, name) verdict from an Everest API response, or
+    None if it doesn't have one"""
+    try:
+        validity_response = response.json()
+        return (
+            validity_response["results"]["status"],  # valid/invalid
+            validity_response["results"]["name"],  # e.g. Domain Invalid
+        )
+    except (KeyError, ValueError):
+        metrics.increment("everest.error")
+        print("Error parsing Everest API response")
+
+
+def check_email_validity(email):
+    """Returns the cached or freshly fetched Everest verdict for the email, or
+    None if there is none"""
+    verdict = verdict_cache.get(email)
+    if verdict:
+        return verdict
+
+    verdict = fetch_everest_verdict(email)
+    if verdict:
+        verdict_cache.set(email, verdict)
+    return verdict
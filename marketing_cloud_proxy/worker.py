@@ -0,0 +1,262 @@
+import json
+
+from marketing_cloud_proxy import breakers, metrics, retries, settings
+from marketing_cloud_proxy.client import (
+    create_supporting_cast_row_stub,
+    EmailSignupRequestHandler,
+    MarketingCloudAuthClient,
+    salesforce_client,
+)
+from marketing_cloud_proxy.data_extensions import collect_batch, write_rows
+from marketing_cloud_proxy.errors import TemporaryFailureError
+from marketing_cloud_proxy.queues import (
+    signup_queue,
+    supporting_cast_queue,
+    write_retry_queue,
+)
+from marketing_cloud_proxy.subscriptions import subscribe_contact_to_lists
+
+# Stop draining when the Lambda has less than this many milliseconds left
+DRAIN_TIME_MARGIN_MS = 10000
+
+
+def process_signup(payload):
+    """Subscribes a queued signup. Signups that are rejected as invalid (e.g.
+    for a list that doesn't exist) are logged and dropped, since they would be
+    rejected again on retry. Failures that may pass (5xx responses, such as
+    Salesforce login failing, and the 409 of a duplicate signup still being
+    processed) raise TemporaryFailureError, and are left to the caller to
+    retry like any other exception."""
+    with metrics.request_stages("signup_worker"):
+        response = EmailSignupRequestHandler.from_payload(payload).subscribe()
+    if isinstance(response, tuple):
+        body, status = response[:2]
+        if status >= 500 or status == 409:
+            raise TemporaryFailureError(body["detail"])
+        if status >= 400:
+            print(f"Queued signup could not be processed: {body['detail']}")
+    return response
+
+
+def drain(queue, context=None):
+    """Processes batches from the queue until it is empty, the Lambda is
+    about to time out or Salesforce's circuit breaker is open. Messages that
+    raise stay on the queue and are retried once their visibility timeout
+    passes."""
+    processed = 0
+    while not context or context.get_remaining_time_in_millis() > DRAIN_TIME_MARGIN_MS:
+        if breakers.breaker("salesforce").is_open():
+            print("Salesforce is unavailable; signups are left on the queue")
+            break
+        messages = queue.receive(settings.SIGNUP_WORKER_BATCH_SIZE)
+        if not messages:
+            break
+
+        done = []
+        for receipt, payload in messages:
+            try:
+                process_signup(payload)
+            except Exception as e:
+                print(f"Error processing queued signup: {e}")
+            else:
+                done.append(receipt)
+
+        queue.delete(done)
+        processed += len(done)
+
+    return {"processed": processed}
+
+
+def handler(event, context):
+    """Lambda entry point for the signup worker.
+
+    When invoked by an SQS trigger it processes the records in the event and
+    reports the ones that raised as batch item failures, so that only those
+    are retried. Invoked any other way (on a schedule, or locally against the
+    SQLite queue) it drains SIGNUP_QUEUE_URL."""
+    if "Records" not in event:
+        return drain(signup_queue(), context)
+
+    failures = []
+    for record in event["Records"]:
+        try:
+            process_signup(json.loads(record["body"]))
+        except Exception as e:
+            print(f"Error processing queued signup: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    return {"batchItemFailures": failures}
+
+
+def write_supporting_cast_rows(rows):
+    """Writes a batch of queued Supporting Cast rows to the data extension.
+    Returns each row's error message, or None for the rows that were saved."""
+    with breakers.breaker("marketing_cloud").guard():
+        de_row = create_supporting_cast_row_stub(
+            MarketingCloudAuthClient.instantiate_client()
+        )
+        errors = write_rows(de_row, rows)
+    for row, error in zip(rows, errors):
+        if error:
+            print(f"Supporting Cast row for {row['email_address']}: {error}")
+    return errors
+
+
+def drain_supporting_cast(queue, context=None):
+    """Writes batches of rows from the queue until it is empty, the Lambda
+    is about to time out or Marketing Cloud's circuit breaker is open. Rows
+    that fail stay on the queue and are retried once their visibility timeout
+    passes."""
+    written = failed = 0
+    while not context or context.get_remaining_time_in_millis() > DRAIN_TIME_MARGIN_MS:
+        if breakers.breaker("marketing_cloud").is_open():
+            print("Marketing Cloud is unavailable; rows are left on the queue")
+            break
+        messages = collect_batch(
+            queue, settings.DE_BATCH_SIZE, settings.DE_BATCH_WINDOW
+        )
+        if not messages:
+            break
+
+        errors = write_supporting_cast_rows([payload for _, payload in messages])
+        done = [receipt for (receipt, _), error in zip(messages, errors) if not error]
+        queue.delete(done)
+        written += len(done)
+        failed += len(messages) - len(done)
+
+    return {"written": written, "failed": failed}
+
+
+def supporting_cast_handler(event, context):
+    """Lambda entry point for the Supporting Cast worker.
+
+    An SQS trigger (with a batch size and batching window) delivers a batch
+    of rows, which are written together; the rows that failed are reported
+    as batch item failures to be retried. Invoked any other way it drains
+    SUPPORTING_CAST_QUEUE_URL in batches of DE_BATCH_SIZE."""
+    with metrics.flushing(Operation="supporting_cast_worker"):
+        if "Records" not in event:
+            return drain_supporting_cast(supporting_cast_queue(), context)
+
+        records = event["Records"]
+        errors = write_supporting_cast_rows([json.loads(r["body"]) for r in records])
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": record["messageId"]}
+            for record, error in zip(records, errors)
+            if error
+        ]
+    }
+
+
+def _retry_subscription_members(message):
+    results = subscribe_contact_to_lists(
+        salesforce_client(), message["contact_id"], message["list_ids"], message["source"]
+    )
+    failed = {list_id: error for list_id, (_, error) in results.items() if error}
+    if not failed:
+        return None, None
+    remaining = {**retries.payload(message), "list_ids": list(failed)}
+    return remaining, list(failed.values())
+
+
+def _retry_de_rows(message):
+    rows = message["rows"]
+    errors = write_supporting_cast_rows(rows)
+    failed = [row for row, error in zip(rows, errors) if error]
+    if not failed:
+        return None, None
+    remaining = {**retries.payload(message), "rows": failed}
+    return remaining, next(filter(None, errors))
+
+
+_retries = {
+    retries.SUBSCRIPTION_MEMBERS: _retry_subscription_members,
+    retries.DE_ROWS: _retry_de_rows,
+}
+
+
+def _dependency_is_down(message):
+    """Whether the circuit breaker of the dependency a retry writes to is
+    open, in which case the retry shouldn't use up an attempt"""
+    dependency = retries.DEPENDENCIES.get(message["kind"])
+    return bool(dependency) and breakers.breaker(dependency).is_open()
+
+
+def retry_write(message):
+    """Retries a failed write (see marketing_cloud_proxy.retries). Whatever
+    still fails is scheduled to be retried again, or dead-lettered. Returns
+    whether the write succeeded; only raises if the next retry couldn't be
+    scheduled."""
+    kind = message["kind"]
+    try:
+        remaining, error = _retries[kind](message)
+    except Exception as e:
+        remaining, error = retries.payload(message), e
+
+    if remaining:
+        print(f"Retry {message['attempt']} of {kind} write failed: {error}")
+        retries.reschedule(message, remaining, error)
+        return False
+    metrics.increment(f"write_retry.{kind}.succeeded")
+    return True
+
+
+def drain_write_retries(queue, context=None):
+    """Retries the failed writes that are due until there are none left or
+    the Lambda is about to time out. Writes to a dependency whose circuit
+    breaker is open, and messages whose next retry couldn't be scheduled,
+    stay on the queue and are received again once their visibility timeout
+    passes."""
+    succeeded = rescheduled = 0
+    while not context or context.get_remaining_time_in_millis() > DRAIN_TIME_MARGIN_MS:
+        messages = queue.receive(settings.SIGNUP_WORKER_BATCH_SIZE)
+        if not messages:
+            break
+
+        done = []
+        for receipt, message in messages:
+            if _dependency_is_down(message):
+                continue
+            try:
+                if retry_write(message):
+                    succeeded += 1
+                else:
+                    rescheduled += 1
+            except Exception as e:
+                print(f"Error rescheduling {message['kind']} write: {e}")
+            else:
+                done.append(receipt)
+
+        queue.delete(done)
+
+    return {"succeeded": succeeded, "rescheduled": rescheduled}
+
+
+def retry_handler(event, context):
+    """Lambda entry point for the write retry worker.
+
+    An SQS trigger on WRITE_RETRY_QUEUE_URL delivers each retry once its
+    backoff has passed; retries that fail are rescheduled with a longer
+    backoff rather than left to SQS, and only the ones that couldn't be
+    rescheduled are reported as batch item failures. Retries of writes to a
+    dependency whose circuit breaker is open are put back on the queue
+    without counting as an attempt. Invoked any other way (on a schedule, or
+    locally against the SQLite queue) it drains the queue."""
+    with metrics.flushing(Operation="write_retry_worker"):
+        if "Records" not in event:
+            return drain_write_retries(write_retry_queue(), context)
+
+        failures = []
+        for record in event["Records"]:
+            message = json.loads(record["body"])
+            try:
+                if _dependency_is_down(message):
+                    retries.postpone(message)
+                else:
+                    retry_write(message)
+            except Exception as e:
+                print(f"Error rescheduling failed write: {e}")
+                failures.append({"itemIdentifier": record["messageId"]})
+
+    return {"batchItemFailures": failures}
@@ -0,0 +1,186 @@
+"""
+A snapshot of the Marketing Cloud WSDL, vendored into the deployment package.
+
+Without it, every new container downloads MC_DEFAULT_WSDL and suds parses it
+before the first SOAP call, which takes seconds. The snapshot is built when
+the Lambda package is built:
+
+    python -m marketing_cloud_proxy.wsdl build [--url URL] [--dir DIR]
+
+which saves the WSDL and the service definition suds parses from it (pickled)
+to SNAPSHOT_DIR. FuelSDK is then pointed at the vendored WSDL, and suds' cache
+is seeded with the pickled definition before the first client is created.
+
+    python -m marketing_cloud_proxy.wsdl check
+
+exits non-zero if the live WSDL has changed since the snapshot was built.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+
+import requests
+
+from marketing_cloud_proxy import metrics, settings
+
+SNAPSHOT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "wsdl_snapshot"
+)
+WSDL_FILE = "etframework.wsdl"
+DEFINITIONS_FILE = "etframework.pickle"
+METADATA_FILE = "snapshot.json"
+
+# FuelSDK's own default, for builds without MC_DEFAULT_WSDL
+DEFAULT_WSDL_URL = "https://webservice.exacttarget.com/etframework.wsdl"
+
+_lock = threading.Lock()
+_installed = None
+
+
+def read_metadata(directory=SNAPSHOT_DIR):
+    """Returns where and when the snapshot was built, or None without one"""
+    try:
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def local_location(directory=SNAPSHOT_DIR):
+    """The WSDL file FuelSDK should read: the vendored one if the package has
+    a snapshot, or MC_WSDL_FILE_LOCAL_LOCATION (downloaded on first use)"""
+    if read_metadata(directory):
+        return os.path.join(directory, WSDL_FILE)
+    return settings.MC_WSDL_FILE_LOCAL_LOCATION
+
+
+def _file_url(path):
+    # Built the way FuelSDK builds it, since suds caches the WSDL by URL
+    return "file:///" + path
+
+
+def install_snapshot(directory=SNAPSHOT_DIR):
+    """Seeds suds' WSDL cache with the snapshot's pickled service definition,
+    so the first FuelSDK client in the container unpickles it rather than
+    parsing the WSDL. Only done once per container; returns whether the
+    snapshot is installed."""
+    global _installed
+    with _lock:
+        if _installed is None:
+            _installed = _install(directory)
+        return _installed
+
+
+def _install(directory):
+    metadata = read_metadata(directory)
+    if not metadata:
+        return False
+
+    import suds
+    import suds.cache
+    import suds.options
+    import suds.reader
+
+    # Pickles of suds objects only load in the suds version that made them
+    if metadata["suds_version"] != suds.__version__:
+        print(
+            f"WSDL snapshot was built with suds {metadata['suds_version']}, not "
+            f"{suds.__version__}; the WSDL will be parsed instead"
+        )
+        metrics.increment("mc_wsdl.snapshot_mismatch")
+        return False
+
+    # FuelSDK's suds client uses a default ObjectCache, which is shared by
+    # every client in the process
+    cache = suds.cache.ObjectCache(days=1)
+    cache_id = suds.reader.Reader(suds.options.Options()).mangle(
+        _file_url(os.path.join(directory, WSDL_FILE)), "wsdl"
+    )
+    with open(os.path.join(directory, DEFINITIONS_FILE), "rb") as f:
+        # Already pickled, so stored as is rather than with ObjectCache.put
+        suds.cache.FileCache.put(cache, cache_id, f.read())
+    return True
+
+
+def build_snapshot(url, directory=SNAPSHOT_DIR):
+    """Downloads the WSDL at `url` into `directory`, with the service
+    definition suds parses from it and the metadata check_snapshot uses"""
+    import suds
+    import suds.cache
+    import suds.client
+
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+
+    os.makedirs(directory, exist_ok=True)
+    wsdl_path = os.path.join(directory, WSDL_FILE)
+    with open(wsdl_path, "wb") as f:
+        f.write(response.content)
+
+    definitions = suds.client.Client(
+        _file_url(wsdl_path), faults=False, cache=suds.cache.NoCache()
+    ).wsdl
+    with open(os.path.join(directory, DEFINITIONS_FILE), "wb") as f:
+        f.write(pickle.dumps(definitions, suds.cache.ObjectCache.protocol))
+
+    metadata = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(response.content).hexdigest(),
+        "suds_version": suds.__version__,
+        "built_at": int(time.time()),
+    }
+    with open(os.path.join(directory, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def check_snapshot(directory=SNAPSHOT_DIR):
+    """Returns whether the snapshot matches the live WSDL. The ETag or
+    Last-Modified header is compared when the server sends one, so usually
+    only a HEAD request is made; otherwise the WSDL is downloaded and its
+    hash compared."""
+    metadata = read_metadata(directory)
+    if not metadata:
+        return False
+
+    response = requests.head(metadata["url"], timeout=10, allow_redirects=True)
+    response.raise_for_status()
+    for header, key in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+        if response.headers.get(header) and metadata.get(key):
+            return response.headers[header] == metadata[key]
+
+    response = requests.get(metadata["url"], timeout=60)
+    response.raise_for_status()
+    return hashlib.sha256(response.content).hexdigest() == metadata["sha256"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds or checks the vendored Marketing Cloud WSDL snapshot"
+    )
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("--url", default=settings.MC_DEFAULT_WSDL or DEFAULT_WSDL_URL)
+    parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(json.dumps(build_snapshot(args.url, args.dir), indent=2))
+    elif check_snapshot(args.dir):
+        print("WSDL snapshot is current")
+    else:
+        print(
+            "WSDL snapshot is missing or stale; rebuild it with "
+            "`python -m marketing_cloud_proxy.wsdl build`"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
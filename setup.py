@@ -40,11 +40,19 @@ setup(
         'setuptools==57.5.0',
         'simple-salesforce',
     ],
+    extras_require={
+        'asgi': [
+            'httpx',
+            'python-multipart',
+            'starlette',
+            'uvicorn',
+        ],
+    },
     license='BSD',
     long_description=long_description,
     long_description_content_type="text/markdown",
     name='marketing-cloud-proxy',
-    package_data={},
+    package_data={'marketing_cloud_proxy': ['wsdl_snapshot/*']},
     packages=['marketing_cloud_proxy'],
     scripts=[],
     setup_requires=[
@@ -52,6 +60,7 @@ setup(
     ],
     tests_require=[
         'dotmap',
+        'httpx',
         'moto<4.0.0',
         'pytest',
         'pytest-cov',
@@ -59,6 +68,8 @@ setup(
         'pytest-flake8',
         'pytest-mock',
         'pytest-sugar',
+        'python-multipart',
+        'starlette',
     ],
     url='https://github.com/nypublicradio/marketing-cloud-proxy',
     version='0.0.0',
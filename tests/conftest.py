@@ -4,7 +4,11 @@ from collections import OrderedDict
 
 import boto3
 import moto
+import pytest
+import requests
 from dotmap import DotMap
+from marketing_cloud_proxy import client, idempotency, validity
+from marketing_cloud_proxy.catalog import subscription_lists
 
 
 @moto.mock_dynamodb2
@@ -37,6 +41,25 @@ def dynamo_table():
     return table
 
 
+def mock_everest(status, name, delay=0):
+    def mock_get(*args, **kwargs):
+        time.sleep(delay)
+        return DotMap({"json": lambda: {"results": {"status": status, "name": name}}})
+
+    return mock_get
+
+
+@pytest.fixture
+def signup_dependencies(monkeypatch):
+    """Salesforce replaced by MockSFClient and every email valid to Everest,
+    with the caches signups go through emptied"""
+    monkeypatch.setattr(client, "salesforce_client", MockSFClient)
+    monkeypatch.setattr(requests.Session, "get", mock_everest("valid", "Valid"))
+    subscription_lists.clear()
+    validity.verdict_cache.clear()
+    idempotency.local_store.clear()
+
+
 class MockFuelClient:
     authToken = "12345"
     authTokenExpiration = time.time() + 600
@@ -78,6 +101,9 @@ class MockSFType:
 
 
 class MockSFClient:
+    sf_version = "52.0"
+    composite_requests = []
+
     def __init__(self):
         pass
 
@@ -102,6 +128,10 @@ class MockSFClient:
         ])
 
     def query_all_no_results(self, query, include_deleted=False, **kwargs):
+        # The subscription lists themselves always exist
+        if "FROM cfg_Subscription__c" in query:
+            return subscription_list_records()
+
         return {
             'records': [],
             'totalSize': 0,
@@ -109,25 +139,81 @@ class MockSFClient:
         }
 
     def query_all(self, query, include_deleted=False, **kwargs):
+        if "FROM cfg_Subscription_Member__c" in query:
+            return subscription_member_records()
+        return subscription_list_records()
+
+    def restful(self, path, params=None, method="GET", **kwargs):
+        subrequests = kwargs["json"]["compositeRequest"]
+        MockSFClient.composite_requests.append(subrequests)
         return {
-            'records': [
-                OrderedDict([
-                    ('attributes', OrderedDict([
-                        ('type', 'cfg_Subscription__c'),
-                        ('url', '/services/data/v52.0/sobjects/cfg_Subscription__c/jkl456qrs')
-                    ])),
-                    ('Id', 'abc123xyz'),
-                    ('Name', 'Gothamist')
-                ]),
-                OrderedDict([
-                    ('attributes', OrderedDict([
-                        ('type', 'cfg_Subscription__c'),
-                        ('url', '/services/data/v52.0/sobjects/cfg_Subscription__c/def789nop')
-                    ])),
-                    ('Id', 'def456qrs'),
-                    ('Name', 'Radiolab')
-                ])
-            ],
-            'totalSize': 2,
-            'done': True
+            "compositeResponse": [
+                {
+                    "httpHeaders": {},
+                    "referenceId": subrequest["referenceId"],
+                    **MockSFClient.composite_response(subrequest),
+                }
+                for subrequest in subrequests
+            ]
         }
+
+    @staticmethod
+    def composite_response(subrequest):
+        if subrequest["method"] == "POST":
+            return {
+                "body": {"id": "mno345pqr", "success": True, "errors": []},
+                "httpStatusCode": 201,
+            }
+        if subrequest["method"] == "GET":
+            return {"body": {"Id": "abc123xyz"}, "httpStatusCode": 200}
+        return {"body": None, "httpStatusCode": 204}
+
+
+def subscription_member_records():
+    return {
+        'records': [
+            OrderedDict([
+                ('attributes', OrderedDict([
+                    ('type', 'cfg_Subscription_Member__c'),
+                    ('url', '/services/data/v52.0/sobjects/cfg_Subscription_Member__c/stu678vwx')
+                ])),
+                ('Id', 'stu678vwx'),
+                ('cfg_Subscription__c', 'def456qrs')
+            ])
+        ],
+        'totalSize': 1,
+        'done': True
+    }
+
+
+def subscription_list_records():
+    return {
+        'records': [
+            OrderedDict([
+                ('attributes', OrderedDict([
+                    ('type', 'cfg_Subscription__c'),
+                    ('url', '/services/data/v52.0/sobjects/cfg_Subscription__c/jkl456qrs')
+                ])),
+                ('Id', 'abc123xyz'),
+                ('Name', 'Gothamist')
+            ]),
+            OrderedDict([
+                ('attributes', OrderedDict([
+                    ('type', 'cfg_Subscription__c'),
+                    ('url', '/services/data/v52.0/sobjects/cfg_Subscription__c/def789nop')
+                ])),
+                ('Id', 'def456qrs'),
+                ('Name', 'Radiolab')
+            ]),
+            OrderedDict([
+                ('attributes', OrderedDict([
+                    ('type', 'cfg_Subscription__c'),
+                    ('url', '/services/data/v52.0/sobjects/cfg_Subscription__c/ghi012tuv')
+                ])),
+                ('Id', 'ghi012tuv'),
+                ('Name', 'Stations')
+            ])
+        ],
+        'totalSize': 3,
+        'done': True
+    }
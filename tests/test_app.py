@@ -1,15 +1,23 @@
 import json
+import time
 
 import moto
 import pytest
 import requests
 from dotmap import DotMap
-from marketing_cloud_proxy import app, client, mailchimp
+from marketing_cloud_proxy import (
+    app,
+    breakers,
+    capture,
+    client,
+    mailchimp,
+)
 from marketing_cloud_proxy.client import SupportingCastWebhookHandler
 from unittest.mock import MagicMock
 
 from tests.conftest import (
     dynamo_table,
+    mock_everest,
     MockFuelClient,
     MockFuelClientPatchFailure,
     MockSFClient,
@@ -58,15 +66,21 @@ def optinmonster_webhook_response():
     }
     return payload
 
+pytestmark = pytest.mark.usefixtures("signup_dependencies")
+
+
 @pytest.fixture(autouse=True)
-def patch_sf_client(monkeypatch):
-    monkeypatch.setattr(client, "SFClient", MockSFClient)
+def clear_caches():
+    client.MarketingCloudAuthClient.clear()
+    client.SupportingCastPlanCache.clear()
 
 
 def test_healthcheck():
+    breakers.reset()
     with app.app.test_client() as test_client:
         res = test_client.get("/marketing-cloud-proxy/")
-        assert res.status_code == 204
+        assert res.status_code == 200
+        assert json.loads(res.data)["status"] == "ok"
 
 
 def test_get_fails():
@@ -112,7 +126,7 @@ def test_post_with_form():
 def test_post_with_no_existing_contact(monkeypatch):
     with app.app.test_client() as test_client:
         monkeypatch.setattr(
-            MockSFClient, "query_all", MockSFClient.query_all_no_results
+            MockSFClient, "query", MockSFClient.query_all_no_results
         )
         res = test_client.post(
             "/marketing-cloud-proxy/subscribe",
@@ -166,6 +180,184 @@ def test_post_with_multiple_lists():
         assert data["status"] == "subscribed"
 
 
+def test_post_with_multiple_lists_is_one_composite_request(monkeypatch):
+    monkeypatch.setattr(MockSFClient, "composite_requests", [])
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={
+                "email": "test-002@example.com",
+                "source": "test source",
+                "list": "Radiolab++Gothamist++Radiolab",
+            },
+        )
+        data = json.loads(res.data)
+        assert data["status"] == "subscribed"
+
+    [subrequests] = MockSFClient.composite_requests
+    assert [(x["method"], x["url"].split("/")[-1]) for x in subrequests] == [
+        ("PATCH", "stu678vwx"),
+        ("POST", "cfg_Subscription_Member__c"),
+    ]
+    assert subrequests[1]["body"]["cfg_Subscription__c"] == "abc123xyz"
+
+
+def test_post_with_list_names_in_another_case(monkeypatch):
+    monkeypatch.setattr(MockSFClient, "composite_requests", [])
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-002@example.com", "list": "radiolab++GOTHAMIST"},
+        )
+        data = json.loads(res.data)
+        assert data["status"] == "subscribed"
+
+    [subrequests] = MockSFClient.composite_requests
+    assert subrequests[1]["body"]["cfg_Subscription__c"] == "abc123xyz"
+
+
+def duplicate_contact(subrequest, composite_response=MockSFClient.composite_response):
+    if subrequest["url"].endswith("/sobjects/Contact"):
+        return {
+            "body": [{"errorCode": "DUPLICATE_VALUE", "message": "duplicate"}],
+            "httpStatusCode": 400,
+        }
+    return composite_response(subrequest)
+
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_post_resolves_contact_by_external_id(monkeypatch, existing):
+    monkeypatch.setattr(client.settings, "SF_CONTACT_RESOLUTION", "external_id")
+    monkeypatch.setattr(MockSFClient, "composite_requests", [])
+    monkeypatch.setattr(
+        MockSFClient, "query", lambda *args, **kwargs: pytest.fail("no lookup query")
+    )
+    if existing:
+        monkeypatch.setattr(
+            MockSFClient, "composite_response", staticmethod(duplicate_contact)
+        )
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={
+                "email": "Test-Resolve@Example.com",
+                "list": "Gothamist",
+            },
+        )
+        assert json.loads(res.data)["status"] == "subscribed"
+
+    [create, read], [member] = MockSFClient.composite_requests
+    assert create["body"]["nypr_Normalized_Email__c"] == "test-resolve@example.com"
+    assert create["body"]["Email"] == "Test-Resolve@Example.com"
+    assert create["body"]["LastName"] == "NoLastName"
+    assert read["url"].endswith(
+        "/Contact/nypr_Normalized_Email__c/test-resolve%40example.com?fields=Id"
+    )
+    contact_id = "abc123xyz" if existing else "mno345pqr"
+    assert member["body"]["cfg_Contact__c"] == contact_id
+
+
+def stage_logs(output):
+    return [json.loads(line) for line in output.splitlines() if '"_aws"' in line]
+
+
+def test_post_logs_stage_timings(monkeypatch, capsys):
+    with app.app.test_client() as test_client:
+        test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-stages@example.com", "list": "Radiolab"},
+        )
+    [log] = stage_logs(capsys.readouterr().out)
+    assert log["Operation"] == "subscribe"
+    directive, *unlogged = log["_aws"]["CloudWatchMetrics"]
+    assert directive["Dimensions"] == [["Operation"]]
+    stages = [metric["Name"] for metric in directive["Metrics"]]
+    for stage in ["parse", "mailchimp", "sf_login", "contact_lookup", "everest"]:
+        assert f"{stage}_ms" in stages
+    assert log["total_ms"] >= log["members_ms"] > 0
+
+    # Counters are logged by how much they grew since the last line
+    [counts] = [x for x in unlogged if x["Metrics"][0]["Unit"] == "Count"]
+    assert counts["Dimensions"] == [[]]
+    assert {"Name": "validity_cache.miss", "Unit": "Count"} in counts["Metrics"]
+    assert log["validity_cache.miss"] >= 1
+
+    monkeypatch.setattr(client.settings, "STAGE_METRICS_SAMPLE_RATE", 0)
+    with app.app.test_client() as test_client:
+        test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-stages@example.com", "list": "Radiolab"},
+        )
+    assert stage_logs(capsys.readouterr().out) == []
+
+
+def captured_requests(directory):
+    return [
+        json.loads(line)
+        for path in directory.iterdir()
+        for line in path.read_text().splitlines()
+    ]
+
+
+def test_requests_are_captured(monkeypatch, tmp_path):
+    monkeypatch.setattr(client.settings, "TRAFFIC_CAPTURE_DIR", str(tmp_path))
+    monkeypatch.setattr(client.settings, "TRAFFIC_CAPTURE_SAMPLE_RATE", 1)
+    try:
+        with app.app.test_client() as test_client:
+            for body in ("json", "data"):
+                test_client.post(
+                    "/marketing-cloud-proxy/subscribe",
+                    **{body: {"email": "capture@example.org", "list": "Radiolab"}},
+                )
+    finally:
+        capture.reset()
+
+    as_json, as_form = captured_requests(tmp_path)
+    assert as_json["path"] == "/subscribe"
+    assert as_json["status"] == 200
+    assert as_json["duration_ms"] > 0
+    assert as_json["json"] == {
+        "email": capture.pseudonymize_email("capture@example.org"),
+        "list": "Radiolab",
+    }
+    assert as_form["form"] == as_json["json"]
+    [capture_file] = tmp_path.iterdir()
+    assert "capture@example.org" not in capture_file.read_text()
+
+
+def test_post_with_invalid_email_is_quietly_dropped(monkeypatch):
+    monkeypatch.setattr(
+        requests.Session, "get", mock_everest("invalid", "Domain Invalid")
+    )
+    monkeypatch.setattr(MockSFClient, "composite_requests", [])
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-002@example.com", "list": "Radiolab"},
+        )
+        data = json.loads(res.data)
+        assert data["detail"] == "Subscription quietly updated"
+        assert MockSFClient.composite_requests == []
+
+
+@pytest.mark.parametrize("policy,status", [("open", "subscribed"), ("closed", "failure")])
+def test_post_with_slow_everest(monkeypatch, policy, status):
+    monkeypatch.setattr(
+        requests.Session, "get", mock_everest("valid", "Valid", delay=1)
+    )
+    monkeypatch.setattr(client.settings, "EVEREST_TIMEOUT", 0.1)
+    monkeypatch.setattr(client.settings, "EVEREST_FAILURE_POLICY", policy)
+    with app.app.test_client() as test_client:
+        started = time.time()
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-002@example.com", "list": "Radiolab"},
+        )
+        assert time.time() - started < 0.5
+        data = json.loads(res.data)
+        assert data["status"] == status
+
+
 def test_post_form_with_no_email():
     with app.app.test_client() as test_client:
         res = test_client.post(
@@ -213,7 +405,7 @@ def test_unmigrated_mailchimp_list_success(monkeypatch):
     with app.app.test_client() as test_client:
         expected_response = b'{"status":"subscribed","email_address":"YWFxoC9mCv-wnyc@mikehearn.net","list_id":"65dbec786b", "detail": "Email successfully added"}'
         monkeypatch.setattr(
-            requests,
+            requests.Session,
             "post",
             lambda *args, **kwargs: DotMap({"ok": True, "content": expected_response}),
         )
@@ -229,7 +421,7 @@ def test_unmigrated_mailchimp_list_failure(monkeypatch):
     with app.app.test_client() as test_client:
         expected_response = b'{"detail":"test@example.com looks fake or invalid, please enter a real email address.","instance":"d5ebfbe4-a25e-2956-7e72-09574da7a6e2","status":400,"title":"Invalid Resource","type":"https://mailchimp.com/developer/marketing/docs/errors/"}'
         monkeypatch.setattr(
-            requests,
+            requests.Session,
             "post",
             lambda *args, **kwargs: DotMap({"ok": False, "content": expected_response}),
         )
@@ -324,6 +516,68 @@ def test_sc_subscription_update(monkeypatch, mocker, patch_et_client):
         assert json.loads(res.data)["status"] == "success"
 
 
+class RecordingDataExtensionRow:
+    rows = []
+
+    def __init__(self, patch_status, post_status):
+        self.statuses = {"patch": patch_status, "post": post_status}
+
+    def _save(self, method):
+        [row] = self.props
+        self.rows.append((method, row))
+        return DotMap({"results": [{"StatusCode": self.statuses[method]}]})
+
+    def patch(self):
+        return self._save("patch")
+
+    def post(self):
+        return self._save("post")
+
+
+@pytest.mark.parametrize(
+    "patch_status,post_status,methods,status",
+    [
+        ("OK", "OK", ["patch"], "success"),
+        ("Error", "OK", ["patch", "post"], "success"),
+        ("Error", "Error", ["patch", "post"], "failure"),
+    ],
+)
+@moto.mock_dynamodb2
+def test_sc_row_is_updated_then_inserted(
+    monkeypatch, patch_et_client, patch_status, post_status, methods, status
+):
+    dynamo_table()
+    RecordingDataExtensionRow.rows = []
+    monkeypatch.setattr(
+        MockFuelClient,
+        "ET_DataExtension_Row",
+        lambda: RecordingDataExtensionRow(patch_status, post_status),
+    )
+    monkeypatch.setattr(
+        SupportingCastWebhookHandler,
+        "_get_member_info_from_id",
+        lambda *args: {"email": "test@example.com", "first_name": "", "last_name": ""},
+    )
+    monkeypatch.setattr(
+        SupportingCastWebhookHandler,
+        "_get_plan_info_from_id",
+        lambda *args: {"name": "Butterflies"},
+    )
+
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/supporting-cast",
+            json={"subscription": {"status": "active", "plan_id": 1, "member_id": 2}},
+        )
+
+    assert json.loads(res.data)["status"] == status
+    rows = RecordingDataExtensionRow.rows
+    assert [method for method, _ in rows] == methods
+    # creation_date is only ever sent with the insert
+    assert "creation_date" not in rows[0][1]
+    assert all("creation_date" in row for method, row in rows if method == "post")
+    assert rows[0][1]["plan"] == "Butterflies"
+
 
 @moto.mock_dynamodb2
 def test_optin_monster_webhook(monkeypatch, mocker, optinmonster_webhook_response):
@@ -342,7 +596,7 @@ def test_optin_monster_webhook(monkeypatch, mocker, optinmonster_webhook_respons
             data = {"results": {"status": "valid", "name": "valid"}}
             return MockResponse(data, 200)
 
-        monkeypatch.setattr(requests, "get", mock_get)
+        monkeypatch.setattr(requests.Session, "get", mock_get)
         monkeypatch.setattr(client, "FuelSDK", MockFuelClient)
         mocker.spy(client.OptinmonsterWebhookHandler, "subscribe")
 
@@ -360,4 +614,32 @@ def test_list_request_handler():
     with app.app.test_client() as test_client:
         res = test_client.get("/marketing-cloud-proxy/lists")
         data = json.loads(res.data)
-        assert isinstance(data["lists"], list)
\ No newline at end of file
+        assert isinstance(data["lists"], list)
+
+
+def test_list_request_handler_is_conditional():
+    with app.app.test_client() as test_client:
+        res = test_client.get("/marketing-cloud-proxy/lists")
+        assert json.loads(res.data)["lists"] == ["Gothamist", "Radiolab", "Stations"]
+        assert res.headers["Last-Modified"]
+
+        res = test_client.get(
+            "/marketing-cloud-proxy/lists",
+            headers={"If-None-Match": res.headers["ETag"]},
+        )
+        assert res.status_code == 304
+
+
+def test_post_with_unknown_list(monkeypatch):
+    with app.app.test_client() as test_client:
+        monkeypatch.setattr(
+            MockSFClient,
+            "query",
+            lambda *args, **kwargs: pytest.fail("lists are resolved from the catalog"),
+        )
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-002@example.com", "list": "Not A List"},
+        )
+        data = json.loads(res.data)
+        assert data["status"] == "failure"
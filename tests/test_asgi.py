@@ -0,0 +1,99 @@
+import json
+
+import httpx
+import pytest
+from marketing_cloud_proxy import asgi, client, queues, settings
+from starlette.testclient import TestClient
+
+PREFIX = "/marketing-cloud-proxy"
+
+
+@pytest.fixture
+def requests_sent():
+    return []
+
+
+@pytest.fixture
+def test_client(monkeypatch, requests_sent, signup_dependencies):
+    def handle(request):
+        requests_sent.append(request)
+        if request.url.host == "api.supportingcast.fm":
+            if "/plans/" in request.url.path:
+                return httpx.Response(200, json={"name": "Butterflies"})
+            return httpx.Response(
+                200,
+                json={"email": "test@example.com", "first_name": "", "last_name": ""},
+            )
+        if request.method == "POST":
+            return httpx.Response(400, json={"title": "Invalid Resource"})
+        return httpx.Response(200, json={"results": {"status": "valid", "name": "Ok"}})
+
+    monkeypatch.setattr(asgi, "http_transport", httpx.MockTransport(handle))
+    client.SupportingCastPlanCache.clear()
+    with TestClient(asgi.app) as test_client:
+        yield test_client
+
+
+def test_asgi_subscribe(test_client, requests_sent):
+    res = test_client.post(
+        f"{PREFIX}/subscribe", json={"email": "test@example.com", "list": "Radiolab"}
+    )
+    assert res.json() == {
+        "status": "subscribed",
+        "detail": "Subscription successfully updated",
+    }
+    # The Everest check went through the async client
+    [everest] = requests_sent
+    assert everest.url.path.endswith("/test@example.com")
+
+
+def test_asgi_subscribe_form_and_mailchimp_proxy(test_client):
+    res = test_client.post(
+        f"{PREFIX}/subscribe", data={"email": "test@example.com", "list": "12345abcde"}
+    )
+    assert res.status_code == 400
+    assert res.json() == {"title": "Invalid Resource", "additional_detail": "proxied"}
+
+    res = test_client.post(f"{PREFIX}/subscribe", data={"list": "Radiolab"})
+    assert res.json()["detail"] == "No email or list was provided"
+
+
+def test_asgi_lists_are_conditional(test_client):
+    res = test_client.get(f"{PREFIX}/lists")
+    assert set(res.json()["lists"]) == {"Gothamist", "Radiolab", "Stations"}
+    res = test_client.get(
+        f"{PREFIX}/lists", headers={"If-None-Match": res.headers["ETag"]}
+    )
+    assert res.status_code == 304
+
+
+def test_asgi_supporting_cast(test_client, requests_sent, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SUPPORTING_CAST_MODE", "async")
+    monkeypatch.setattr(
+        settings, "SUPPORTING_CAST_QUEUE_URL", f"sqlite:///{tmp_path}/sc.db"
+    )
+    for _ in range(2):
+        res = test_client.post(
+            f"{PREFIX}/supporting-cast",
+            json={"subscription": {"status": "active", "plan_id": 1, "member_id": 2}},
+        )
+        assert res.status_code == 202
+
+    rows = [row for _, row in queues.supporting_cast_queue().receive()]
+    assert [row["plan"] for row in rows] == ["Butterflies", "Butterflies"]
+    # The plan is only fetched once
+    assert len([r for r in requests_sent if "/plans/" in r.url.path]) == 1
+    assert len(requests_sent) == 3
+
+
+def test_asgi_logs_stage_timings(test_client, capsys):
+    test_client.post(
+        f"{PREFIX}/subscribe", json={"email": "test@example.com", "list": "Radiolab"}
+    )
+    [line] = [
+        line for line in capsys.readouterr().out.splitlines() if '"_aws"' in line
+    ]
+    log = json.loads(line)
+    assert log["Operation"] == "subscribe"
+    # Including the stages run on the SDK threads
+    assert {"parse_ms", "sf_login_ms", "members_ms", "total_ms"} <= set(log)
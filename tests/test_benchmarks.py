@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+
+def test_benchmark_replays_every_endpoint(tmp_path):
+    report_path = tmp_path / "report.json"
+    subprocess.run(
+        [
+            sys.executable,
+            "benchmarks/run.py",
+            "--requests",
+            "40",
+            "--concurrency",
+            "4",
+            "--json",
+            str(report_path),
+        ]
+        + [
+            f"--latency={service}=0"
+            for service in ("salesforce", "everest", "mailchimp", "supporting_cast")
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    report = json.loads(report_path.read_text())
+    assert set(report) == {"/subscribe", "/lists", "/optinmonster", "/supporting-cast"}
+    for row in report.values():
+        assert "None" not in row["statuses"]
+        assert "500" not in row["statuses"]
+    assert report["/subscribe"]["outbound_calls"]["salesforce"] > 0
+
+
+def test_replay_sends_every_captured_request(tmp_path):
+    capture_path = tmp_path / "traffic-1.ndjson"
+    capture_path.write_text(
+        "\n".join(
+            json.dumps(request)
+            for request in [
+                {"ts": 1.0, "method": "GET", "path": "/lists", "duration_ms": 5},
+                {
+                    "ts": 1.2,
+                    "method": "POST",
+                    "path": "/subscribe",
+                    "form": {"email": "capture@example.com", "list": "Radiolab"},
+                    "duration_ms": 400,
+                },
+            ]
+        )
+    )
+    report_path = tmp_path / "report.json"
+    subprocess.run(
+        [
+            sys.executable,
+            "benchmarks/replay.py",
+            str(capture_path),
+            "--speed",
+            "0",
+            "--json",
+            str(report_path),
+        ]
+        + [
+            f"--latency={service}=0"
+            for service in ("salesforce", "everest", "mailchimp", "supporting_cast")
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    report = json.loads(report_path.read_text())
+    assert report["requests"] == 2
+    assert report["endpoints"]["/subscribe"]["statuses"] == {"200": 1}
+    assert report["endpoints"]["/subscribe"]["captured_p50_ms"] == 400
@@ -0,0 +1,141 @@
+import json
+
+import pytest
+import requests
+from dotmap import DotMap
+from marketing_cloud_proxy import app, breakers, client, outbound, settings
+from marketing_cloud_proxy.errors import ConfigurationError
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    breakers.reset()
+    yield
+    breakers.reset()
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.acquire()
+        breaker.release(failed=True)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = breakers.CircuitBreaker("everest", failure_threshold=3, reset_timeout=30)
+    for failed in [True, True, False, True, True]:
+        breaker.acquire()
+        breaker.release(failed)
+    assert breaker.state == breakers.CLOSED
+
+    breaker.acquire()
+    breaker.release(failed=True)
+    assert breaker.state == breakers.OPEN
+    with pytest.raises(breakers.CircuitOpenError) as e:
+        breaker.acquire()
+    assert e.value.dependency == "everest"
+    assert 0 < e.value.retry_after <= 30
+
+
+def test_breaker_lets_one_trial_call_through_after_reset_timeout(monkeypatch):
+    breaker = breakers.CircuitBreaker("everest", failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    monkeypatch.setattr(breakers.time, "time", lambda: breaker.opened_at + 31)
+    assert not breaker.is_open()
+
+    breaker.acquire()
+    assert breaker.state == breakers.HALF_OPEN
+    with pytest.raises(breakers.CircuitOpenError):
+        breaker.acquire()
+    breaker.release(failed=True)
+    assert breaker.state == breakers.OPEN
+
+    monkeypatch.setattr(breakers.time, "time", lambda: breaker.opened_at + 31)
+    with breaker.guard():
+        pass
+    assert breaker.state == breakers.CLOSED
+
+
+def test_breaker_sheds_calls_beyond_max_in_flight():
+    breaker = breakers.CircuitBreaker(
+        "everest", failure_threshold=5, reset_timeout=30, max_in_flight=1
+    )
+    with breaker.guard():
+        with pytest.raises(breakers.CircuitOpenError):
+            breaker.acquire()
+    with breaker.guard():
+        pass
+    assert breaker.state == breakers.CLOSED
+
+
+def test_outbound_session_fails_fast_once_breaker_is_open(monkeypatch):
+    sent = []
+
+    def mock_send(self, request, **kwargs):
+        sent.append(request.url)
+        return DotMap({"status_code": 503, "headers": {}, "url": request.url})
+
+    monkeypatch.setattr(outbound.requests.Session, "send", mock_send)
+    session = outbound.session("supporting_cast")
+    for _ in range(settings.BREAKER_FAILURE_THRESHOLD):
+        session.get("https://api.supportingcast.fm/v1/plans/1")
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.get("https://api.supportingcast.fm/v1/plans/1")
+    assert len(sent) == settings.BREAKER_FAILURE_THRESHOLD
+    assert breakers.health()["status"] == "degraded"
+    assert breakers.health()["breakers"]["supporting_cast"]["state"] == "open"
+
+
+def test_healthcheck_shows_breaker_states():
+    trip(breakers.breaker("everest"))
+    with app.app.test_client() as test_client:
+        res = test_client.get("/marketing-cloud-proxy/")
+    data = json.loads(res.data)
+    assert res.status_code == 200
+    assert data["status"] == "degraded"
+    assert data["breakers"]["everest"]["state"] == "open"
+    assert data["breakers"]["salesforce"]["state"] == "closed"
+
+
+def test_signup_is_refused_while_salesforce_is_down(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_FALLBACK", "fail")
+    monkeypatch.setattr(
+        client, "salesforce_client", lambda: pytest.fail("Salesforce isn't called")
+    )
+    trip(breakers.breaker("salesforce"))
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test-breaker@example.com", "list": "Radiolab"},
+        )
+    assert res.status_code == 503
+    assert int(res.headers["Retry-After"]) > 0
+    assert json.loads(res.data)["detail"] == (
+        "salesforce is unavailable; try again later"
+    )
+
+
+def test_queue_fallback_needs_durable_queues(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_FALLBACK", "queue")
+    monkeypatch.setattr(
+        settings,
+        "SIGNUP_QUEUE_URL",
+        "https://sqs.us-east-1.amazonaws.com/123456789012/signups",
+    )
+    monkeypatch.setattr(
+        settings, "SUPPORTING_CAST_QUEUE_URL", "sqlite:////tmp/supporting-cast.db"
+    )
+    with pytest.raises(ConfigurationError, match="SUPPORTING_CAST_QUEUE_URL"):
+        settings.check_queues()
+
+    monkeypatch.setattr(
+        settings, "SUPPORTING_CAST_QUEUE_URL", "sqlite:////var/lib/proxy/sc.db"
+    )
+    settings.check_queues()
+
+    # Open breakers then fail requests rather than queueing them
+    monkeypatch.setattr(settings, "BREAKER_FALLBACK", "fail")
+    monkeypatch.setattr(
+        settings, "SUPPORTING_CAST_QUEUE_URL", "sqlite:////tmp/supporting-cast.db"
+    )
+    settings.check_queues()
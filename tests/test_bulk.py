@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from dotmap import DotMap
+from marketing_cloud_proxy import app, client, settings
+from marketing_cloud_proxy.bulk import BulkImport
+from marketing_cloud_proxy.catalog import subscription_lists
+
+from tests.conftest import MockSFClient
+
+CSV_IMPORT = b"""email,list,source
+Test@Example.com,Radiolab,migration
+test@example.com,Radiolab,migration
+test@example.com,65dbec786b,migration
+not-an-email,Radiolab,migration
+other@example.com,Not A List,migration
+new@example.com,Radiolab,migration
+"""
+
+
+class MockBulkSFClient(MockSFClient):
+    base_url = "https://example.my.salesforce.com/services/data/v52.0/"
+    headers = {"Authorization": "Bearer session"}
+
+    def __init__(self):
+        self.jobs = {}
+        self.uploads = {}
+        self.session = SimpleNamespace(put=self._put, get=self._get)
+
+    def query_all(self, query, include_deleted=False, **kwargs):
+        if "FROM Contact" in query:
+            records = [{"Id": "003existing", "Email": "Test@Example.com"}]
+        elif "FROM cfg_Subscription_Member__c" in query:
+            records = [
+                {
+                    "Id": "a0Bexisting",
+                    "cfg_Contact__c": "003existing",
+                    "cfg_Subscription__c": "def456qrs",
+                }
+            ]
+        else:
+            return super().query_all(query, include_deleted, **kwargs)
+        return {"records": records, "totalSize": len(records), "done": True}
+
+    def restful(self, path, params=None, method="GET", **kwargs):
+        if path == "jobs/ingest":
+            job_id = f"750{len(self.jobs)}"
+            self.jobs[job_id] = kwargs["json"]
+            return {"id": job_id, "state": "Open"}
+        return {"id": path.split("/")[-1], "state": "JobComplete"}
+
+    def _put(self, url, data, headers):
+        rows = csv.reader(io.StringIO(data.read().decode()))
+        self.uploads[url.split("/")[-2]] = list(rows)
+        return DotMap({"raise_for_status": lambda: None})
+
+    def _get(self, url, headers, stream):
+        # Every uploaded Contact was created
+        job_id = url.split("/")[-2]
+        [header, *rows] = self.uploads[job_id]
+        lines = ["sf__Id,sf__Created," + ",".join(header)] + [
+            f"003new{n},true," + ",".join(row) for n, row in enumerate(rows)
+        ]
+        return DotMap(
+            {
+                "raise_for_status": lambda: None,
+                "iter_lines": lambda: (line.encode() for line in lines),
+            }
+        )
+
+
+@pytest.fixture(autouse=True)
+def clear_list_catalog():
+    subscription_lists.clear()
+
+
+def test_bulk_import_validates_dedupes_and_loads():
+    sf = MockBulkSFClient()
+    summary = BulkImport(sf).run(io.BytesIO(CSV_IMPORT), "text/csv")
+
+    assert summary["rows"] == 6
+    assert summary["duplicates"] == 1
+    assert summary["rejected"] == 2
+    assert [x["error"] for x in summary["rejected_rows"]] == [
+        "Email address is invalid",
+        "List does not exist",
+    ]
+    assert summary["existing_contacts"] == 1
+    assert summary["existing_members"] == 1
+
+    # Only the new email gets a Contact
+    [contact_job] = summary["jobs"]["Contact"]
+    assert sf.jobs[contact_job]["operation"] == "insert"
+    assert sf.uploads[contact_job] == [
+        ["Email", "LastName"],
+        ["new@example.com", "NoLastName"],
+    ]
+
+    # The existing member is reactivated, and the rest are created for the
+    # existing and the new Contact
+    insert_job, update_job = summary["jobs"]["cfg_Subscription_Member__c"]
+    assert sf.jobs[insert_job]["operation"] == "insert"
+    assert sf.jobs[update_job]["operation"] == "update"
+    assert [row[:2] for row in sf.uploads[update_job]] == [
+        ["Id", "cfg_Active__c"],
+        ["a0Bexisting", "true"],
+    ]
+    # The Mailchimp list id is imported to its migrated Marketing Cloud list
+    assert sorted(row[:2] for row in sf.uploads[insert_job][1:]) == [
+        ["abc123xyz", "003existing"],
+        ["def456qrs", "003new0"],
+    ]
+
+
+def test_bulk_import_reads_ndjson():
+    rows = b"\n".join(
+        json.dumps({"email": f"test-{n}@example.com", "list": "Gothamist"}).encode()
+        for n in range(3)
+    )
+    summary = BulkImport(MockBulkSFClient(), "partner").run(
+        io.BytesIO(rows), "application/x-ndjson"
+    )
+    assert summary["rows"] == 3
+    assert summary["rejected"] == 0
+
+
+def test_bulk_import_requires_token(monkeypatch):
+    monkeypatch.setattr(settings, "BULK_IMPORT_TOKEN", "secret")
+    monkeypatch.setattr(client, "salesforce_client", MockBulkSFClient)
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/bulk-import",
+            data=CSV_IMPORT,
+            content_type="text/csv",
+        )
+        assert res.status_code == 401
+
+        res = test_client.post(
+            "/marketing-cloud-proxy/bulk-import",
+            data=CSV_IMPORT,
+            content_type="text/csv",
+            headers={"Authorization": "Bearer secret"},
+        )
+        assert res.status_code == 202
+        assert json.loads(res.data)["rows"] == 6
+
+
+def test_bulk_import_times_out_waiting_for_contacts(monkeypatch):
+    monkeypatch.setattr(settings, "BULK_IMPORT_TOKEN", "secret")
+    monkeypatch.setattr(settings, "BULK_IMPORT_CONTACT_WAIT", 0)
+    monkeypatch.setattr(settings, "BULK_IMPORT_POLL_INTERVAL", 0)
+    monkeypatch.setattr(
+        MockBulkSFClient,
+        "restful",
+        lambda self, path, **kwargs: {"id": "7500", "state": "InProgress"},
+    )
+    monkeypatch.setattr(client, "salesforce_client", MockBulkSFClient)
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/bulk-import",
+            data=CSV_IMPORT,
+            content_type="text/csv",
+            headers={"Authorization": "Bearer secret"},
+        )
+    assert res.status_code == 504
+    data = json.loads(res.data)
+    assert data["jobs"] == {"Contact": ["7500"], "cfg_Subscription_Member__c": []}
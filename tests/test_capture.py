@@ -0,0 +1,29 @@
+
+from marketing_cloud_proxy import capture, settings
+
+
+def test_sanitize_keeps_shape_but_not_personal_data():
+    body = {
+        "lead": {
+            "email": "Someone@Example.org",
+            "firstName": "Some",
+            "phone": 5551234,
+        },
+        "lead_options": {"list": "Radiolab++Gothamist"},
+        "emails": ["a@example.org", "b@example.org"],
+    }
+    sanitized = capture.sanitize(body)
+
+    assert sanitized["lead"]["email"] == capture.pseudonymize_email(
+        "someone@example.org"
+    )
+    assert sanitized["lead"]["email"].endswith("@example.com")
+    assert sanitized["lead"]["firstName"] == capture.REDACTED
+    assert sanitized["lead"]["phone"] == 5551234
+    assert sanitized["lead_options"] == {"list": "Radiolab++Gothamist"}
+    assert len(set(sanitized["emails"])) == 2
+
+
+def test_capture_is_off_without_a_directory(monkeypatch):
+    monkeypatch.setattr(settings, "TRAFFIC_CAPTURE_DIR", None)
+    assert not capture.enabled()
@@ -0,0 +1,58 @@
+import time
+
+from marketing_cloud_proxy.catalog import SubscriptionListCatalog
+
+from tests.conftest import MockSFClient
+
+
+class CountingSFClient(MockSFClient):
+    queries = 0
+
+    def query_all(self, query, include_deleted=False, **kwargs):
+        CountingSFClient.queries += 1
+        return super().query_all(query, include_deleted, **kwargs)
+
+
+def test_catalog_serves_stale_copy_while_reloading():
+    CountingSFClient.queries = 0
+    catalog = SubscriptionListCatalog(ttl=60, stale_ttl=600)
+    first = catalog.snapshot(CountingSFClient)
+    assert catalog.snapshot(CountingSFClient) is first
+    assert CountingSFClient.queries == 1
+
+    catalog._loaded_at = time.time() - 120
+    assert catalog.snapshot(CountingSFClient).lists == first.lists
+    for _ in range(50):
+        if CountingSFClient.queries == 2:
+            break
+        time.sleep(0.01)
+    assert CountingSFClient.queries == 2
+
+    # Unchanged contents keep the same ETag and Last-Modified
+    assert catalog.snapshot(CountingSFClient) == first
+
+
+def test_catalog_resolve_reports_unknown_lists():
+    catalog = SubscriptionListCatalog(ttl=60, stale_ttl=600)
+    resolved, unknown = catalog.resolve(["Radiolab", "Nope"], MockSFClient)
+    assert resolved == {"Radiolab": "def456qrs"}
+    assert unknown == ["Nope"]
+
+
+def test_catalog_resolves_list_names_in_any_case():
+    catalog = SubscriptionListCatalog(ttl=60, stale_ttl=600)
+    resolved, unknown = catalog.resolve(
+        ["gothamist", "RADIOLAB", "Stations"], MockSFClient
+    )
+    assert resolved == {
+        "gothamist": "abc123xyz",
+        "RADIOLAB": "def456qrs",
+        "Stations": "ghi012tuv",
+    }
+    assert unknown == []
+    # /lists still shows the names as Salesforce has them
+    assert list(catalog.snapshot(MockSFClient).lists) == [
+        "Gothamist",
+        "Radiolab",
+        "Stations",
+    ]
@@ -0,0 +1,238 @@
+import time
+
+import moto
+import pytest
+import simple_salesforce
+from dotmap import DotMap
+from marketing_cloud_proxy import client, metrics
+from marketing_cloud_proxy.client import (
+    MarketingCloudAuthClient,
+    SalesforceSessionCache,
+    salesforce_client,
+    SupportingCastPlanCache,
+)
+
+from marketing_cloud_proxy.tokens import MarketingCloudTokenStore
+
+from tests.conftest import dynamo_table, MockFuelClient
+
+
+@pytest.fixture
+def sf_login(monkeypatch):
+    logins = []
+
+    def mock_login(**kwargs):
+        logins.append(kwargs)
+        return f"session-{len(logins)}", "example.my.salesforce.com"
+
+    monkeypatch.setattr(simple_salesforce, "SalesforceLogin", mock_login)
+    SalesforceSessionCache.clear()
+    metrics.reset()
+    yield logins
+    SalesforceSessionCache.clear()
+
+
+def test_sf_session_is_reused(sf_login):
+    salesforce_client()
+    sf = salesforce_client()
+    assert len(sf_login) == 1
+    assert sf.session_id == "session-1"
+    assert metrics.counters()["sf_session.miss"] == 1
+    assert metrics.counters()["sf_session.hit"] == 1
+
+
+def test_sf_session_refreshes_before_expiry(sf_login, monkeypatch):
+    salesforce_client()
+    monkeypatch.setattr(
+        SalesforceSessionCache,
+        "expires_at",
+        time.time() + client.settings.SF_SESSION_REFRESH_MARGIN - 1,
+    )
+    sf = salesforce_client()
+    assert len(sf_login) == 2
+    assert sf.session_id == "session-2"
+
+
+def test_sf_session_relogins_once_on_invalid_session(sf_login):
+    sf = salesforce_client()
+    sf._refresh_session()
+    assert sf.session_id == "session-2"
+    assert SalesforceSessionCache.session_id == "session-2"
+
+    # The next rejected session is raised rather than retried
+    with pytest.raises(RuntimeError):
+        sf._refresh_session()
+    assert len(sf_login) == 2
+
+
+def test_sf_session_refresh_reuses_newer_session(sf_login):
+    stale = salesforce_client()
+    salesforce_client()._refresh_session()
+    stale._refresh_session()
+    assert stale.session_id == "session-2"
+    assert len(sf_login) == 2
+
+
+@pytest.fixture
+def fuel_client(monkeypatch):
+    monkeypatch.setattr(client, "FuelSDK", MockFuelClient)
+    MarketingCloudAuthClient.clear()
+    metrics.reset()
+    yield
+    MarketingCloudAuthClient.clear()
+
+
+@moto.mock_dynamodb2
+def test_mc_client_is_reused_until_token_expires(fuel_client, monkeypatch):
+    dynamo_table()
+    first = MarketingCloudAuthClient.instantiate_client()
+    monkeypatch.setattr(
+        MarketingCloudAuthClient,
+        "retrieve_token_data_from_dynamo",
+        lambda: pytest.fail("the cached client's token is still valid"),
+    )
+    assert MarketingCloudAuthClient.instantiate_client() is first
+    assert metrics.counters()["mc_client.hit"] == 1
+
+
+@moto.mock_dynamodb2
+def test_mc_client_takes_token_refreshed_by_another_container(fuel_client):
+    table = dynamo_table()
+    soap_headers = []
+    cached = DotMap(
+        {"soap_client": {"set_options": lambda **kwargs: soap_headers.append(kwargs)}}
+    )
+    MarketingCloudAuthClient._fuel_client = cached
+    MarketingCloudAuthClient._fuel_client_expiration = time.time() + 60
+
+    table.put_item(
+        Item={
+            "KeyName": "MarketingCloudAuth",
+            "Token": "new",
+            "ExpiresAt": int(time.time()) + 1200,
+            "Version": 3,
+        }
+    )
+
+    assert MarketingCloudAuthClient.instantiate_client() is cached
+    assert cached.authToken == "new"
+    assert soap_headers[0]["soapheaders"].getText() == "new"
+
+
+@moto.mock_dynamodb2
+def test_token_store_migrates_two_key_layout():
+    table = dynamo_table()
+    store = MarketingCloudTokenStore(table.name)
+
+    token_data = store.get()
+    assert token_data["oauthToken"] == "1234567"
+    assert token_data["version"] == 1
+    assert table.get_item(Key={"KeyName": "MarketingCloudAuth"})["Item"][
+        "Token"
+    ] == "1234567"
+
+
+@moto.mock_dynamodb2
+def test_token_store_writes_are_versioned(fuel_client):
+    table = dynamo_table()
+    store = MarketingCloudTokenStore(table.name)
+    version = store.get()["version"]
+
+    # The first container to refresh wins; a write based on the same version
+    # is dropped rather than overwriting it
+    assert store.put({"oauthToken": "first", "expiresIn": 1}, version)
+    assert not store.put({"oauthToken": "second", "expiresIn": 2}, version)
+    assert store.get()["oauthToken"] == "first"
+
+    MarketingCloudAuthClient.instantiate_client()
+    token_data = store.get()
+    assert token_data["oauthToken"] == MockFuelClient.authToken
+    assert token_data["version"] == version + 2
+
+
+def valid_token(table, expires_in):
+    table.put_item(
+        Item={
+            "KeyName": "MarketingCloudAuth",
+            "Token": "shared",
+            "ExpiresAt": int(time.time()) + expires_in,
+            "Version": 1,
+        }
+    )
+
+
+@moto.mock_dynamodb2
+def test_mc_token_refresh_waits_for_lease_holder(fuel_client, monkeypatch):
+    table = dynamo_table()
+    valid_token(table, 200)
+    store = MarketingCloudTokenStore(table.name)
+    lease = store.acquire_lease(30)
+    assert lease
+
+    # Another container holds the lease, so the still-valid token is used
+    MarketingCloudAuthClient.instantiate_client()
+    assert "mc_token.refresh" not in metrics.counters()
+    assert metrics.counters()["mc_token.lease_held"] == 1
+
+    store.release_lease(lease)
+    MarketingCloudAuthClient.clear()
+    MarketingCloudAuthClient.instantiate_client()
+    assert metrics.counters()["mc_token.refresh"] == 1
+    assert store.acquire_lease(30)
+
+
+@moto.mock_dynamodb2
+def test_mc_token_refreshed_before_the_lease_is_used(fuel_client, monkeypatch):
+    table = dynamo_table()
+    valid_token(table, 60)
+    acquire_lease = client.token_store.acquire_lease
+
+    def refreshed_first(ttl):
+        # Another container refreshes the token and releases the lease
+        # between this container reading the token and taking the lease
+        table.put_item(
+            Item={
+                "KeyName": "MarketingCloudAuth",
+                "Token": "refreshed",
+                "ExpiresAt": int(time.time()) + 1200,
+                "Version": 2,
+            }
+        )
+        return acquire_lease(ttl)
+
+    monkeypatch.setattr(client.token_store, "acquire_lease", refreshed_first)
+    MarketingCloudAuthClient.instantiate_client()
+    assert "mc_token.refresh" not in metrics.counters()
+    assert metrics.counters()["mc_token.refreshed_elsewhere"] == 1
+    assert MarketingCloudTokenStore(table.name).get()["oauthToken"] == "refreshed"
+    # The lease is released
+    assert client.token_store.acquire_lease(30)
+
+
+@moto.mock_dynamodb2
+def test_mc_token_prewarm(fuel_client):
+    table = dynamo_table()
+    valid_token(table, client.settings.MC_TOKEN_PREWARM_MARGIN + 60)
+    assert not MarketingCloudAuthClient.prewarm()
+
+    valid_token(table, client.settings.MC_TOKEN_PREWARM_MARGIN - 60)
+    assert MarketingCloudAuthClient.prewarm()
+    assert MarketingCloudTokenStore(table.name).get()["oauthToken"] == (
+        MockFuelClient.authToken
+    )
+
+
+def test_sc_plans_are_cached():
+    SupportingCastPlanCache.clear()
+    fetched = []
+
+    def fetch(plan_id):
+        fetched.append(plan_id)
+        return {"id": plan_id, "name": "Butterflies"} if plan_id else {"error": 1}
+
+    assert SupportingCastPlanCache.get(1025, fetch)["name"] == "Butterflies"
+    assert SupportingCastPlanCache.get(1025, fetch)["name"] == "Butterflies"
+    SupportingCastPlanCache.get(0, fetch)
+    SupportingCastPlanCache.get(0, fetch)
+    assert fetched == [1025, 0, 0]
+    SupportingCastPlanCache.clear()
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+from dotmap import DotMap
+from marketing_cloud_proxy import sentry, settings
+
+
+def test_app_import_does_not_load_heavy_dependencies():
+    heavy = ["FuelSDK", "simple_salesforce", "boto3", "jwt"]
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import marketing_cloud_proxy.app; "
+            f"print([m for m in {heavy!r} if m in sys.modules])",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_sentry_only_enables_the_given_integrations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sentry, "sentry_sdk", DotMap({"init": lambda **kwargs: calls.append(kwargs)}))
+    monkeypatch.setattr(settings, "SENTRY_DSN", None)
+    sentry.init("integration")
+    assert calls == []
+
+    monkeypatch.setattr(settings, "SENTRY_DSN", "https://key@sentry.example/1")
+    sentry.init("integration")
+    [kwargs] = calls
+    assert kwargs["integrations"] == ["integration"]
+    assert kwargs["auto_enabling_integrations"] is False
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import moto
+import pytest
+from marketing_cloud_proxy import idempotency, settings
+from marketing_cloud_proxy.idempotency import DynamoIdempotencyStore, signup_key
+
+
+@pytest.fixture(autouse=True)
+def clear_local_store():
+    idempotency.local_store.clear()
+
+
+def test_signup_key_ignores_case_and_list_order():
+    assert signup_key("Test@Example.com", ["A", "B"], "web") == signup_key(
+        "test@example.com", ["B", "A"], "web"
+    )
+    assert signup_key("test@example.com", ["A"], "web") != signup_key(
+        "test@example.com", ["A"], "optinmonster"
+    )
+
+
+def test_concurrent_duplicates_share_one_call():
+    calls = []
+    started = threading.Event()
+
+    def subscribe():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"status": "subscribed"}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        responses = list(
+            pool.map(lambda _: idempotency.single_flight("key", subscribe), range(5))
+        )
+
+    assert len(calls) == 1
+    assert responses == [{"status": "subscribed"}] * 5
+
+
+def test_replays_within_window_and_retries_failures():
+    responses = iter([({"status": "failure"}, 400), {"status": "subscribed"}])
+    calls = []
+
+    def subscribe():
+        calls.append(1)
+        return next(responses)
+
+    assert idempotency.single_flight("key", subscribe) == ({"status": "failure"}, 400)
+    assert idempotency.single_flight("key", subscribe) == {"status": "subscribed"}
+    assert idempotency.single_flight("key", subscribe) == {"status": "subscribed"}
+    assert len(calls) == 2
+
+
+@moto.mock_dynamodb2
+def test_dynamo_lock_is_conditional(monkeypatch):
+    boto3.client("dynamodb", region_name="us-west-2").create_table(
+        TableName="Idempotency",
+        KeySchema=[{"AttributeName": "IdempotencyKey", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "IdempotencyKey", "AttributeType": "S"}
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    store = DynamoIdempotencyStore("Idempotency")
+    assert store.acquire("key", ttl=30)
+    assert not store.acquire("key", ttl=30)
+
+    store.complete("key", {"body": {"status": "subscribed"}, "status": 200}, ttl=30)
+    assert store.get("key") == (
+        "done",
+        {"body": {"status": "subscribed"}, "status": 200},
+    )
+
+    # Another container replays the stored result
+    monkeypatch.setattr(settings, "IDEMPOTENCY_TABLE", "Idempotency")
+    assert idempotency.single_flight("key", lambda: pytest.fail()) == {
+        "status": "subscribed"
+    }
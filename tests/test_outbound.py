@@ -0,0 +1,53 @@
+import json
+
+from dotmap import DotMap
+from marketing_cloud_proxy import metrics, outbound
+
+
+def test_sessions_are_shared_per_integration():
+    assert outbound.session("everest") is outbound.session("everest")
+    assert outbound.session("everest") is not outbound.session("mailchimp")
+
+
+def test_requests_get_integration_timeout_and_latency(monkeypatch, capsys):
+    sent = []
+
+    def mock_send(self, request, **kwargs):
+        sent.append(kwargs)
+        return DotMap({"status_code": 200, "headers": {}, "url": request.url})
+
+    monkeypatch.setattr(outbound.requests.Session, "send", mock_send)
+    metrics.reset()
+
+    outbound.session("supporting_cast").get("https://api.supportingcast.fm/v1/plans/1")
+    outbound.session("supporting_cast").get(
+        "https://api.supportingcast.fm/v1/plans/2", timeout=1
+    )
+
+    assert [x["timeout"] for x in sent] == [outbound.TIMEOUTS["supporting_cast"], 1]
+    assert metrics.histograms()["outbound.latency.api.supportingcast.fm"]["count"] == 2
+
+    # The latencies are logged as EMF values once
+    metrics.flush()
+    metrics.flush()
+    [line] = capsys.readouterr().out.splitlines()
+    log = json.loads(line)
+    assert len(log["outbound.latency.api.supportingcast.fm"]) == 2
+    [latencies] = [
+        directive
+        for directive in log["_aws"]["CloudWatchMetrics"]
+        if directive["Metrics"][0]["Unit"] == "Milliseconds"
+    ]
+    assert latencies["Dimensions"] == [[]]
+
+
+def test_retry_backoff_is_jittered():
+    retry = outbound.JitteredRetry(total=5, backoff_factor=1).increment().increment()
+    assert all(0 <= retry.get_backoff_time() <= 2 for _ in range(20))
+
+
+def test_retries_are_counted_per_host():
+    metrics.reset()
+    pool = DotMap({"host": "api.everest.validity.com"})
+    outbound.JitteredRetry(total=2).increment("GET", "/", _pool=pool)
+    assert metrics.counters()["outbound.retry.api.everest.validity.com"] == 1
@@ -0,0 +1,41 @@
+import pytest
+from marketing_cloud_proxy import metrics, queries
+
+
+class RecordingSFClient:
+    def __init__(self, records):
+        self.records = records
+        self.soql = []
+
+    def query(self, soql):
+        self.soql.append(soql)
+        return {"records": self.records[:1]}
+
+
+def test_contact_by_email_quotes_the_email():
+    client = RecordingSFClient([{"Id": "abc123xyz"}])
+    metrics.reset()
+
+    contact = queries.CONTACT_BY_EMAIL.first(client, email="o'brien{0}@example.com")
+    assert contact == {"Id": "abc123xyz"}
+    assert client.soql == [
+        "SELECT Id FROM Contact WHERE Email = 'o\\'brien{0}@example.com' "
+        "ORDER BY LastModifiedDate DESC, Id DESC LIMIT 1"
+    ]
+    assert "soql.contact_by_email" in metrics.histograms()
+
+
+def test_first_without_records():
+    assert queries.CONTACT_BY_EMAIL.first(RecordingSFClient([]), email="a@b.c") is None
+
+
+def test_prepared_query_checks_params():
+    with pytest.raises(TypeError):
+        queries.MEMBERS_BY_CONTACT_AND_LISTS.render(contact_id="abc123xyz")
+
+    assert queries.MEMBERS_BY_CONTACT_AND_LISTS.render(
+        contact_id="abc123xyz", list_ids=["def456qrs", "ghi789tuv"]
+    ).endswith(
+        "WHERE cfg_Contact__c = 'abc123xyz' AND cfg_Subscription__c IN "
+        "('def456qrs','ghi789tuv') ORDER BY LastModifiedDate, Id ASC"
+    )
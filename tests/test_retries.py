@@ -0,0 +1,264 @@
+import json
+
+import pytest
+import requests
+from dotmap import DotMap
+from marketing_cloud_proxy import (
+    app,
+    breakers,
+    client,
+    queues,
+    retries,
+    settings,
+    worker,
+)
+from marketing_cloud_proxy.errors import ConfigurationError
+from marketing_cloud_proxy.subscriptions import SubrequestError
+
+from tests.conftest import MockFuelClient, MockSFClient
+
+GOTHAMIST, RADIOLAB, STATIONS = "abc123xyz", "def456qrs", "ghi012tuv"
+
+composite_response = MockSFClient.composite_response
+
+
+@pytest.fixture(autouse=True)
+def retry_queues(monkeypatch, tmp_path, signup_dependencies):
+    monkeypatch.setattr(worker, "salesforce_client", MockSFClient)
+    monkeypatch.setattr(settings, "WRITE_RETRY_QUEUE_URL", f"sqlite:///{tmp_path}/r.db")
+    monkeypatch.setattr(
+        settings, "WRITE_RETRY_DEAD_LETTER_URL", f"sqlite:///{tmp_path}/dl.db"
+    )
+    # Retries are due straight away
+    monkeypatch.setattr(settings, "WRITE_RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(MockSFClient, "composite_requests", [])
+
+
+def failing_lists(monkeypatch, list_ids, error_code="UNABLE_TO_LOCK_ROW"):
+    def failing_composite_response(subrequest):
+        if subrequest["referenceId"][len("member_"):] in list_ids:
+            return {
+                "body": [{"errorCode": error_code, "message": "failed"}],
+                "httpStatusCode": 400,
+            }
+        return composite_response(subrequest)
+
+    monkeypatch.setattr(
+        MockSFClient, "composite_response", staticmethod(failing_composite_response)
+    )
+
+
+def test_backoff_doubles_up_to_the_max_delay(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_RETRY_BASE_DELAY", 30)
+    monkeypatch.setattr(settings, "WRITE_RETRY_MAX_DELAY", 900)
+    assert 15 <= retries.backoff(1) <= 30
+    assert 60 <= retries.backoff(3) <= 120
+    assert 450 <= retries.backoff(10) <= 900
+
+
+def test_only_failed_subscription_members_are_retried(monkeypatch):
+    failing_lists(monkeypatch, {STATIONS})
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "retry@example.com", "list": "Gothamist++Stations"},
+        )
+    assert res.status_code == 202
+    assert json.loads(res.data)["detail"] == "Subscription will be retried"
+
+    [(_, message)] = queues.write_retry_queue().receive()
+    assert message["kind"] == retries.SUBSCRIPTION_MEMBERS
+    assert message["list_ids"] == [STATIONS]
+    assert message["attempt"] == 1
+    assert "UNABLE_TO_LOCK_ROW" in message["error"]
+
+    # The retry only writes the failed list's member
+    MockSFClient.composite_requests.clear()
+    failing_lists(monkeypatch, set())
+    assert worker.retry_write(message)
+    [[subrequest]] = MockSFClient.composite_requests
+    assert subrequest["body"]["cfg_Subscription__c"] == STATIONS
+
+
+def test_permanent_subscription_member_errors_are_not_retried(monkeypatch):
+    failing_lists(monkeypatch, {STATIONS}, "FIELD_CUSTOM_VALIDATION_EXCEPTION")
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "retry@example.com", "list": "Gothamist++Stations"},
+        )
+    assert res.status_code == 400
+    assert queues.write_retry_queue().receive() == []
+
+
+@pytest.mark.parametrize(
+    "error, transient",
+    [
+        (requests.exceptions.ReadTimeout("timed out"), True),
+        (SubrequestError(503, [{"errorCode": "SERVER_UNAVAILABLE"}]), True),
+        (SubrequestError(429, [{"errorCode": "REQUEST_LIMIT_EXCEEDED"}]), True),
+        (SubrequestError(400, [{"errorCode": "UNABLE_TO_LOCK_ROW"}]), True),
+        (SubrequestError(400, [{"errorCode": "INVALID_FIELD"}]), False),
+        (SubrequestError(404, [{"errorCode": "ENTITY_IS_DELETED"}]), False),
+    ],
+)
+def test_only_transient_errors_are_retried(error, transient):
+    assert retries.is_transient(error) is transient
+
+
+def test_failed_retries_back_off_then_dead_letter(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_RETRY_MAX_ATTEMPTS", 2)
+    failing_lists(monkeypatch, {STATIONS})
+    retries.schedule(
+        retries.SUBSCRIPTION_MEMBERS,
+        {"contact_id": "abc123xyz", "list_ids": [STATIONS], "source": "test"},
+        "locked",
+    )
+
+    assert worker.retry_handler({}, None) == {"succeeded": 0, "rescheduled": 2}
+    assert queues.write_retry_queue().receive() == []
+    [(_, dead_letter)] = queues.dead_letter_queue().receive()
+    assert dead_letter["attempt"] == 3
+    assert dead_letter["list_ids"] == [STATIONS]
+
+
+def test_sqs_retries_that_raise_are_rescheduled(monkeypatch):
+    def raise_error(*args):
+        raise requests.exceptions.ConnectionError("Salesforce is down")
+
+    monkeypatch.setattr(worker, "subscribe_contact_to_lists", raise_error)
+    message = {
+        "kind": retries.SUBSCRIPTION_MEMBERS,
+        "attempt": 1,
+        "error": "locked",
+        "contact_id": "abc123xyz",
+        "list_ids": [GOTHAMIST, RADIOLAB],
+        "source": "test",
+    }
+    event = {"Records": [{"messageId": "1", "body": json.dumps(message)}]}
+
+    assert worker.retry_handler(event, None) == {"batchItemFailures": []}
+    [(_, rescheduled)] = queues.write_retry_queue().receive()
+    assert rescheduled["attempt"] == 2
+    assert rescheduled["list_ids"] == [GOTHAMIST, RADIOLAB]
+    assert "Salesforce is down" in rescheduled["error"]
+
+
+def test_sqs_retries_wait_out_an_open_breaker(monkeypatch):
+    monkeypatch.setattr(
+        worker,
+        "subscribe_contact_to_lists",
+        lambda *args: pytest.fail("Salesforce isn't called"),
+    )
+    salesforce = breakers.breaker("salesforce")
+    message = {
+        "kind": retries.SUBSCRIPTION_MEMBERS,
+        "attempt": 3,
+        "error": "locked",
+        "contact_id": "abc123xyz",
+        "list_ids": [GOTHAMIST],
+        "source": "test",
+    }
+    event = {"Records": [{"messageId": "1", "body": json.dumps(message)}]}
+    try:
+        for _ in range(salesforce.failure_threshold):
+            salesforce.acquire()
+            salesforce.release(failed=True)
+
+        assert worker.retry_handler(event, None) == {"batchItemFailures": []}
+    finally:
+        breakers.reset()
+
+    # Put back on the queue without using up an attempt
+    [(_, postponed)] = queues.write_retry_queue().receive()
+    assert postponed == message
+
+
+class MockFuelClientRowFailure(MockFuelClient):
+    patch_response = DotMap({"results": [{"StatusCode": "Error"}]})
+    post_response = DotMap({"results": [{"StatusCode": "Error"}]})
+
+
+def test_failed_data_extension_rows_are_retried(monkeypatch):
+    handler = client.SupportingCastWebhookHandler.from_webhook_info(
+        {
+            "email_address": "member@example.com",
+            "first_name": "Test",
+            "last_name": "Member",
+            "plan": "Member",
+            "plan_status": "active",
+        }
+    )
+    handler.de_row = MockFuelClientRowFailure.ET_DataExtension_Row()
+    assert handler.subscribe()[1] == 202
+
+    [(_, message)] = queues.write_retry_queue().receive()
+    assert message["kind"] == retries.DE_ROWS
+    [row] = message["rows"]
+    assert row["email_address"] == "member@example.com"
+
+    written = []
+    monkeypatch.setattr(
+        worker,
+        "write_supporting_cast_rows",
+        lambda rows: written.extend(rows) or [None] * len(rows),
+    )
+    assert worker.retry_write(message)
+    assert written == [row]
+
+
+class UnreachableDataExtensionRow:
+    def patch(self):
+        raise requests.exceptions.ReadTimeout("Marketing Cloud timed out")
+
+
+@pytest.mark.parametrize("breaker_open", [False, True])
+def test_data_extension_rows_that_could_not_be_sent_are_retried(
+    monkeypatch, breaker_open
+):
+    monkeypatch.setattr(settings, "SUPPORTING_CAST_MODE", "sync")
+    monkeypatch.setattr(settings, "BREAKER_FALLBACK", "fail")
+    monkeypatch.setattr(
+        client.MarketingCloudAuthClient, "instantiate_client", lambda: None
+    )
+    monkeypatch.setattr(
+        client,
+        "create_supporting_cast_row_stub",
+        lambda auth_client: UnreachableDataExtensionRow(),
+    )
+    handler = client.SupportingCastWebhookHandler.from_webhook_info(
+        {
+            "email_address": "member@example.com",
+            "first_name": "Test",
+            "last_name": "Member",
+            "plan": "Member",
+            "plan_status": "active",
+        }
+    )
+    marketing_cloud = breakers.breaker("marketing_cloud")
+    try:
+        if breaker_open:
+            for _ in range(marketing_cloud.failure_threshold):
+                marketing_cloud.acquire()
+                marketing_cloud.release(failed=True)
+
+        assert handler.save()[1] == 202
+        # The breaker still counts the failed write
+        if not breaker_open:
+            assert marketing_cloud.failures == 1
+    finally:
+        breakers.reset()
+
+    [(_, message)] = queues.write_retry_queue().receive()
+    assert message["kind"] == retries.DE_ROWS
+    [row] = message["rows"]
+    assert row["email_address"] == "member@example.com"
+
+
+def test_retry_queue_needs_a_dead_letter_queue(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_RETRY_DEAD_LETTER_URL", None)
+    with pytest.raises(ConfigurationError, match="WRITE_RETRY_DEAD_LETTER_URL"):
+        settings.check_queues()
+
+    monkeypatch.setattr(settings, "WRITE_RETRY_QUEUE_URL", None)
+    settings.check_queues()
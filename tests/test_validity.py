@@ -0,0 +1,86 @@
+import json
+import time
+
+import boto3
+import moto
+import pytest
+import requests
+from dotmap import DotMap
+from marketing_cloud_proxy import metrics, validity
+from marketing_cloud_proxy.validity import EmailVerdictCache
+
+
+@pytest.fixture
+def everest(monkeypatch):
+    calls = []
+
+    def mock_get(session, url, *args, **kwargs):
+        calls.append(url)
+        status = "invalid" if "bad" in url else "valid"
+        return DotMap({"json": lambda: {"results": {"status": status, "name": status}}})
+
+    monkeypatch.setattr(requests.Session, "get", mock_get)
+    monkeypatch.setattr(
+        validity, "verdict_cache", EmailVerdictCache(10, valid_ttl=60, invalid_ttl=5)
+    )
+    metrics.reset()
+    return calls
+
+
+def test_verdicts_are_cached_on_normalized_email(everest):
+    assert validity.check_email_validity("Test@Example.com") == ("valid", "valid")
+    assert validity.check_email_validity(" test@example.com") == ("valid", "valid")
+    assert len(everest) == 1
+    assert metrics.counters()["everest.call"] == 1
+    assert metrics.counters()["validity_cache.hit.memory"] == 1
+
+
+def test_cache_counters_are_logged_once(everest, capsys):
+    validity.check_email_validity("test@example.com")
+    validity.check_email_validity("test@example.com")
+    metrics.flush()
+    metrics.flush()
+
+    [line] = capsys.readouterr().out.splitlines()
+    log = json.loads(line)
+    assert log["everest.call"] == 1
+    assert log["validity_cache.miss"] == 1
+    assert log["validity_cache.hit.memory"] == 1
+
+
+def test_invalid_verdicts_expire_sooner(everest, monkeypatch):
+    validity.check_email_validity("bad@example.com")
+    validity.check_email_validity("good@example.com")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    validity.check_email_validity("bad@example.com")
+    validity.check_email_validity("good@example.com")
+    assert len(everest) == 3
+
+
+def test_failed_checks_are_not_cached(everest, monkeypatch):
+    def mock_get(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("down")
+
+    monkeypatch.setattr(requests.Session, "get", mock_get)
+    assert validity.check_email_validity("test@example.com") is None
+    assert validity.verdict_cache.get("test@example.com") is None
+
+
+@moto.mock_dynamodb2
+def test_verdicts_are_shared_through_dynamo(everest):
+    boto3.client("dynamodb", region_name="us-west-2").create_table(
+        TableName="EmailVerdicts",
+        KeySchema=[{"AttributeName": "EmailHash", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "EmailHash", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    validity.verdict_cache.table_name = "EmailVerdicts"
+    validity.check_email_validity("test@example.com")
+
+    # A fresh container finds the verdict in DynamoDB
+    validity.verdict_cache.clear()
+    assert validity.check_email_validity("test@example.com") == ("valid", "valid")
+    assert len(everest) == 1
+    assert metrics.counters()["validity_cache.hit.dynamodb"] == 1
@@ -0,0 +1,286 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+from dotmap import DotMap
+from marketing_cloud_proxy import app, breakers, client, queues, settings, worker
+
+
+@pytest.fixture(autouse=True)
+def signup_queue(monkeypatch, tmp_path, signup_dependencies):
+    monkeypatch.setattr(settings, "SUBSCRIBE_MODE", "async")
+    monkeypatch.setattr(settings, "SIGNUP_QUEUE_URL", f"sqlite:///{tmp_path}/q.db")
+    return queues.signup_queue()
+
+
+def test_async_subscribe_is_accepted_and_queued(signup_queue, monkeypatch):
+    monkeypatch.setattr(
+        client.EmailSignupRequestHandler,
+        "subscribe",
+        lambda self: pytest.fail("signups are processed by the worker"),
+    )
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test@example.com", "list": "Radiolab", "source": "test"},
+        )
+        assert res.status_code == 202
+        assert json.loads(res.data)["status"] == "accepted"
+
+    [(_, payload)] = signup_queue.receive()
+    assert payload["email"] == "test@example.com"
+    assert payload["lists"] == ["Radiolab"]
+
+
+def test_worker_drains_queue(signup_queue, monkeypatch):
+    processed = []
+    monkeypatch.setattr(
+        client.EmailSignupRequestHandler,
+        "subscribe",
+        lambda self: processed.append(self.to_payload()) or {"status": "subscribed"},
+    )
+    for n in range(15):
+        signup_queue.send({"email": f"test-{n}@example.com", "lists": ["Radiolab"]})
+
+    assert worker.handler({}, None) == {"processed": 15}
+    assert len(processed) == 15
+    assert signup_queue.receive() == []
+
+
+def test_signup_is_queued_while_salesforce_is_down(signup_queue, monkeypatch):
+    monkeypatch.setattr(settings, "SUBSCRIBE_MODE", "sync")
+    monkeypatch.setattr(settings, "BREAKER_FALLBACK", "queue")
+    salesforce = breakers.breaker("salesforce")
+    try:
+        for _ in range(salesforce.failure_threshold):
+            salesforce.acquire()
+            salesforce.release(failed=True)
+
+        with app.app.test_client() as test_client:
+            res = test_client.post(
+                "/marketing-cloud-proxy/subscribe",
+                json={"email": "test@example.com", "list": "Radiolab"},
+            )
+        assert res.status_code == 202
+        # The worker leaves it on the queue until Salesforce is back
+        assert worker.handler({}, None) == {"processed": 0}
+    finally:
+        breakers.reset()
+
+    [(_, payload)] = signup_queue.receive()
+    assert payload["email"] == "test@example.com"
+
+
+def import_settings(**environ):
+    """Imports the settings in a new process with the environment changed,
+    returning the process' stderr"""
+    env = {**os.environ, **environ}
+    for name in [name for name, value in env.items() if value is None]:
+        del env[name]
+    return subprocess.run(
+        [sys.executable, "-c", "import marketing_cloud_proxy.settings"],
+        env=env,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+
+def test_async_mode_needs_a_durable_signup_queue():
+    for url in [None, "sqlite:////tmp/marketing-cloud-proxy-signups.db"]:
+        stderr = import_settings(SUBSCRIBE_MODE="async", SIGNUP_QUEUE_URL=url)
+        assert "SUBSCRIBE_MODE=async needs SIGNUP_QUEUE_URL" in stderr
+
+    stderr = import_settings(
+        SUBSCRIBE_MODE="async",
+        SIGNUP_QUEUE_URL="https://sqs.us-east-1.amazonaws.com/123456789012/signups",
+    )
+    assert stderr == ""
+
+
+def test_worker_reports_sqs_batch_failures(monkeypatch):
+    def subscribe(self):
+        if self.email == "broken@example.com":
+            raise ConnectionError("Salesforce is down")
+        return {"status": "subscribed"}
+
+    monkeypatch.setattr(client.EmailSignupRequestHandler, "subscribe", subscribe)
+    event = {
+        "Records": [
+            {
+                "messageId": email,
+                "body": json.dumps({"email": email, "lists": ["Radiolab"]}),
+            }
+            for email in ["test@example.com", "broken@example.com"]
+        ]
+    }
+    assert worker.handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "broken@example.com"}]
+    }
+
+
+def test_queued_signup_subscribes_to_salesforce():
+    response = worker.process_signup(
+        {"email": "test@example.com", "lists": ["Radiolab"], "source": "test"}
+    )
+    assert response["status"] == "subscribed"
+
+
+def test_async_subscribe_rejects_unknown_lists(signup_queue):
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/subscribe",
+            json={"email": "test@example.com", "list": "Radiolab++Not A List"},
+        )
+        assert res.status_code == 400
+        assert json.loads(res.data)["detail"] == (
+            "User could not be subscribed; list does not exist"
+        )
+    assert signup_queue.receive() == []
+
+
+@pytest.mark.parametrize(
+    "response,retried",
+    [
+        (client.failure_response("list does not exist"), False),
+        (client.temporary_failure_response("Email could not be verified"), True),
+        (({"status": "failure", "detail": "already being processed"}, 409), True),
+    ],
+)
+def test_worker_only_drops_invalid_signups(signup_queue, monkeypatch, response, retried):
+    monkeypatch.setattr(
+        client.EmailSignupRequestHandler, "subscribe", lambda self: response
+    )
+    signup_queue.send({"email": "test@example.com", "lists": ["Radiolab"]})
+
+    assert worker.handler({}, None) == {"processed": 0 if retried else 1}
+    # A signup to retry is left on the queue, to be received again once its
+    # visibility timeout passes
+    with sqlite3.connect(signup_queue.path) as db:
+        [(queued,)] = db.execute("SELECT COUNT(*) FROM messages").fetchall()
+    assert queued == (1 if retried else 0)
+
+
+class BatchDataExtensionRow:
+    """Saves rows for existing_emails on Update, and rows for any email but
+    failing_emails on Create"""
+
+    def __init__(self, existing_emails=(), failing_emails=()):
+        self.existing_emails = existing_emails
+        self.failing_emails = failing_emails
+        self.calls = []
+
+    def _save(self, method, saved):
+        self.calls.append((method, list(self.props)))
+        return DotMap(
+            {
+                "results": [
+                    {"StatusCode": "OK" if saved(row["email_address"]) else "Error"}
+                    for row in self.props
+                ]
+            }
+        )
+
+    def patch(self):
+        return self._save("patch", lambda email: email in self.existing_emails)
+
+    def post(self):
+        return self._save("post", lambda email: email not in self.failing_emails)
+
+
+def sc_row(email):
+    return {"email_address": email, "plan": "Butterflies", "creation_date": "now"}
+
+
+@pytest.fixture
+def sc_queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        settings, "SUPPORTING_CAST_QUEUE_URL", f"sqlite:///{tmp_path}/sc.db"
+    )
+    monkeypatch.setattr(settings, "DE_BATCH_WINDOW", 0)
+    monkeypatch.setattr(client.MarketingCloudAuthClient, "instantiate_client", dict)
+    return queues.supporting_cast_queue()
+
+
+def test_async_supporting_cast_webhook_is_queued(sc_queue, monkeypatch):
+    monkeypatch.setattr(settings, "SUPPORTING_CAST_MODE", "async")
+    monkeypatch.setattr(
+        client.SupportingCastWebhookHandler,
+        "_get_member_info_from_id",
+        lambda *args: {"email": "test@example.com", "first_name": "", "last_name": ""},
+    )
+    monkeypatch.setattr(
+        client.SupportingCastWebhookHandler,
+        "_get_plan_info_from_id",
+        lambda *args: {"name": "Butterflies"},
+    )
+    with app.app.test_client() as test_client:
+        res = test_client.post(
+            "/marketing-cloud-proxy/supporting-cast",
+            json={"subscription": {"status": "active", "plan_id": 3, "member_id": 4}},
+        )
+        assert res.status_code == 202
+
+    [(_, row)] = sc_queue.receive()
+    assert row["email_address"] == "test@example.com"
+    assert row["plan"] == "Butterflies"
+
+
+def test_supporting_cast_worker_writes_batches(sc_queue, monkeypatch):
+    de_row = BatchDataExtensionRow(
+        existing_emails=["old@example.com"], failing_emails=["broken@example.com"]
+    )
+    monkeypatch.setattr(worker, "create_supporting_cast_row_stub", lambda _: de_row)
+    for email in ["old@example.com", "new@example.com", "broken@example.com"]:
+        sc_queue.send(sc_row(email))
+
+    assert worker.supporting_cast_handler({}, None) == {"written": 2, "failed": 1}
+
+    # One Update for the batch, then one Create with creation_date for the
+    # rows that didn't exist
+    assert [method for method, _ in de_row.calls] == ["patch", "post"]
+    [(_, updated), (_, inserted)] = de_row.calls
+    assert len(updated) == 3
+    assert all("creation_date" not in row for row in updated)
+    assert [row["email_address"] for row in inserted] == [
+        "new@example.com",
+        "broken@example.com",
+    ]
+
+    # The failed row is left on the queue to be retried
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + sc_queue.visibility_timeout)
+    [(_, row)] = sc_queue.receive()
+    assert row["email_address"] == "broken@example.com"
+
+
+def test_async_supporting_cast_needs_a_durable_queue():
+    for url in [None, "sqlite:////tmp/marketing-cloud-proxy-supporting-cast.db"]:
+        stderr = import_settings(
+            SUPPORTING_CAST_MODE="async", SUPPORTING_CAST_QUEUE_URL=url
+        )
+        assert "SUPPORTING_CAST_MODE=async needs SUPPORTING_CAST_QUEUE_URL" in stderr
+
+    stderr = import_settings(
+        SUPPORTING_CAST_MODE="async",
+        SUPPORTING_CAST_QUEUE_URL="https://sqs.us-east-1.amazonaws.com/123456789012/sc",
+    )
+    assert stderr == ""
+
+
+def test_supporting_cast_worker_reports_sqs_batch_failures(monkeypatch):
+    de_row = BatchDataExtensionRow(failing_emails=["broken@example.com"])
+    monkeypatch.setattr(worker, "create_supporting_cast_row_stub", lambda _: de_row)
+    monkeypatch.setattr(client.MarketingCloudAuthClient, "instantiate_client", dict)
+    event = {
+        "Records": [
+            {"messageId": email, "body": json.dumps(sc_row(email))}
+            for email in ["test@example.com", "broken@example.com"]
+        ]
+    }
+    assert worker.supporting_cast_handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "broken@example.com"}]
+    }
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+import suds.client
+from dotmap import DotMap
+from marketing_cloud_proxy import wsdl
+
+WSDL = b"""<?xml version="1.0" encoding="UTF-8"?>
+<definitions name="Partner" targetNamespace="http://exacttarget.com/wsdl/partnerAPI"
+    xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:tns="http://exacttarget.com/wsdl/partnerAPI"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <types>
+    <xsd:schema targetNamespace="http://exacttarget.com/wsdl/partnerAPI"
+        elementFormDefault="qualified">
+      <xsd:element name="VersionInfoRequestMsg" type="xsd:string"/>
+      <xsd:element name="VersionInfoResponseMsg" type="xsd:string"/>
+    </xsd:schema>
+  </types>
+  <message name="VersionInfoRequest">
+    <part name="parameters" element="tns:VersionInfoRequestMsg"/>
+  </message>
+  <message name="VersionInfoResponse">
+    <part name="parameters" element="tns:VersionInfoResponseMsg"/>
+  </message>
+  <portType name="Soap">
+    <operation name="VersionInfo">
+      <input message="tns:VersionInfoRequest"/>
+      <output message="tns:VersionInfoResponse"/>
+    </operation>
+  </portType>
+  <binding name="SoapBinding" type="tns:Soap">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="VersionInfo">
+      <soap:operation soapAction="VersionInfo"/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="PartnerAPI">
+    <port name="Soap" binding="tns:SoapBinding">
+      <soap:address location="https://webservice.exacttarget.com/Service.asmx"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+
+class MockWSDLServer:
+    def __init__(self, content, headers):
+        self.content = content
+        self.headers = headers
+        self.gets = 0
+
+    def get(self, url, **kwargs):
+        self.gets += 1
+        return DotMap(
+            content=self.content,
+            headers=self.headers,
+            raise_for_status=lambda: None,
+        )
+
+    def head(self, url, **kwargs):
+        return DotMap(headers=self.headers, raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(wsdl, "_installed", None)
+    return str(tmp_path)
+
+
+def test_snapshot_is_loaded_instead_of_parsing_the_wsdl(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(wsdl, "requests", MockWSDLServer(WSDL, {}))
+    wsdl.build_snapshot("https://example.com/etframework.wsdl", snapshot_dir)
+
+    location = wsdl.local_location(snapshot_dir)
+    assert location == os.path.join(snapshot_dir, wsdl.WSDL_FILE)
+    # Only the pickled definition can be loaded now
+    with open(location, "w") as f:
+        f.write("not a WSDL")
+
+    assert wsdl.install_snapshot(snapshot_dir)
+    # The way FuelSDK creates its SOAP client
+    client = suds.client.Client("file:///" + location, faults=False, cachingpolicy=1)
+    assert client.wsdl.services[0].name == "PartnerAPI"
+
+
+def test_without_snapshot_wsdl_is_downloaded(snapshot_dir):
+    assert not wsdl.install_snapshot(snapshot_dir)
+    assert wsdl.local_location(snapshot_dir) == (
+        wsdl.settings.MC_WSDL_FILE_LOCAL_LOCATION
+    )
+
+
+def test_stale_snapshot_is_detected(snapshot_dir, monkeypatch):
+    server = MockWSDLServer(WSDL, {"Last-Modified": "Tue, 01 Aug 2023 00:00:00 GMT"})
+    monkeypatch.setattr(wsdl, "requests", server)
+    wsdl.build_snapshot("https://example.com/etframework.wsdl", snapshot_dir)
+    assert wsdl.check_snapshot(snapshot_dir)
+
+    server.headers = {"Last-Modified": "Wed, 02 Aug 2023 00:00:00 GMT"}
+    assert not wsdl.check_snapshot(snapshot_dir)
+
+    # Without validators, the WSDL itself is compared
+    server.headers = {}
+    server.content = WSDL.replace(b"VersionInfo", b"VersionInformation")
+    assert not wsdl.check_snapshot(snapshot_dir)
+    assert server.gets == 2